@@ -1,6 +1,5 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from fastapi.responses import StreamingResponse
-import io
+﻿from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List
 from backend import models
@@ -9,7 +8,11 @@ import os
 import datetime
 from backend.database import get_db
 from backend.dependencies import get_current_user
+from backend import repository
 from backend.schemas.consultations import ConsultationCreate, ConsultationResponse
+from backend.schemas.patient import ConsultationItemSpanish
+from backend.schemas.batch import BatchIdsRequest
+from backend.services.render_pool import render_pool, RenderTimeout, prerender_enabled
 from sqlalchemy import desc
 
 router = APIRouter(
@@ -56,19 +59,14 @@ def check_tracking_flag():
 def create_consultation(
     patient_id: int,
     consultation: ConsultationCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     check_feature_flag()
 
     # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
-
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
+    repository.ensure_patient(db, current_user.email, patient_id)
 
     # 2. Create Consultation
     db_consultation = models.ClinicalConsultation(
@@ -79,6 +77,10 @@ def create_consultation(
     db.add(db_consultation)
     db.commit()
     db.refresh(db_consultation)
+
+    # 3. Receta lista antes de que el medico pulse Imprimir / Enviar (opt-in)
+    if prerender_enabled():
+        background_tasks.add_task(render_pool.prerender, db_consultation.id, current_user.email)
     
     return db_consultation
 
@@ -90,21 +92,8 @@ def list_consultations(
 ):
     check_feature_flag()
 
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
-
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
-    # 2. List Consultations (Ordered by Date Desc)
-    consultations = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.patient_id == patient_id
-    ).order_by(desc(models.ClinicalConsultation.created_at)).all()
-
-    return consultations
+    # Ownership check + consultations (Ordered by Date Desc) in one statement
+    return repository.list_patient_consultations(db, current_user.email, patient_id)
 
 
 # New router for consultation-level operations (not patient-scoped)
@@ -124,6 +113,21 @@ except ImportError:
         print("WARNING: PDFService could not be imported. PDF generation will fail.")
         PDFService = None
 
+@verification_router.post("/batch", response_model=List[ConsultationItemSpanish])
+def get_consultations_batch(
+    batch: BatchIdsRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Batch read of consultations by ID (same schema as the patient history list).
+    One tenant-scoped IN (...) query; unknown or foreign ids are omitted.
+    """
+    check_feature_flag()
+
+    return repository.get_consultations_by_ids(db, current_user.email, batch.ids)
+
+
 @verification_router.post("/{consultation_id}/create-verification")
 async def create_verification(
     consultation_id: int,
@@ -140,37 +144,14 @@ async def create_verification(
     Returns:
         {"uuid": "..."}
     """
-    import uuid as uuid_lib
-    import datetime
-    
     # Verificar autorizaciÃ³n
-    consultation = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.id == consultation_id,
-        models.ClinicalConsultation.owner_id == current_user.email
-    ).first()
+    repository.get_consultation(db, current_user.email, consultation_id)
     
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consultation not found")
-    
-    # Buscar verificaciÃ³n existente
-    verification = db.query(models.PrescriptionVerification).filter(
-        models.PrescriptionVerification.consultation_id == consultation_id
-    ).first()
-    
-    if verification:
-        # Retornar UUID existente (idempotente)
-        return {"uuid": verification.uuid}
-    
-    # Crear nueva verificaciÃ³n
-    verification = models.PrescriptionVerification(
-        uuid=str(uuid_lib.uuid4()),
-        consultation_id=consultation_id,
-        doctor_email=current_user.email,
-        doctor_name=current_user.professional_name or "Dr. Vitalinuage",
-        issue_date=datetime.datetime.utcnow()
+    # Verificacion existente o nueva (una por consulta)
+    verification = repository.get_or_create_verification(
+        db, consultation_id, current_user.email,
+        doctor_name=current_user.professional_name or "Dr. Vitalinuage"
     )
-    db.add(verification)
-    db.commit()
     
     return {"uuid": verification.uuid}
 
@@ -193,16 +174,11 @@ async def send_prescription_email(
     """
     import datetime
     from services.email_service import EmailService
-    import uuid as uuid_lib
     
     # 1. Verificar autorizaciÃ³n
-    consultation = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.id == consultation_id,
-        models.ClinicalConsultation.owner_id == current_user.email
-    ).first()
-    
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consultation not found")
+    consultation = repository.get_consultation(
+        db, current_user.email, consultation_id, with_patient=True
+    )
     
     # 2. Validar email del paciente
     if not consultation.patient or not consultation.patient.email:
@@ -212,21 +188,10 @@ async def send_prescription_email(
         )
     
     # 3. Obtener o crear verificaciÃ³n
-    verification = db.query(models.PrescriptionVerification).filter(
-        models.PrescriptionVerification.consultation_id == consultation_id
-    ).first()
-    
-    if not verification:
-        verification = models.PrescriptionVerification(
-            uuid=str(uuid_lib.uuid4()),
-            consultation_id=consultation_id,
-            doctor_email=current_user.email,
-            doctor_name=current_user.professional_name or "Dr. Vitalinuage",
-            issue_date=datetime.datetime.utcnow()
-        )
-        db.add(verification)
-        db.commit()
-        db.refresh(verification)
+    verification = repository.get_or_create_verification(
+        db, consultation_id, current_user.email,
+        doctor_name=current_user.professional_name or "Dr. Vitalinuage"
+    )
     
     # 4. Construir datos
     patient_name = f"{consultation.patient.nombre} {consultation.patient.apellido_paterno}"
@@ -265,13 +230,9 @@ async def mark_whatsapp_sent(
     check_tracking_flag()
 
     # Verificar propiedad
-    consultation = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.id == consultation_id,
-        models.ClinicalConsultation.owner_id == current_user.email
-    ).first()
-    
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+    repository.get_consultation(
+        db, current_user.email, consultation_id, detail="Consulta no encontrada"
+    )
         
     # Obtener verificacion
     verification = db.query(models.PrescriptionVerification).filter(
@@ -296,13 +257,9 @@ async def get_dispatch_status(
 ):
     check_tracking_flag()
 
-    consultation = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.id == consultation_id,
-        models.ClinicalConsultation.owner_id == current_user.email
-    ).first()
-    
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+    repository.get_consultation(
+        db, current_user.email, consultation_id, detail="Consulta no encontrada"
+    )
     
     # Gracias a la propiedad hibrida aÃ±adida en models.py, esto es facil,
     # pero para el endpoint especifico consultamos la verification directa
@@ -320,49 +277,78 @@ async def get_dispatch_status(
     }
 
 
+async def prescription_pdf_response(
+    request: Request,
+    consultation: models.ClinicalConsultation,
+    doctor_email: str,
+    db: Session,
+    content_disposition: str
+) -> Response:
+    """
+    Receta desde la cache de PDFs. El ETag sale de la clave de render, asi un
+    If-None-Match vigente responde 304 sin renderizar ni leer el archivo;
+    la descarga se transmite por partes desde el disco y acepta Range para
+    visores que reanudan o piden la receta de a trozos.
+    """
+    from backend.core import http_cache
+    from backend.services import pdf_profile
+    from backend.services.pdf_cache import pdf_cache
+    from backend.services.pdf_service import PDFService
+
+    # La clave consulta la BD y Storage (generation de firma/logo): fuera del event loop
+    _, _, cache_key = await run_in_threadpool(PDFService.prescription_render_inputs, consultation, doctor_email, db)
+    # Solo un perfil determinista garantiza los mismos bytes si se vuelve a renderizar
+    if pdf_profile.active().deterministic:
+        etag = http_cache.strong_etag("prescription-pdf", cache_key)
+    else:
+        etag = http_cache.weak_etag("prescription-pdf", cache_key)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified_response(etag)
+
+    headers = {"Content-Disposition": content_disposition}
+    path = pdf_cache.path_for(cache_key)
+    if path:
+        return http_cache.artifact_response(request, etag, "application/pdf", path=path, headers=headers)
+
+    pdf_bytes = await render_pool.render_prescription(consultation, doctor_email, db, cache_key=cache_key)
+    return http_cache.artifact_response(
+        request, etag, "application/pdf",
+        path=pdf_cache.path_for(cache_key), data=pdf_bytes, headers=headers
+    )
+
+
 @verification_router.get("/{consultation_id}/pdf")
 async def get_prescription_pdf(
     consultation_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Genera y descarga el PDF de la receta.
+    Soporta If-None-Match (304) y Range (206).
     """
     check_feature_flag()
 
     # 1. Verificar propiedad
-    consultation = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.id == consultation_id,
-        models.ClinicalConsultation.owner_id == current_user.email
-    ).first()
-    
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+    consultation = repository.get_consultation(
+        db, current_user.email, consultation_id,
+        with_patient=True, detail="Consulta no encontrada"
+    )
 
-    # 2. Generar PDF
-    # Import already handled globally or needs to be absolute if local
-    # from backend.services.pdf_service import PDFService
+    # 2. Servir desde la cache o generar fuera del event loop (pool de render)
     try:
-        pdf_bytes = PDFService.generate_prescription_pdf(
-            consultation=consultation, 
-            doctor_email=current_user.email,
-            db=db
+        return await prescription_pdf_response(
+            request, consultation, current_user.email, db,
+            f"attachment; filename=receta_{consultation_id}.pdf"
         )
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="La generación del PDF excedió el tiempo límite")
     except Exception as e:
         print(f"Error generating PDF: {e}")
         # Return 500 but detail it
         raise HTTPException(status_code=500, detail=f"Error al generar PDF: {str(e)}")
 
-    # 3. Retornar stream
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=receta_{consultation_id}.pdf"
-        }
-    )
-
 
 
 
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
 import json
 from pathlib import Path
 
 from backend.schemas import doctor as schemas
 from backend.dependencies import get_current_user
+from backend.core import http_cache
+from backend.services.pdf_service import PDFService
+from backend.services.image_derivatives import discard_print_derivative, generate_print_derivative
+from backend.services import print_preview
 from backend.models import User, Patient, ClinicalConsultation, PrescriptionVerification
 
 router = APIRouter(
@@ -27,7 +31,20 @@ def load_feature_flags() -> dict:
         "prescription_coords_v1": False
     }
 
-from typing import Union
+from typing import Optional, Union
+
+
+def _refresh_print_asset(background_tasks: BackgroundTasks, previous, value, kind: str) -> None:
+    # Uploads may overwrite the same Storage path, so drop the cached copy
+    # whenever the field is written, not only when the path changes.
+    for storage_value in (previous, value):
+        if storage_value:
+            PDFService.invalidate_storage_asset(storage_value)
+    # Downscaled 300 DPI copy, built once here so renders never resize.
+    # The previous one is dropped first so it never outlives its original.
+    if value:
+        discard_print_derivative(value)
+        background_tasks.add_task(generate_print_derivative, value, kind)
 
 @router.get("/profile", response_model=schemas.DoctorProfile)
 def get_profile(current_user: User = Depends(get_current_user)):
@@ -63,6 +80,7 @@ from backend.schemas import auth_schemas
 @router.post("/profile", response_model=schemas.DoctorProfile)
 def create_profile(
     data: auth_schemas.OnboardingUpdate, 
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
@@ -84,8 +102,10 @@ def create_profile(
     if data.phone is not None:
         current_user.phone = data.phone
     if data.profile_image is not None:
+        _refresh_print_asset(background_tasks, current_user.profile_image, data.profile_image, "profile")
         current_user.profile_image = data.profile_image
     if data.signature_image is not None:
+        _refresh_print_asset(background_tasks, current_user.signature_image, data.signature_image, "signature")
         current_user.signature_image = data.signature_image
         
     # Mark as onboarded
@@ -109,6 +129,7 @@ from backend.schemas.user import UserUpdate
 @router.put("/profile", response_model=auth_schemas.User)
 def update_profile(
     data: UserUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -130,8 +151,10 @@ def update_profile(
     if data.phone is not None:
         current_user.phone = data.phone
     if data.profile_image is not None:
+        _refresh_print_asset(background_tasks, current_user.profile_image, data.profile_image, "profile")
         current_user.profile_image = data.profile_image
     if data.signature_image is not None:
+        _refresh_print_asset(background_tasks, current_user.signature_image, data.signature_image, "signature")
         current_user.signature_image = data.signature_image
         
     db.add(current_user)
@@ -281,29 +304,102 @@ def get_dashboard_stats(
             "efficiency_rate": 0.0
         }
 
+def _preferences_payload(user: User) -> dict:
+    return {
+        "paper_size": user.print_paper_size or "A4",
+        "template_id": user.print_template_id or "classic",
+        "header_text": user.print_header_text or "",
+        "footer_text": user.print_footer_text or "",
+        "primary_color": user.print_primary_color or "#000000",
+        "secondary_color": user.print_secondary_color or "#ffffff",
+        "logo_path": user.print_logo_path
+    }
+
 @router.get("/preferences")
-def get_preferences(current_user: User = Depends(get_current_user)):
+def get_preferences(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
     """
     Stub for doctor preferences (Frontend requirement).
     Returns default values until implemented.
+    ETag is derived from the payload itself (already loaded with the user).
     """
-    return {
-        "paper_size": current_user.print_paper_size or "A4",
-        "template_id": current_user.print_template_id or "classic",
-        "header_text": current_user.print_header_text or "",
-        "footer_text": current_user.print_footer_text or "",
-        "primary_color": current_user.print_primary_color or "#000000",
-        "secondary_color": current_user.print_secondary_color or "#ffffff",
-        "logo_path": current_user.print_logo_path
+    prefs = _preferences_payload(current_user)
+    etag = http_cache.content_etag(prefs)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified_response(etag)
+    http_cache.set_cache_headers(response, etag)
+    return prefs
+
+@router.get("/preferences/preview")
+def preview_preferences(
+    request: Request,
+    template_id: Optional[str] = Query(None),
+    header_text: Optional[str] = Query(None),
+    footer_text: Optional[str] = Query(None),
+    primary_color: Optional[str] = Query(None),
+    secondary_color: Optional[str] = Query(None),
+    dpi: int = Query(print_preview.PREVIEW_DPI, ge=print_preview.MIN_DPI, le=print_preview.MAX_DPI),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Low-resolution PNG of page 1 of the recipe with sample data, for the
+    preferences screen. Query parameters preview unsaved edits on top of
+    the saved preferences. Screen only: prints still use the PDF endpoints.
+    The layout is the one prints use: the active PrescriptionMap if the
+    doctor has one, otherwise the recipe template.
+    The logo is always the saved print_logo_path: Storage is read with the
+    service account, so a path from the query could reach other doctors' files.
+    """
+    preferences = {
+        "template_id": current_user.print_template_id,
+        "header_text": current_user.print_header_text,
+        "footer_text": current_user.print_footer_text,
+        "primary_color": current_user.print_primary_color,
+        "secondary_color": current_user.print_secondary_color,
+        "logo_path": current_user.print_logo_path,
+    }
+    edits = {
+        "template_id": template_id,
+        "header_text": header_text,
+        "footer_text": footer_text,
+        "primary_color": primary_color,
+        "secondary_color": secondary_color,
     }
+    preferences.update({key: value for key, value in edits.items() if value is not None})
+
+    prescription_map = PDFService.get_active_map(current_user.email, db)
+    etag = http_cache.weak_etag(
+        print_preview.preview_key(preferences, current_user.signature_image, dpi, prescription_map)
+    )
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified_response(etag, cache_control=http_cache.SETTINGS_CACHE_CONTROL)
+
+    png = print_preview.render_preview(preferences, current_user.signature_image, dpi, prescription_map)
+    response = Response(content=png, media_type="image/png")
+    http_cache.set_cache_headers(response, etag, cache_control=http_cache.SETTINGS_CACHE_CONTROL)
+    return response
 
 @router.get("/feature-flags")
-def get_feature_flags(current_user: User = Depends(get_current_user)):
-    return load_feature_flags()
+def get_feature_flags(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    flags = load_feature_flags()
+    etag = http_cache.content_etag(flags)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified_response(etag, cache_control=http_cache.SETTINGS_CACHE_CONTROL)
+    http_cache.set_cache_headers(response, etag, cache_control=http_cache.SETTINGS_CACHE_CONTROL)
+    return flags
 
 @router.put("/preferences")
 def update_preferences(
     data: schemas.DoctorPreferencesUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -326,17 +422,10 @@ def update_preferences(
     if "secondary_color" in prefs:
         current_user.print_secondary_color = prefs["secondary_color"]
     if "logo_path" in prefs:
+        _refresh_print_asset(background_tasks, current_user.print_logo_path, prefs["logo_path"], "logo")
         current_user.print_logo_path = prefs["logo_path"]
 
     db.commit()
     db.refresh(current_user)
 
-    return {
-        "paper_size": current_user.print_paper_size or "A4",
-        "template_id": current_user.print_template_id or "classic",
-        "header_text": current_user.print_header_text or "",
-        "footer_text": current_user.print_footer_text or "",
-        "primary_color": current_user.print_primary_color or "#000000",
-        "secondary_color": current_user.print_secondary_color or "#ffffff",
-        "logo_path": current_user.print_logo_path
-    }
+    return _preferences_payload(current_user)
@@ -71,6 +71,12 @@ async def delete_account(
             {"email": current_user.email}
         )
 
+        # Feed de sincronización (no contiene PHI, solo ids)
+        db.execute(
+            text("DELETE FROM change_log WHERE owner_id = :email"),
+            {"email": current_user.email}
+        )
+
         # 4. CAPA 0 (Raíz)
         # Borrar Usuario
         db.execute(
@@ -1,13 +1,16 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Body
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from backend import models
 from backend.database import get_db
 from backend.dependencies import get_current_user
+from backend.core import http_cache
 from backend.schemas.prescription_map import PrescriptionMapCreate, PrescriptionMapResponse
+from backend.services import print_preview
 
 router = APIRouter(
     prefix="/api/maps",
@@ -16,29 +19,94 @@ router = APIRouter(
 
 @router.get("", response_model=List[PrescriptionMapResponse])
 def get_maps(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    # Version of the whole list: count + newest updated_at (activation toggles bump updated_at)
+    if http_cache.has_validators(request):
+        count, last_updated = db.query(
+            func.count(models.PrescriptionMap.id),
+            func.max(models.PrescriptionMap.updated_at)
+        ).filter(
+            models.PrescriptionMap.doctor_id == current_user.email
+        ).one()
+        etag = http_cache.weak_etag("maps", count, last_updated)
+        if http_cache.is_not_modified(request, etag, last_updated):
+            return http_cache.not_modified_response(etag, last_updated)
+
     maps = db.query(models.PrescriptionMap).filter(
         models.PrescriptionMap.doctor_id == current_user.email
     ).all()
+    last_updated = max((m.updated_at for m in maps if m.updated_at), default=None)
+    http_cache.set_cache_headers(
+        response, http_cache.weak_etag("maps", len(maps), last_updated), last_updated
+    )
     return maps
 
 @router.get("/current", response_model=PrescriptionMapResponse)
 def get_current_map(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     # Return the active one, or the last created one
-    pmap = db.query(models.PrescriptionMap).filter(
+    query = db.query(models.PrescriptionMap).filter(
         models.PrescriptionMap.doctor_id == current_user.email,
         models.PrescriptionMap.is_active == True
-    ).order_by(models.PrescriptionMap.updated_at.desc()).first()
+    ).order_by(models.PrescriptionMap.updated_at.desc())
+
+    if http_cache.has_validators(request):
+        version = query.with_entities(
+            models.PrescriptionMap.id, models.PrescriptionMap.updated_at
+        ).first()
+        if not version:
+            raise HTTPException(status_code=404, detail="No active map found")
+        etag = http_cache.weak_etag("map", version.id, version.updated_at)
+        if http_cache.is_not_modified(request, etag, version.updated_at):
+            return http_cache.not_modified_response(etag, version.updated_at)
+
+    pmap = query.first()
     
     if not pmap:
         raise HTTPException(status_code=404, detail="No active map found")
+    http_cache.set_cache_headers(
+        response, http_cache.weak_etag("map", pmap.id, pmap.updated_at), pmap.updated_at
+    )
     return pmap
 
+@router.get("/{map_id}/preview")
+def preview_map(
+    map_id: int,
+    request: Request,
+    dpi: int = Query(print_preview.PREVIEW_DPI, ge=print_preview.MIN_DPI, le=print_preview.MAX_DPI),
+    background: bool = Query(True, description="Draw the scanned stationery (background_image_url)"),
+    boxes: bool = Query(True, description="Outline each field's box"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    PNG preview of a map with sample data for the visual map editor.
+    Cached by map id + updated_at; the ETag changes whenever the map is saved.
+    """
+    pmap = db.query(models.PrescriptionMap).filter(
+        models.PrescriptionMap.id == map_id,
+        models.PrescriptionMap.doctor_id == current_user.email
+    ).first()
+    if not pmap:
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    etag = http_cache.weak_etag(print_preview.map_preview_key(pmap, dpi, background, boxes))
+    if http_cache.is_not_modified(request, etag, pmap.updated_at):
+        return http_cache.not_modified_response(etag, pmap.updated_at)
+
+    png = print_preview.render_map_preview(pmap, dpi, with_background=background, with_boxes=boxes)
+    response = Response(content=png, media_type="image/png")
+    http_cache.set_cache_headers(response, etag, pmap.updated_at)
+    return response
+
 @router.post("", response_model=PrescriptionMapResponse)
 def create_or_update_map(
     map_create: PrescriptionMapCreate,
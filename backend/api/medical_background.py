@@ -1,4 +1,4 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status
+﻿from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
 from typing import Optional
 from pydantic import BaseModel
@@ -7,6 +7,8 @@ import json
 import os
 from backend.database import get_db
 from backend.dependencies import get_current_user
+from backend import repository
+from backend.core import http_cache
 import datetime
 
 router = APIRouter(
@@ -71,26 +73,32 @@ def check_feature_flag():
 @router.get("", response_model=MedicalBackgroundResponse)
 def get_medical_background(
     patient_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     check_feature_flag()
 
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
+    # 0. Conditional GET: version-only lookup, no serialization on match
+    if http_cache.has_validators(request):
+        version = repository.get_background_version(db, current_user.email, patient_id)
+        etag = http_cache.weak_etag("background", patient_id, version)
+        if http_cache.is_not_modified(request, etag, version):
+            return http_cache.not_modified_response(etag, version)
 
-    if not patient:
+    # 1. Verify Patient Ownership + Get Background (single statement)
+    try:
+        _, background = repository.get_patient_with_background(db, current_user.email, patient_id)
+    except repository.PatientNotFound:
         print(f"[API DEBUG] Patient {patient_id} not found for user {current_user.email}")
         # PBT-IA: 404 to avoid leaking existence
-        raise HTTPException(status_code=404, detail="Patient not found")
+        raise
 
-    # 2. Get Background
-    background = db.query(models.MedicalBackground).filter(
-        models.MedicalBackground.patient_id == patient_id
-    ).first()
+    version = background.updated_at if background else None
+    http_cache.set_cache_headers(
+        response, http_cache.weak_etag("background", patient_id, version), version
+    )
 
     # Lazy Creation or Return Empty
     if not background:
@@ -119,20 +127,10 @@ def update_medical_background(
 ):
     check_feature_flag()
 
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
-
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    # 2. Get or Create
-    background = db.query(models.MedicalBackground).filter(
-        models.MedicalBackground.patient_id == patient_id
-    ).first()
+    # 1. Verify Patient Ownership + Get (single statement)
+    _, background = repository.get_patient_with_background(db, current_user.email, patient_id)
 
+    # 2. Or Create
     if not background:
         background = models.MedicalBackground(patient_id=patient_id)
         db.add(background)
@@ -1,4 +1,5 @@
-﻿from fastapi import APIRouter, Depends, Query, HTTPException, status
+﻿from fastapi import APIRouter, BackgroundTasks, Depends, Query, HTTPException, status, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from typing import List
@@ -8,6 +9,7 @@ import backend.schemas.patients as search_schemas
 import os
 import json
 from sqlalchemy import or_, cast, String
+from sqlalchemy.orm import load_only
 from backend.schemas.patient import (
     PatientListResponse, 
     ClinicalRecord,
@@ -18,7 +20,9 @@ from backend.schemas.patient import (
     ConsultationItemSpanish # Added for SP-02
 )
 from backend.schemas.consultations import ConsultationCreate
-from backend.database import get_db
+from backend.schemas.batch import BatchIdsRequest
+from backend.database import get_db, SessionLocal
+from backend.core import http_cache, fieldsets
 
 router = APIRouter(
     # Prefix managed in main.py
@@ -27,7 +31,10 @@ router = APIRouter(
 )
 
 from backend.dependencies import get_current_user
+from backend.services.render_pool import render_pool, prerender_enabled
+from backend.services.pdf_service import PDFService
 import backend.crud as crud
+import backend.repository as repository
 import backend.schemas as schemas_auth
 
 from sqlalchemy.exc import IntegrityError
@@ -152,9 +159,41 @@ def search_patients(
         
     return {"results": mapped_results}
 
+# Sparse fieldsets (?fields=)
+PATIENT_FIELDS = list(schemas.Patient.model_fields)
+PATIENT_LIST_FIELDS = ["id", "full_name", "id_number", "last_consultation", "status"]
+PATIENT_LIST_SOURCES = {
+    "full_name": ["nombre", "apellido_paterno", "apellido_materno"],
+    "id_number": ["dni"],
+    "last_consultation": [],  # aggregated from clinical_consultations
+    "status": [],
+}
+CONSULTATION_FIELDS = list(ConsultationItemSpanish.model_fields)
+CONSULTATION_SOURCES = {
+    # Dispatch timestamps live on the verification row
+    "email_sent_at": [],
+    "whatsapp_sent_at": [],
+}
+
+@router.post("/batch", response_model=List[schemas.Patient])
+def get_patients_batch(
+    batch: BatchIdsRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas_auth.User = Depends(get_current_user)
+):
+    """
+    Batch read of patients by ID (same schema as GET /{patient_id}).
+    One tenant-scoped IN (...) query; ids that are missing or belong to
+    another doctor are omitted, the rest keep the requested order.
+    """
+    return repository.get_patients_by_ids(db, current_user.email, batch.ids)
+
 @router.get("/{patient_id}", response_model=schemas.Patient)
 def get_patient_by_id(
     patient_id: int,
+    request: Request,
+    response: Response,
+    fields: str = Query(None, description="Comma-separated subset of fields (e.g. nombre,dni)"),
     db: Session = Depends(get_db),
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
@@ -163,16 +202,31 @@ def get_patient_by_id(
     
     Security: Enforces multi-tenancy by verifying owner_id matches current user.
     Returns 404 if patient not found or belongs to different user (prevents enumeration).
+    Conditional: answers 304 to a matching If-None-Match after a version-only lookup.
+    Sparse: ?fields= selects only those columns.
     """
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
+    names = fieldsets.parse_fields(fields, PATIENT_FIELDS)
+    # Each projection is its own representation, so it gets its own validator
+    representation = ",".join(names) if names else None
+
+    if http_cache.has_validators(request):
+        version = repository.get_patient_version(db, current_user.email, patient_id)
+        etag = http_cache.weak_etag("patient", patient_id, version, representation)
+        if http_cache.is_not_modified(request, etag, version):
+            return http_cache.not_modified_response(etag, version)
+
+    columns = None
+    if names:
+        columns = fieldsets.columns_for(models.Patient, names) + [models.Patient.updated_at]
+    patient = repository.get_patient(db, current_user.email, patient_id, columns=columns)
+    etag = http_cache.weak_etag("patient", patient.id, patient.updated_at, representation)
+
+    if names:
+        response = fieldsets.sparse_response(fieldsets.project(patient, names))
+        http_cache.set_cache_headers(response, etag, patient.updated_at)
+        return response
+
+    http_cache.set_cache_headers(response, etag, patient.updated_at)
     return patient
 
 @router.patch("/{patient_id}", response_model=schemas.Patient)
@@ -186,13 +240,7 @@ def update_patient(
     Update patient details (partial update).
     """
     # 1. Verify Ownership
-    db_patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id,
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    if not db_patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
+    db_patient = repository.get_patient(db, current_user.email, patient_id)
         
     # 2. Update fields
     # Using exclude_unset=True to only update fields sent in the request
@@ -217,6 +265,7 @@ def read_patients(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     search: str = Query(None, min_length=1),
+    fields: str = Query(None, description="Comma-separated subset of item fields (e.g. full_name,id_number)"),
     db: Session = Depends(get_db),
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
@@ -225,6 +274,8 @@ def read_patients(
     """
     from sqlalchemy import func, desc
     
+    names = fieldsets.parse_fields(fields, PATIENT_LIST_FIELDS)
+
     # 1. Base Query
     query = db.query(models.Patient).filter(models.Patient.owner_id == current_user.email)
     
@@ -245,53 +296,70 @@ def read_patients(
     
     # 3. Pagination
     offset = (page - 1) * size
-    patients = query.order_by(models.Patient.id.desc()).offset(offset).limit(size).all()
+    page_query = query.order_by(models.Patient.id.desc()).offset(offset).limit(size)
+    if names:
+        page_query = page_query.options(load_only(
+            *fieldsets.columns_for(models.Patient, names, PATIENT_LIST_SOURCES)
+        ))
+    patients = page_query.all()
     
     # 4. Map Data
+    wants = set(names or PATIENT_LIST_FIELDS)
     data = []
     for p in patients:
-        # Get Last Consultation
-        last_date = db.query(func.max(models.ClinicalConsultation.created_at)).filter(
-            models.ClinicalConsultation.patient_id == p.id
-        ).scalar()
-        
-        full_name = f"{p.nombre} {p.apellido_paterno}"
-        if p.apellido_materno:
-            full_name += f" {p.apellido_materno}"
+        item = {"id": p.id}
+
+        if "full_name" in wants:
+            full_name = f"{p.nombre} {p.apellido_paterno}"
+            if p.apellido_materno:
+                full_name += f" {p.apellido_materno}"
+            item["full_name"] = full_name
+
+        if "id_number" in wants:
+            item["id_number"] = p.dni
+
+        if "last_consultation" in wants:
+            # Get Last Consultation (skipped entirely for narrow views)
+            item["last_consultation"] = db.query(func.max(models.ClinicalConsultation.created_at)).filter(
+                models.ClinicalConsultation.patient_id == p.id
+            ).scalar()
+
+        if "status" in wants:
+            item["status"] = "Activo" # Default status logic for now
             
-        data.append({
-            "id": p.id,
-            "full_name": full_name,
-            "id_number": p.dni,
-            "last_consultation": last_date,
-            "status": "Activo" # Default status logic for now
-        })
+        data.append(item)
         
-    return {
+    payload = {
         "data": data,
         "total": total,
         "page": page,
         "size": size
     }
+    if names:
+        return fieldsets.sparse_response(payload)
+    return payload
 
 @router.get("/{patient_id}/clinical-record", response_model=ClinicalRecord)
 def get_clinical_record(
     patient_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
     """Get clinical record for a patient."""
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id, 
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-        
-    # 2. Get Record
-    record = db.query(models.ClinicalRecord).filter(models.ClinicalRecord.patient_id == patient_id).first()
+    if http_cache.has_validators(request):
+        version = repository.get_clinical_record_version(db, current_user.email, patient_id)
+        etag = http_cache.weak_etag("clinical-record", patient_id, version)
+        if http_cache.is_not_modified(request, etag, version):
+            return http_cache.not_modified_response(etag, version)
+
+    # Ownership check and record fetch in one statement
+    _, record = repository.get_patient_with_clinical_record(db, current_user.email, patient_id)
+    version = record.updated_at if record else None
+    http_cache.set_cache_headers(
+        response, http_cache.weak_etag("clinical-record", patient_id, version), version
+    )
     
     if not record:
         # Return empty default
@@ -313,18 +381,10 @@ def update_clinical_record(
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
     """Update clinical record for a patient (Upsert)."""
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id, 
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
+    # 1. Verify Patient Ownership + load existing record (single statement)
+    _, db_record = repository.get_patient_with_clinical_record(db, current_user.email, patient_id)
         
     # 2. Upsert
-    db_record = db.query(models.ClinicalRecord).filter(models.ClinicalRecord.patient_id == patient_id).first()
-    
     if not db_record:
         db_record = models.ClinicalRecord(patient_id=patient_id)
         db.add(db_record)
@@ -345,56 +405,75 @@ def update_clinical_record(
 @router.get("/{patient_id}/consultations", response_model=List[ConsultationItemSpanish])
 def get_patient_consultations(
     patient_id: int,
+    fields: str = Query(None, description="Comma-separated subset of fields (e.g. created_at,diagnostico)"),
     db: Session = Depends(get_db),
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
     print(f"[AUTH AUDIT] GET /api/patients/{patient_id}/consultations")
     print(f"[AUTH AUDIT] Current user email: {current_user.email}")
     
-    # 1. Verify Patient Ownership (Strict Security)
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id, 
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    if not patient:
-        # Check if patient exists at all
-        patient_exists = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-        if patient_exists:
-            print(f"[AUTH AUDIT] Patient {patient_id} exists but owner_id mismatch. Patient owner: {patient_exists.owner_id}, Current user: {current_user.email}")
-        else:
-            print(f"[AUTH AUDIT] Patient {patient_id} does not exist in database")
-        # Prevent enumeration
-        raise HTTPException(status_code=404, detail="Patient not found")
+    names = fieldsets.parse_fields(fields, CONSULTATION_FIELDS)
+    wants = set(names or CONSULTATION_FIELDS)
 
-    print(f"[AUTH AUDIT] Patient {patient_id} ownership verified. Owner: {patient.owner_id}")
-    
-    # 2. Query Consultations
-    consultations = db.query(models.ClinicalConsultation).filter(
-        models.ClinicalConsultation.patient_id == patient_id
-    ).order_by(models.ClinicalConsultation.created_at.desc()).all()
+    # 1. Ownership + consultations in one tenant-scoped statement (Strict Security)
+    try:
+        consultations = repository.list_patient_consultations(
+            db,
+            current_user.email,
+            patient_id,
+            columns=fieldsets.columns_for(models.ClinicalConsultation, names, CONSULTATION_SOURCES) if names else None,
+            with_verification=bool(wants & {"email_sent_at", "whatsapp_sent_at"})
+        )
+    except repository.PatientNotFound:
+        # Prevent enumeration: missing and foreign patients look the same
+        print(f"[AUTH AUDIT] Patient {patient_id} not found for owner {current_user.email}")
+        raise
     
     print(f"[AUTH AUDIT] Found {len(consultations)} consultations for patient {patient_id}")
     
+    if names:
+        return fieldsets.sparse_response([fieldsets.project(c, names) for c in consultations])
+
     # 3. Return directly (Auto-mapped to Spanish Schema)
     return consultations
 
+@router.get("/{patient_id}/dossier")
+def export_patient_dossier(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas_auth.User = Depends(get_current_user)
+):
+    """
+    Full consultation history of the patient as one PDF (referrals,
+    insurance). Pages are streamed as they are laid out.
+    """
+    patient = repository.get_patient(db, current_user.email, patient_id)
+    owner_id = current_user.email
+    filename = f"historial_{patient.id}.pdf"
+
+    def pages():
+        # Own session: the stream outlives the request-scoped one
+        session = SessionLocal()
+        try:
+            dossier_patient = session.get(models.Patient, patient_id)
+            yield from PDFService.generate_patient_dossier(dossier_patient, owner_id, session)
+        finally:
+            session.close()
+
+    return StreamingResponse(
+        pages(),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @router.post("/{patient_id}/consultations", response_model=ConsultationItem, status_code=201)
 def create_patient_consultation(
     patient_id: int,
     consultation: ConsultationCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: schemas_auth.User = Depends(get_current_user)
 ):
-    # 1. Verify Patient Ownership
-    patient = db.query(models.Patient).filter(
-        models.Patient.id == patient_id, 
-        models.Patient.owner_id == current_user.email
-    ).first()
-    
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-        
     snapshot_fields = {
         "alergias": (consultation.alergias or "").strip(),
         "patologicos": (consultation.patologicos or "").strip(),
@@ -412,6 +491,12 @@ def create_patient_consultation(
     else:
         exam_text = base_exam
 
+    # 1. Verify Patient Ownership (loads the background too when a snapshot must be upserted)
+    if snapshot_data:
+        _, background = repository.get_patient_with_background(db, current_user.email, patient_id)
+    else:
+        repository.ensure_patient(db, current_user.email, patient_id)
+
     # 2. Create Consultation (map English schema to Spanish model columns)
     db_consultation = models.ClinicalConsultation(
         patient_id=patient_id,
@@ -436,9 +521,6 @@ def create_patient_consultation(
     
     db.add(db_consultation)
     if snapshot_data:
-        background = db.query(models.MedicalBackground).filter(
-            models.MedicalBackground.patient_id == patient_id
-        ).first()
         if not background:
             background = models.MedicalBackground(patient_id=patient_id)
             db.add(background)
@@ -446,6 +528,10 @@ def create_patient_consultation(
             setattr(background, key, value)
     db.commit()
     db.refresh(db_consultation)
+
+    # Receta lista antes de que el medico pulse Imprimir / Enviar (opt-in)
+    if prerender_enabled():
+        background_tasks.add_task(render_pool.prerender, db_consultation.id, current_user.email)
     
     # 3. Map Spanish model fields back to English schema for response
     return ConsultationItem(
@@ -0,0 +1,97 @@
+import datetime
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.database import get_db
+from backend.dependencies import get_current_user
+from backend.schemas.print_jobs import (
+    PRINT_JOB_MAX_ITEMS, PRINT_JOB_MAX_MERGED_ITEMS, PrintJobRequest, PrintJobStatus,
+)
+from backend.services.print_jobs import job_filename, job_status, print_jobs
+
+router = APIRouter(
+    prefix="/api/consultas/print-jobs",
+    tags=["Print Jobs"]
+)
+
+
+@router.post("", response_model=PrintJobStatus, status_code=status.HTTP_202_ACCEPTED)
+def create_print_job(
+    request: PrintJobRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Encola la impresión de un lote de recetas (lista de ids o rango de
+    fechas inclusivo). Devuelve el job; consultar su progreso en
+    GET /{job_id} y descargar el resultado en GET /{job_id}/download.
+    """
+    query = db.query(models.ClinicalConsultation.id).filter(
+        models.ClinicalConsultation.owner_id == current_user.email
+    )
+    if request.ids is not None:
+        owned = {row.id for row in query.filter(models.ClinicalConsultation.id.in_(set(request.ids))).all()}
+        consultation_ids = [cid for cid in dict.fromkeys(request.ids) if cid in owned]
+    else:
+        start = datetime.datetime.combine(request.date_from, datetime.time.min)
+        end = datetime.datetime.combine(request.date_to or request.date_from, datetime.time.min) + datetime.timedelta(days=1)
+        rows = query.filter(
+            models.ClinicalConsultation.created_at >= start,
+            models.ClinicalConsultation.created_at < end
+        ).order_by(models.ClinicalConsultation.created_at, models.ClinicalConsultation.id).limit(
+            PRINT_JOB_MAX_ITEMS + 1
+        ).all()
+        consultation_ids = [row.id for row in rows]
+
+    if not consultation_ids:
+        raise HTTPException(status_code=422, detail="No hay consultas para imprimir en la selección")
+    if len(consultation_ids) > PRINT_JOB_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"La selección supera el máximo de {PRINT_JOB_MAX_ITEMS} recetas por lote"
+        )
+    if request.format == "pdf" and len(consultation_ids) > PRINT_JOB_MAX_MERGED_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Un PDF combinado admite hasta {PRINT_JOB_MAX_MERGED_ITEMS} recetas; use format=zip para lotes mayores"
+        )
+
+    job = print_jobs.create(current_user.email, consultation_ids, request.format)
+    background_tasks.add_task(print_jobs.run, job.id)
+    return job_status(job)
+
+
+@router.get("/{job_id}", response_model=PrintJobStatus)
+def get_print_job(
+    job_id: str,
+    current_user: models.User = Depends(get_current_user)
+):
+    job = print_jobs.get(job_id, current_user.email)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo de impresión no encontrado")
+    return job_status(job)
+
+
+@router.get("/{job_id}/download")
+def download_print_job(
+    job_id: str,
+    current_user: models.User = Depends(get_current_user)
+):
+    job = print_jobs.get(job_id, current_user.email)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo de impresión no encontrado")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"El trabajo de impresión está en estado '{job.status}'")
+    content = print_jobs.output(job)
+    if content is None:
+        raise HTTPException(status_code=410, detail="El archivo del trabajo de impresión ya no está disponible")
+    media_type = "application/zip" if job.format == "zip" else "application/pdf"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{job_filename(job)}"'}
+    )
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime
 from backend.database import get_db
-from backend import models
+from backend import models, repository
 from pydantic import BaseModel
 
 public_router = APIRouter(
@@ -26,9 +26,7 @@ def verify_prescription_publicly(uuid: str, db: Session = Depends(get_db)):
     import logging
     logging.getLogger(__name__).info(f"Public Verification Attempt: {uuid}")
     
-    verification = db.query(models.PrescriptionVerification).filter(
-        models.PrescriptionVerification.uuid == uuid
-    ).first()
+    verification = repository.find_verification(db, uuid)
     
     if not verification:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.database import get_db
+from backend.dependencies import get_current_user
+from backend.services.sync_service import SyncService, SyncTokenExpired
+
+router = APIRouter(
+    prefix="/api/sync",
+    tags=["Sync"]
+)
+
+
+@router.get("")
+def get_changes(
+    since: int = Query(0, ge=0, description="next_token from the previous sync (0 = full snapshot)"),
+    limit: int = Query(SyncService.DEFAULT_LIMIT, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Delta sync: patients, consultations, backgrounds, clinical records and
+    verifications created, updated or deleted since `since`.
+
+    Returns {"next_token", "has_more", "full", "changes": {entity: {"upserts", "deletes"}}}.
+    Keep calling with next_token while has_more is true. A token older than
+    the retained change log gets 410 Gone: resync from since=0.
+    """
+    if since == 0:
+        return SyncService.snapshot(db, current_user.email)
+    try:
+        return SyncService.delta(db, current_user.email, since, limit)
+    except SyncTokenExpired as exc:
+        raise HTTPException(status_code=410, detail=str(exc))
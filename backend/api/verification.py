@@ -1,7 +1,7 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from backend import models
-from database import get_db
+from backend import models, repository
+from backend.database import get_db
 import datetime
 
 router = APIRouter(
@@ -25,9 +25,7 @@ async def verify_prescription(
         Datos pÃºblicos de verificaciÃ³n
     """
     # Buscar registro de verificaciÃ³n
-    verification = db.query(models.PrescriptionVerification).filter(
-        models.PrescriptionVerification.uuid == verification_uuid
-    ).first()
+    verification = repository.find_verification(db, verification_uuid)
     
     if not verification:
         raise HTTPException(status_code=404, detail="Receta no encontrada o invÃ¡lida")
@@ -50,6 +48,7 @@ async def verify_prescription(
 @router.get("/{verification_uuid}/pdf")
 async def download_prescription_pdf(
     verification_uuid: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
@@ -57,6 +56,7 @@ async def download_prescription_pdf(
     
     - **verification_uuid**: UUID de la verificaciÃ³n
     - **Sin autenticaciÃ³n**: Accesible para pacientes
+    - Soporta If-None-Match (304) y Range (206) para visores que reanudan
     
     Returns:
         PDF file (application/pdf)
@@ -64,15 +64,11 @@ async def download_prescription_pdf(
     Raises:
         404: Receta no encontrada
     """
-    from fastapi.responses import Response
-    from services.pdf_service import PDFService
-    import tempfile
-    import os
+    from backend.api.consultations import prescription_pdf_response
+    from backend.services.render_pool import RenderTimeout
     
     # 1. Buscar verificaciÃ³n
-    verification = db.query(models.PrescriptionVerification).filter(
-        models.PrescriptionVerification.uuid == verification_uuid
-    ).first()
+    verification = repository.find_verification(db, verification_uuid)
     
     if not verification:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
@@ -85,41 +81,18 @@ async def download_prescription_pdf(
     if not consultation:
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
     
-    # 3. Obtener mapa del mÃ©dico (si existe)
-    prescription_map = db.query(models.PrescriptionMap).filter(
-        models.PrescriptionMap.doctor_id == verification.doctor_email,
-        models.PrescriptionMap.is_active == True
-    ).first()
-    
-    # 4. Generar PDF
-    if prescription_map:
-        # Con coordenadas personalizadas
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-            pdf_bytes = PDFService.generate_with_coordinates(
-                consultation, 
-                prescription_map, 
-                tmp.name,
-                db=db
-            )
-            # Cleanup temp file
-            try:
-                os.unlink(tmp.name)
-            except:
-                pass
-    else:
-        # Template estÃ¡ndar
-        pdf_bytes = PDFService.generate_with_template(consultation)
-    
-    # 5. Incrementar contador de descargas
-    verification.scanned_count += 1
-    db.commit()
-    
-    # 6. Retornar PDF
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"inline; filename=receta_{verification.doctor_name.replace(' ', '_')}.pdf"
-        }
-    )
-
+    # 3. PDF desde la cache (misma ruta cacheada que el endpoint autenticado)
+    try:
+        response = await prescription_pdf_response(
+            request, consultation, verification.doctor_email, db,
+            f"inline; filename=receta_{verification.doctor_name.replace(' ', '_')}.pdf"
+        )
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="La generación del PDF excedió el tiempo límite")
+    
+    # 4. Incrementar contador de descargas (no en 304 ni en reanudaciones por Range)
+    if response.status_code == 200 and "range" not in request.headers:
+        verification.scanned_count += 1
+        db.commit()
+    
+    return response
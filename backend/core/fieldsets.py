@@ -0,0 +1,63 @@
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Sparse fieldsets (?fields=a,b,c)
+# Each endpoint declares which public fields it accepts and which model
+# columns back them, so the selection becomes a SQL projection (load_only)
+# instead of loading the full row and filtering the JSON afterwards.
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Returns the requested field names (ordered, de-duplicated, `id` first)
+    or None when the client wants the full representation.
+    """
+    if not fields:
+        return None
+
+    allowed = list(allowed)
+    requested = []
+    for name in fields.split(","):
+        name = name.strip()
+        if name and name not in requested:
+            requested.append(name)
+
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+
+    if "id" in allowed and "id" not in requested:
+        requested.insert(0, "id")
+    return requested or None
+
+
+def columns_for(model, names: List[str], sources: Optional[Dict[str, List[str]]] = None) -> list:
+    """
+    Maps public field names to mapped columns of `model`.
+    `sources` overrides fields that are computed from other columns
+    (e.g. full_name -> nombre, apellido_paterno, apellido_materno);
+    an empty list means the field needs no column.
+    """
+    sources = sources or {}
+    columns = []
+    for name in names:
+        for column_name in sources.get(name, [name]):
+            column = getattr(model, column_name)
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def project(obj, names: List[str]) -> dict:
+    return {name: getattr(obj, name) for name in names}
+
+
+def sparse_response(payload) -> JSONResponse:
+    # Bypasses response_model on purpose: the projection is a strict subset of it
+    return JSONResponse(content=jsonable_encoder(payload))
@@ -0,0 +1,185 @@
+import datetime
+import hashlib
+import json
+from email.utils import format_datetime, parsedate_to_datetime
+import os
+import re
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+# PHI must never land in shared caches (proxies/CDN). "private, no-cache" lets
+# the browser keep a copy but forces revalidation, which is answered with a
+# 304 after a version lookup instead of a full serialization.
+PHI_CACHE_CONTROL = "private, no-cache"
+# Non-clinical, per-doctor settings (feature flags) can be reused briefly.
+SETTINGS_CACHE_CONTROL = "private, max-age=60"
+
+
+def weak_etag(*parts) -> str:
+    """
+    Builds a weak validator from version parts (ids, updated_at, content).
+    """
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def strong_etag(*parts) -> str:
+    """
+    Strong validator for byte-identical artifacts (rendered PDFs). Only a
+    strong ETag lets clients resume a download with If-Range.
+    """
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return '"%s"' % hashlib.sha1(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def content_etag(payload) -> str:
+    """
+    Weak validator for small JSON payloads that have no version column.
+    """
+    return weak_etag(json.dumps(payload, sort_keys=True, default=str))
+
+
+def http_date(value: Optional[datetime.datetime]) -> Optional[str]:
+    # DB timestamps are naive UTC (datetime.utcnow)
+    if not value:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return format_datetime(value, usegmt=True)
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(
+    request: Request,
+    etag: str,
+    last_modified: Optional[datetime.datetime] = None
+) -> bool:
+    """
+    Weak comparison of If-None-Match (RFC 9110). If-Modified-Since is only
+    consulted when the client sent no If-None-Match.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = {_strip_weak(tag) for tag in if_none_match.split(",")}
+        return _strip_weak(etag) in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        modified = last_modified
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+        # HTTP dates have second resolution
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+def has_validators(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def set_cache_headers(
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime.datetime] = None,
+    cache_control: str = PHI_CACHE_CONTROL
+) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    # Responses differ per doctor (Bearer token)
+    response.headers["Vary"] = "Authorization"
+    modified = http_date(last_modified)
+    if modified:
+        response.headers["Last-Modified"] = modified
+
+
+def not_modified_response(
+    etag: str,
+    last_modified: Optional[datetime.datetime] = None,
+    cache_control: str = PHI_CACHE_CONTROL
+) -> Response:
+    response = Response(status_code=304)
+    set_cache_headers(response, etag, last_modified, cache_control)
+    return response
+
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def byte_range(request: Request, etag: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single `Range: bytes=` request as an inclusive (start, end). None serves
+    the whole body: no Range, an If-Range that no longer matches, or a
+    multi-range/unparseable header (a full 200 is always a valid answer).
+    Raises ValueError when the range starts past the end (416).
+    """
+    header = request.headers.get("range")
+    if not header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and (if_range.strip() != etag or etag.startswith("W/")):
+        return None
+    match = _RANGE.match(header.strip().replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1  # suffix: last N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def artifact_response(
+    request: Request,
+    etag: str,
+    media_type: str,
+    path: Optional[str] = None,
+    data: Optional[bytes] = None,
+    headers: Optional[dict] = None,
+    cache_control: str = PHI_CACHE_CONTROL
+) -> Response:
+    """
+    Cached artifact with its validator and byte-range support. A file on
+    disk is streamed in chunks by FileResponse (which answers Range and
+    If-Range itself); bytes only held in memory are sliced here.
+    """
+    response_headers = dict(headers or {})
+    response_headers["Accept-Ranges"] = "bytes"
+    if path and os.path.exists(path):
+        response = FileResponse(path, media_type=media_type, headers=response_headers)
+        set_cache_headers(response, etag, cache_control=cache_control)
+        return response
+
+    data = data or b""
+    try:
+        requested = byte_range(request, etag, len(data))
+    except ValueError:
+        response = Response(status_code=416, headers={"Content-Range": "bytes */%d" % len(data)})
+        set_cache_headers(response, etag, cache_control=cache_control)
+        return response
+
+    if requested is None:
+        response = Response(content=data, media_type=media_type, headers=response_headers)
+    else:
+        start, end = requested
+        response_headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, len(data))
+        response = Response(content=data[start:end + 1], status_code=206, media_type=media_type,
+                            headers=response_headers)
+    set_cache_headers(response, etag, cache_control=cache_control)
+    return response
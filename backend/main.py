@@ -3,11 +3,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 import os
+from contextlib import asynccontextmanager
 from sqlalchemy import text
 from backend.db_core import engine, Base
+# Font configuration must be in place before anything loads WeasyPrint/pango
+from backend.services import weasy_engine  # noqa: F401
 from backend import auth
 
-from backend.api import user, patients, consultations, audit, doctor, medical_background, maps
+from backend.api import user, patients, consultations, audit, doctor, medical_background, maps, sync, print_jobs, verification
 from backend.api.endpoints import portability
 from backend.api.endpoints import user_deletion
 from backend.api.endpoints import diagnosis
@@ -22,6 +25,7 @@ def run_hotfix_migrations():
 
             conn.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS alergias TEXT;"))
             conn.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS antecedentes_morbidos TEXT;"))
+            conn.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;"))
 
             conn.execute(text("ALTER TABLE clinical_consultations ADD COLUMN IF NOT EXISTS peso_kg FLOAT;"))
             conn.execute(text("ALTER TABLE clinical_consultations ADD COLUMN IF NOT EXISTS estatura_cm FLOAT;"))
@@ -45,18 +49,61 @@ def run_hotfix_migrations():
     except Exception as e:
         print(f"HOTFIX MIGRATION ERROR: {e}")
 
+def run_verification_compaction():
+    # Duplicados de prescription_verifications -> un registro por consulta + indice unico
+    from backend.database import SessionLocal
+    from backend.services.verification_compaction import ensure_unique_constraint
+
+    db = SessionLocal()
+    try:
+        print(f"HOTFIX: Verification compaction {ensure_unique_constraint(db)}")
+    except Exception as e:
+        db.rollback()
+        print(f"HOTFIX VERIFICATION COMPACTION ERROR: {e}")
+    finally:
+        db.close()
+
+def run_change_log_prune():
+    # change_log de /api/sync: se descartan filas fuera de SYNC_RETENTION_DAYS
+    from backend.database import SessionLocal
+    from backend.services.sync_service import SyncService
+
+    db = SessionLocal()
+    try:
+        print(f"HOTFIX: Change log pruned {SyncService.prune(db)} rows")
+    except Exception as e:
+        db.rollback()
+        print(f"HOTFIX CHANGE LOG PRUNE ERROR: {e}")
+    finally:
+        db.close()
+
 if not os.environ.get("PYTEST_CURRENT_TEST") and not os.environ.get("TESTING"):
     Base.metadata.create_all(bind=engine)
     run_hotfix_migrations()
+    run_verification_compaction()
+    run_change_log_prune()
     
     # Initialize Firebase Admin
     from backend.core.firebase_app import initialize_firebase
     initialize_firebase()
 
+# -------------------------------------------------------------------
+# Startup warm-up / shutdown
+# -------------------------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from backend.services.template_registry import template_registry
+    from backend.services.render_pool import render_pool
+
+    print(f"Templates precompiled: {template_registry.warm()}")
+    print(f"PDF render pool warm: {await render_pool.warm()}")
+    yield
+    render_pool.shutdown()
+
 # -------------------------------------------------------------------
 # FastAPI App
 # -------------------------------------------------------------------
-app = FastAPI(title="Vitalinuage API")
+app = FastAPI(title="Vitalinuage API", lifespan=lifespan)
 
 # -------------------------------------------------------------------
 # CORS
@@ -102,7 +149,9 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(user.router, prefix="/api/users", tags=["Users"])
 app.include_router(patients.router, prefix="/api/patients", tags=["Patients"])
 app.include_router(consultations.router)
+app.include_router(print_jobs.router)
 app.include_router(consultations.verification_router)
+app.include_router(verification.router)
 app.include_router(audit.router, prefix="/api/audit", tags=["Audit"])
 app.include_router(doctor.router, prefix="/api/doctors", tags=["Doctor"])
 app.include_router(maps.router)
@@ -110,11 +159,24 @@ app.include_router(medical_background.router, prefix="/api/medical-background",
 app.include_router(diagnosis.router)
 app.include_router(portability.router)
 app.include_router(user_deletion.router, tags=["Security"])
+app.include_router(sync.router)
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "READY", "db": "connected"}
 
+@app.get("/api/health/render")
+async def render_health():
+    # Contadores del pool de render y de las caches de PDF (sin datos de pacientes)
+    from backend.services.render_pool import render_pool
+    from backend.services.pdf_cache import pdf_cache
+    from backend.services import pdf_profile
+    return {
+        "render_pool": render_pool.metrics(),
+        "pdf_cache": dict(pdf_cache.stats),
+        "renders_by_profile": {key: dict(value) for key, value in pdf_profile.render_stats.items()},
+    }
+
 # -------------------------------------------------------------------
 # Frontend (Vite) – Static Files + SPA fallback
 # -------------------------------------------------------------------
@@ -70,6 +70,9 @@ class Patient(Base):
     # Multitenancy
     owner_id = Column(String, index=True, nullable=False)
 
+    # Row version for HTTP conditional requests (ETag / Last-Modified)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
     # Relationships
     medical_background = relationship("MedicalBackground", back_populates="patient", uselist=False, cascade="all, delete-orphan")
 
@@ -187,6 +190,26 @@ class PrescriptionVerification(Base):
     # Relationships
     consultation = relationship("ClinicalConsultation", back_populates="verification")
 
+    # One verification per consultation; duplicates are merged by
+    # services/verification_compaction.py (old uuids become aliases)
+    __table_args__ = (
+        UniqueConstraint('consultation_id', name='uix_prescription_verification_consultation'),
+    )
+
+
+class PrescriptionVerificationAlias(Base):
+    """
+    uuid of a duplicate verification merged into another one. Keeps QR codes
+    already printed with that uuid resolving to the surviving record.
+    """
+    __tablename__ = "prescription_verification_aliases"
+
+    uuid = Column(String, primary_key=True)
+    verification_id = Column(Integer, ForeignKey("prescription_verifications.id"), index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    verification = relationship("PrescriptionVerification")
+
 class ClinicalRecord(Base):
     """
     New Slice 17.0 Clinical Record (Ficha Clínica).
@@ -213,6 +236,45 @@ Patient.clinical_record = relationship("ClinicalRecord", back_populates="patient
 
 
 
+class ChangeLog(Base):
+    """
+    Append-only change feed for delta sync (/api/sync).
+    The autoincrement id is the monotonic change token; op="delete" rows
+    are the tombstones of removed entities.
+    """
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(String, index=True, nullable=False)
+    entity = Column(String, nullable=False)      # patients, consultations, backgrounds, ...
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)          # upsert | delete
+    changed_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class PrintJob(Base):
+    """
+    Batch print job (services/print_jobs.py). Kept in the database so every
+    instance can answer status and download requests; the output file sits
+    in Storage at output_bucket/output_path (local path if no bucket).
+    """
+    __tablename__ = "print_jobs"
+
+    id = Column(String, primary_key=True)       # uuid4 hex
+    owner_id = Column(String, index=True, nullable=False)
+    consultation_ids = Column(JSON, nullable=False)
+    format = Column(String, nullable=False)     # pdf | zip
+    status = Column(String, nullable=False, default="queued")  # queued | running | done | failed
+    done = Column(Integer, nullable=False, default=0)
+    failed_ids = Column(JSON, default=list)
+    error = Column(String, nullable=True)
+    output_bucket = Column(String, nullable=True)
+    output_path = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class Prescription(Base):
     """
     Stub for Prescription model to satisfy doctor.py import.
@@ -0,0 +1,317 @@
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import desc
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
+
+from backend import models
+
+
+# -------------------------------------------------------------------
+# Typed "not found" errors
+# -------------------------------------------------------------------
+# Raised as 404 so a missing row and a row owned by another doctor look
+# identical to the caller (prevents enumeration).
+
+class TenantNotFound(HTTPException):
+    default_detail = "Not found"
+
+    def __init__(self, detail: Optional[str] = None):
+        super().__init__(status_code=404, detail=detail or self.default_detail)
+
+
+class PatientNotFound(TenantNotFound):
+    default_detail = "Patient not found"
+
+
+class ConsultationNotFound(TenantNotFound):
+    default_detail = "Consultation not found"
+
+
+# -------------------------------------------------------------------
+# Patients
+# -------------------------------------------------------------------
+
+def _owned_patients(db: Session, owner_id: str, patient_id: int):
+    return db.query(models.Patient).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    )
+
+
+def get_patient(
+    db: Session, owner_id: str, patient_id: int, columns: Optional[list] = None
+) -> models.Patient:
+    """
+    `columns` restricts the SELECT to those columns (sparse fieldsets).
+    """
+    query = _owned_patients(db, owner_id, patient_id)
+    if columns:
+        query = query.options(load_only(*columns))
+    patient = query.first()
+    if not patient:
+        raise PatientNotFound()
+    return patient
+
+
+def ensure_patient(db: Session, owner_id: str, patient_id: int) -> int:
+    """
+    Cheap ownership check for writes: selects only the primary key.
+    """
+    row = db.query(models.Patient.id).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).first()
+    if not row:
+        raise PatientNotFound()
+    return row[0]
+
+
+def get_patient_version(db: Session, owner_id: str, patient_id: int):
+    """
+    Version lookup for conditional GETs: selects only updated_at.
+    """
+    row = db.query(models.Patient.updated_at).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).first()
+    if not row:
+        raise PatientNotFound()
+    return row[0]
+
+
+def _child_version(db: Session, owner_id: str, patient_id: int, child_model):
+    row = db.query(models.Patient.id, child_model.updated_at).outerjoin(
+        child_model,
+        child_model.patient_id == models.Patient.id
+    ).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).first()
+    if not row:
+        raise PatientNotFound()
+    return row[1]
+
+
+def get_clinical_record_version(db: Session, owner_id: str, patient_id: int):
+    """updated_at of the patient's clinical record (None if not created yet)."""
+    return _child_version(db, owner_id, patient_id, models.ClinicalRecord)
+
+
+def get_background_version(db: Session, owner_id: str, patient_id: int):
+    """updated_at of the patient's medical background (None if not created yet)."""
+    return _child_version(db, owner_id, patient_id, models.MedicalBackground)
+
+
+def _in_request_order(rows, ids: List[int]) -> list:
+    by_id = {row.id: row for row in rows}
+    seen = set()
+    ordered = []
+    for entity_id in ids:
+        if entity_id in by_id and entity_id not in seen:
+            seen.add(entity_id)
+            ordered.append(by_id[entity_id])
+    return ordered
+
+
+def get_patients_by_ids(db: Session, owner_id: str, ids: List[int]) -> List[models.Patient]:
+    """
+    Batch read: one tenant-scoped IN (...) query. Foreign or missing ids are
+    simply absent from the result, which keeps the requested order.
+    """
+    rows = db.query(models.Patient).filter(
+        models.Patient.id.in_(set(ids)),
+        models.Patient.owner_id == owner_id
+    ).all()
+    return _in_request_order(rows, ids)
+
+
+def get_patient_with_clinical_record(
+    db: Session, owner_id: str, patient_id: int
+) -> Tuple[models.Patient, Optional[models.ClinicalRecord]]:
+    """
+    Single statement: patient LEFT JOIN clinical_records, tenant-scoped.
+    The record is None when the patient has none yet.
+    """
+    row = db.query(models.Patient, models.ClinicalRecord).outerjoin(
+        models.ClinicalRecord,
+        models.ClinicalRecord.patient_id == models.Patient.id
+    ).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).first()
+    if not row:
+        raise PatientNotFound()
+    return row[0], row[1]
+
+
+def get_patient_with_background(
+    db: Session, owner_id: str, patient_id: int
+) -> Tuple[models.Patient, Optional[models.MedicalBackground]]:
+    """
+    Single statement: patient LEFT JOIN medical_backgrounds, tenant-scoped.
+    """
+    row = db.query(models.Patient, models.MedicalBackground).outerjoin(
+        models.MedicalBackground,
+        models.MedicalBackground.patient_id == models.Patient.id
+    ).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).first()
+    if not row:
+        raise PatientNotFound()
+    return row[0], row[1]
+
+
+def list_patient_consultations(
+    db: Session,
+    owner_id: str,
+    patient_id: int,
+    columns: Optional[list] = None,
+    with_verification: bool = False
+) -> List[models.ClinicalConsultation]:
+    """
+    Single statement: patient LEFT JOIN clinical_consultations, tenant-scoped.
+    No rows means the patient is missing or foreign; one row with a NULL
+    consultation means the patient exists but has no visits yet.
+    `columns` projects the consultation columns (sparse fieldsets);
+    `with_verification` batch-loads dispatch timestamps instead of one lazy
+    load per row.
+    """
+    query = db.query(models.Patient.id, models.ClinicalConsultation).outerjoin(
+        models.ClinicalConsultation,
+        models.ClinicalConsultation.patient_id == models.Patient.id
+    ).filter(
+        models.Patient.id == patient_id,
+        models.Patient.owner_id == owner_id
+    ).order_by(desc(models.ClinicalConsultation.created_at))
+    if columns:
+        query = query.options(load_only(*columns))
+    if with_verification:
+        query = query.options(selectinload(models.ClinicalConsultation.verification))
+    rows = query.all()
+    if not rows:
+        raise PatientNotFound()
+    return [consultation for _, consultation in rows if consultation is not None]
+
+
+def iter_patient_consultations(
+    db: Session,
+    owner_id: str,
+    patient_id: int,
+    batch_size: int = 50
+) -> Iterator[models.ClinicalConsultation]:
+    """
+    Same history as list_patient_consultations (newest first, tenant-scoped)
+    but fetched `batch_size` rows at a time, for exports that must not load
+    every visit at once. Ownership is checked by the caller.
+    """
+    yield from db.query(models.ClinicalConsultation).filter(
+        models.ClinicalConsultation.patient_id == patient_id,
+        models.ClinicalConsultation.owner_id == owner_id
+    ).order_by(
+        desc(models.ClinicalConsultation.created_at), desc(models.ClinicalConsultation.id)
+    ).yield_per(batch_size)
+
+
+# -------------------------------------------------------------------
+# Consultations
+# -------------------------------------------------------------------
+
+def get_consultation(
+    db: Session,
+    owner_id: str,
+    consultation_id: int,
+    with_patient: bool = False,
+    detail: Optional[str] = None
+) -> models.ClinicalConsultation:
+    """
+    Tenant-scoped consultation lookup. `with_patient` joins the patient in
+    the same statement for callers that render names (PDF, email).
+    """
+    query = db.query(models.ClinicalConsultation).filter(
+        models.ClinicalConsultation.id == consultation_id,
+        models.ClinicalConsultation.owner_id == owner_id
+    )
+    if with_patient:
+        query = query.options(joinedload(models.ClinicalConsultation.patient))
+    consultation = query.first()
+    if not consultation:
+        raise ConsultationNotFound(detail)
+    return consultation
+
+
+def get_consultations_by_ids(
+    db: Session, owner_id: str, ids: List[int]
+) -> List[models.ClinicalConsultation]:
+    """
+    Batch read: one tenant-scoped IN (...) query plus a batched load of the
+    verification rows (dispatch timestamps).
+    """
+    rows = db.query(models.ClinicalConsultation).filter(
+        models.ClinicalConsultation.id.in_(set(ids)),
+        models.ClinicalConsultation.owner_id == owner_id
+    ).options(selectinload(models.ClinicalConsultation.verification)).all()
+    return _in_request_order(rows, ids)
+
+
+# -------------------------------------------------------------------
+# Prescription verifications
+# -------------------------------------------------------------------
+
+def find_verification(db: Session, verification_uuid: str) -> Optional[models.PrescriptionVerification]:
+    """
+    Public uuid lookup. Falls back to the aliases left by the duplicate
+    compaction, so QR codes printed before the merge keep resolving.
+    """
+    verification = db.query(models.PrescriptionVerification).filter(
+        models.PrescriptionVerification.uuid == verification_uuid
+    ).first()
+    if verification is not None:
+        return verification
+    return db.query(models.PrescriptionVerification).join(
+        models.PrescriptionVerificationAlias,
+        models.PrescriptionVerificationAlias.verification_id == models.PrescriptionVerification.id
+    ).filter(models.PrescriptionVerificationAlias.uuid == verification_uuid).first()
+
+
+def get_or_create_verification(
+    db: Session,
+    consultation_id: int,
+    doctor_email: str,
+    doctor_name: Optional[str] = None
+) -> models.PrescriptionVerification:
+    """
+    The consultation's single verification record, created on first use.
+    A concurrent insert loses on the unique constraint and reads the winner.
+    """
+    import datetime
+    import uuid as uuid_lib
+    from sqlalchemy.exc import IntegrityError
+
+    query = db.query(models.PrescriptionVerification).filter(
+        models.PrescriptionVerification.consultation_id == consultation_id
+    )
+    verification = query.first()
+    if verification is not None:
+        return verification
+
+    if doctor_name is None:
+        doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
+        doctor_name = doctor.professional_name if doctor and doctor.professional_name else None
+
+    verification = models.PrescriptionVerification(
+        uuid=str(uuid_lib.uuid4()),
+        consultation_id=consultation_id,
+        doctor_email=doctor_email,
+        doctor_name=doctor_name or "Dr. Vitalinuage",
+        issue_date=datetime.datetime.utcnow()
+    )
+    db.add(verification)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return query.one()
+    db.refresh(verification)
+    return verification
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+# Upper bound for batch reads: keeps the IN (...) list and the payload small
+BATCH_MAX_IDS = 100
+
+class BatchIdsRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_IDS)
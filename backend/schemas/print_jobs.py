@@ -0,0 +1,39 @@
+from datetime import date, datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+# Upper bound for one print job (a long clinic day with margin)
+PRINT_JOB_MAX_ITEMS = 300
+# The merged PDF keeps every page in memory until it is written (pypdf);
+# ZIP output is written entry by entry and may use the full limit
+PRINT_JOB_MAX_MERGED_ITEMS = 100
+
+
+class PrintJobRequest(BaseModel):
+    """Either explicit consultation ids or a date range (inclusive)."""
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=PRINT_JOB_MAX_ITEMS)
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    format: Literal["pdf", "zip"] = "pdf"
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if (self.ids is None) == (self.date_from is None):
+            raise ValueError("Provide either ids or date_from (with optional date_to)")
+        if self.date_to is not None and self.date_from is not None and self.date_to < self.date_from:
+            raise ValueError("date_to must not be before date_from")
+        return self
+
+
+class PrintJobStatus(BaseModel):
+    id: str
+    status: Literal["queued", "running", "done", "failed"]
+    format: str
+    total: int
+    done: int
+    failed_ids: List[int] = []
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
@@ -0,0 +1,98 @@
+"""
+Compares the PDF output profiles (services/pdf_profile.py) on the A5 recipe:
+size, render time and whether two renders give identical bytes.
+
+    python -m backend.scripts.benchmark_pdf_profiles [--runs 20] [--no-images]
+
+The native ReportLab recipe is always measured; the letterhead + overlay and
+HTML paths only where WeasyPrint can load (Pango/Cairo installed).
+Signature and logo are synthetic 300 DPI print derivatives, the size of a
+scanned signature and a photographed logo.
+"""
+import argparse
+import base64
+import io
+import statistics
+import time
+
+from backend.services import native_recipe, pdf_profile, stationery, weasy_engine
+from backend.services.image_derivatives import box_pixels, make_print_derivative
+from backend.services.pdf_service import PDFService
+from backend.services.print_preview import sample_consultation
+
+
+def synthetic_scan(kind: str) -> bytes:
+    from PIL import Image, ImageDraw, ImageFilter
+
+    width, height = box_pixels(kind)
+    image = Image.effect_noise((width, height), 24).convert("RGB").point(lambda value: 200 + value // 5)
+    draw = ImageDraw.Draw(image)
+    for step in range(0, width, 9):
+        draw.line((step, height * 0.7, step + 40, height * 0.3), fill=(20, 40, 120), width=4)
+    buffer = io.BytesIO()
+    image.filter(ImageFilter.SMOOTH).save(buffer, format="PNG")
+    return make_print_derivative(buffer.getvalue(), kind)
+
+
+def _template_args(images: bool) -> dict:
+    signature = logo = None
+    if images:
+        signature = base64.b64encode(pdf_profile.optimize_image(synthetic_scan("signature"), "signature")).decode("ascii")
+        logo = base64.b64encode(pdf_profile.optimize_image(synthetic_scan("logo"), "logo")).decode("ascii")
+    return {
+        "verification_uuid": "00000000-0000-0000-0000-000000000000",
+        "signature_base64": signature,
+        "logo_base64": logo,
+        "footer_text": "Av. Siempre Viva 742 - Lunes a viernes de 9 a 18 h",
+    }
+
+
+def _strategies():
+    def context(args):
+        return PDFService.prescription_context(sample_consultation(), **args)
+
+    strategies = {"native": lambda args: native_recipe.render(context(args))}
+    if weasy_engine.warm_up():
+        strategies["stationery"] = lambda args: stationery.merge_overlay(
+            stationery.build_stationery(context(args)), stationery.render_overlay(context(args))
+        )
+        strategies["html"] = lambda args: PDFService.generate_from_html_file(sample_consultation(), **args)
+    return strategies
+
+
+def run(runs: int, images: bool) -> list:
+    rows = []
+    for strategy, render in _strategies().items():
+        for name in pdf_profile.PROFILES:
+            with pdf_profile.using(name):
+                args = _template_args(images)
+                first = render(args)  # fonts, images and engines warm
+                timings = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    last = render(args)
+                    timings.append(time.perf_counter() - started)
+            rows.append({
+                "strategy": strategy,
+                "profile": name,
+                "bytes": len(last),
+                "median_ms": round(statistics.median(timings) * 1000, 1),
+                "deterministic": first == last,
+            })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--no-images", action="store_true", help="recipe without signature and logo")
+    args = parser.parse_args()
+
+    rows = run(args.runs, not args.no_images)
+    print(f"{'strategy':<12}{'profile':<10}{'bytes':>10}{'median ms':>12}  deterministic")
+    for row in rows:
+        print(f"{row['strategy']:<12}{row['profile']:<10}{row['bytes']:>10}{row['median_ms']:>12}  {row['deterministic']}")
+
+
+if __name__ == "__main__":
+    main()
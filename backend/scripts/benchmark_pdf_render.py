@@ -0,0 +1,382 @@
+"""
+Render benchmark for the prescription PDF engines, offline.
+
+    python -m backend.scripts.benchmark_pdf_render [--runs 10] [--no-cold]
+        [--engines coordinates,native] [--variants none,full]
+        [--output report.json] [--compare baseline.json]
+
+Engines: generate_with_coordinates, generate_with_template (minimal,
+modern, classic), generate_from_html_file and the native ReportLab recipe.
+Variants add signature, logo and QR alone, and all of them ("full": all
+an engine can draw); a single feature an engine cannot draw (a logo on a
+coordinate map, a QR on the legacy templates) is left out.
+
+- cold: first render in a fresh process (template compilation, font
+  loading and engine start-up included), one process per scenario.
+- warm: `--runs` renders after a warm-up; median, p95 and min wall time,
+  plus the tracemalloc peak of one extra traced render.
+
+Storage is stubbed with synthetic 300 DPI derivatives and the database is
+an in-memory SQLite, so no network or credentials are needed. Engines that
+cannot load (WeasyPrint without Pango/Cairo) are reported as skipped.
+The JSON report is meant to be kept per commit and passed to `--compare`.
+"""
+import argparse
+import base64
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+REPORT_VERSION = 1
+TEMPLATES = ("minimal", "modern", "classic")
+ENGINES = ("coordinates", *(f"template:{name}" for name in TEMPLATES), "html", "native")
+VARIANTS: Dict[str, tuple] = {
+    "none": (),
+    "signature": ("signature",),
+    "logo": ("logo",),
+    "qr": ("qr",),
+    "full": ("signature", "logo", "qr"),
+}
+# What each engine can draw
+FEATURES = {
+    "coordinates": {"signature", "qr"},
+    "template": {"signature", "logo"},
+    "html": {"signature", "logo", "qr"},
+    "native": {"signature", "logo", "qr"},
+}
+VERIFICATION_UUID = "00000000-0000-4000-8000-000000000000"
+SIGNATURE_PATH = "signatures/benchmark.png"
+LOGO_PATH = "logos/benchmark.png"
+
+
+def features(engine: str, variant: str) -> Optional[tuple]:
+    """Features the scenario draws; "full" is everything the engine can. None: not applicable."""
+    available = FEATURES[engine.split(":")[0]]
+    if variant == "full":
+        return tuple(name for name in VARIANTS[variant] if name in available)
+    return VARIANTS[variant] if set(VARIANTS[variant]) <= available else None
+
+
+class Fixture:
+    """One doctor, patient and consultation plus coordinate maps, with storage stubbed."""
+
+    def __init__(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from backend import models
+        from backend.db_core import Base
+        from backend.scripts.benchmark_pdf_profiles import synthetic_scan
+        from backend.services.pdf_service import PDFService
+
+        assets = {
+            SIGNATURE_PATH: synthetic_scan("signature"),
+            LOGO_PATH: synthetic_scan("logo"),
+        }
+        self._storage_asset = PDFService.__dict__["storage_asset"]
+        PDFService.storage_asset = staticmethod(lambda storage_value: SimpleNamespace(
+            data=assets[storage_value], generation="1",
+            base64=base64.b64encode(assets[storage_value]).decode("ascii"),
+        ) if storage_value in assets else None)
+
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+        doctor = models.User(email="benchmark@example.com", hashed_password="-", is_verified=True,
+                             professional_name="Dra. Benchmark", specialty="Medicina General",
+                             signature_image=SIGNATURE_PATH, print_logo_path=LOGO_PATH)
+        patient = models.Patient(nombre="Paciente", apellido_paterno="de Prueba", dni="12.345.678-9",
+                                 fecha_nacimiento="1984-01-01", owner_id=doctor.email)
+        self.db.add_all([doctor, patient])
+        self.db.commit()
+        self.consultation = models.ClinicalConsultation(
+            patient_id=patient.id, owner_id=doctor.email, motivo_consulta="Control anual",
+            diagnostico="Rinitis alérgica estacional",
+            plan_tratamiento="Loratadina 10 mg, 1 comprimido al día por 10 días.\n"
+                             "Lavados nasales con suero fisiológico 2 veces al día.\n"
+                             "Control en 3 semanas o antes si presenta fiebre.",
+        )
+        self.db.add(self.consultation)
+        self.db.commit()
+
+        fields = [
+            {"field_key": "patient_name", "x_mm": 20, "y_mm": 40, "font_size": 11},
+            {"field_key": "patient_dni", "x_mm": 100, "y_mm": 40, "font_size": 11},
+            {"field_key": "date", "x_mm": 100, "y_mm": 30, "font_size": 10},
+            {"field_key": "diagnosis", "x_mm": 20, "y_mm": 55, "font_size": 10},
+            {"field_key": "treatment", "x_mm": 20, "y_mm": 70, "font_size": 10},
+        ]
+        self.maps = {}
+        for name, extra in (("plain", []), ("signature", ["doctor_signature"]), ("qr", ["qr_code"]),
+                            ("signature+qr", ["doctor_signature", "qr_code"])):
+            config = fields + [{"field_key": key, "x_mm": 90 if key == "doctor_signature" else 15,
+                                "y_mm": 150 if key == "doctor_signature" else 175,
+                                "max_width_mm": 40 if key == "doctor_signature" else 22} for key in extra]
+            self.maps[name] = models.PrescriptionMap(doctor_id=doctor.email, name=name, fields_config=config)
+            self.db.add(self.maps[name])
+        self.db.commit()
+
+        self.signature_bytes = assets[SIGNATURE_PATH]
+        self.signature_base64 = base64.b64encode(assets[SIGNATURE_PATH]).decode("ascii")
+        self.logo_base64 = base64.b64encode(assets[LOGO_PATH]).decode("ascii")
+
+    def close(self) -> None:
+        from backend.services.pdf_service import PDFService
+
+        PDFService.storage_asset = self._storage_asset
+        self.db.close()
+
+    def renderer(self, engine: str, variant: str) -> Callable[[], bytes]:
+        from backend.services import native_recipe
+        from backend.services.pdf_service import PDFService
+
+        drawn = features(engine, variant) or ()
+        signature = self.signature_base64 if "signature" in drawn else None
+        logo = self.logo_base64 if "logo" in drawn else None
+        uuid = VERIFICATION_UUID if "qr" in drawn else ""
+
+        if engine == "coordinates":
+            key = "+".join(name for name in ("signature", "qr") if name in drawn) or "plain"
+            prescription_map = self.maps[key]
+            return lambda: PDFService.generate_with_coordinates(
+                self.consultation, prescription_map, db=self.db if "qr" in drawn else None,
+                signature_bytes=self.signature_bytes if signature else None,
+            )
+        if engine.startswith("template:"):
+            template_id = engine.split(":", 1)[1]
+            return lambda: PDFService.generate_with_template(
+                self.consultation, template_id, signature_base64=signature, logo_base64=logo
+            )
+        if engine == "html":
+            return lambda: PDFService.generate_from_html_file(
+                self.consultation, verification_uuid=uuid, signature_base64=signature, logo_base64=logo
+            )
+        if engine == "native":
+            return lambda: native_recipe.render(PDFService.prescription_context(
+                self.consultation, verification_uuid=uuid, signature_base64=signature, logo_base64=logo
+            ))
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    from backend.services.render_pool import _peak_rss_bytes
+
+    peak = _peak_rss_bytes()
+    return round(peak / (1024 * 1024), 1) if peak else None
+
+
+def _traced(render: Callable[[], bytes]):
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        pdf_bytes = render()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pdf_bytes, elapsed, peak
+
+
+def measure_cold(engine: str, variant: str) -> dict:
+    """First render of the scenario in this process (run in a fresh one)."""
+    fixture = Fixture()
+    render = fixture.renderer(engine, variant)
+    started = time.perf_counter()
+    pdf_bytes = render()
+    wall = time.perf_counter() - started
+    return {
+        "wall_ms": round(wall * 1000, 2),
+        "rss_peak_mb": _peak_rss_mb(),
+        "bytes": len(pdf_bytes),
+    }
+
+
+def measure_warm(fixture: Fixture, engine: str, variant: str, runs: int) -> dict:
+    render = fixture.renderer(engine, variant)
+    render()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        pdf_bytes = render()
+        timings.append(time.perf_counter() - started)
+    _, _, traced_peak = _traced(render)
+    timings.sort()
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 2),
+        "min_ms": round(timings[0] * 1000, 2),
+        "tracemalloc_peak_kb": round(traced_peak / 1024, 1),
+        "rss_peak_mb": _peak_rss_mb(),
+        "bytes": len(pdf_bytes),
+    }
+
+
+def _cold_child(engine: str, variant: str, queue) -> None:
+    try:
+        queue.put(("ok", measure_cold(engine, variant)))
+    except Exception as exc:
+        queue.put(("error", f"{type(exc).__name__}: {exc}"))
+
+
+def run_cold(engine: str, variant: str, timeout: float = 120.0) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_cold_child, args=(engine, variant, queue))
+    process.start()
+    try:
+        status, payload = queue.get(timeout=timeout)
+    except Exception:
+        status, payload = "error", f"no result within {timeout:g}s"
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+    if status != "ok":
+        raise RuntimeError(payload)
+    return payload
+
+
+def _engine_available(engine: str) -> Optional[str]:
+    """None when the engine can render here, else why it is skipped."""
+    if engine in ("coordinates", "native"):
+        return None
+    from backend.services import weasy_engine
+
+    try:
+        weasy_engine._load_weasyprint()
+    except Exception as exc:
+        return f"WeasyPrint unavailable: {exc}"
+    return None
+
+
+def _run_scenarios(fixture: Fixture, engines, variants, runs: int, cold: bool, results: list) -> None:
+    for engine in engines:
+        unavailable = _engine_available(engine)
+        for variant in variants:
+            drawn = features(engine, variant)
+            if drawn is None:
+                continue
+            entry = {"engine": engine, "variant": variant, "features": list(drawn)}
+            if unavailable:
+                entry.update(status="skipped", reason=unavailable)
+                results.append(entry)
+                continue
+            try:
+                if cold:
+                    entry["cold"] = run_cold(engine, variant)
+                entry["warm"] = measure_warm(fixture, engine, variant, runs)
+                entry["status"] = "ok"
+            except Exception as exc:
+                entry.update(status="error", reason=f"{type(exc).__name__}: {exc}")
+            results.append(entry)
+
+
+def run_suite(engines=ENGINES, variants=tuple(VARIANTS), runs: int = 10, cold: bool = True) -> dict:
+    from backend.services import pdf_profile
+
+    fixture = Fixture()
+    results = []
+    try:
+        _run_scenarios(fixture, engines, variants, runs, cold, results)
+    finally:
+        fixture.close()
+
+    return {
+        "version": REPORT_VERSION,
+        "created_at": datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "output_profile": pdf_profile.active().name,
+        "results": results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+METRICS = (("cold", "wall_ms"), ("warm", "median_ms"), ("warm", "tracemalloc_peak_kb"), ("warm", "bytes"))
+
+
+def compare(report: dict, baseline: dict) -> List[dict]:
+    """Relative change of each metric for scenarios present in both reports."""
+    previous = {(entry["engine"], entry["variant"]): entry for entry in baseline.get("results", [])}
+    rows = []
+    for entry in report["results"]:
+        before = previous.get((entry["engine"], entry["variant"]))
+        if not before or entry.get("status") != "ok" or before.get("status") != "ok":
+            continue
+        for phase, metric in METRICS:
+            old = before.get(phase, {}).get(metric)
+            new = entry.get(phase, {}).get(metric)
+            if old and new is not None:
+                rows.append({
+                    "engine": entry["engine"], "variant": entry["variant"], "metric": f"{phase}.{metric}",
+                    "before": old, "after": new, "change_pct": round((new - old) / old * 100, 1),
+                })
+    return rows
+
+
+def _print_report(report: dict) -> None:
+    print(f"{'engine':<18}{'variant':<11}{'cold ms':>9}{'warm ms':>9}{'p95 ms':>9}{'peak KB':>10}{'RSS MB':>8}{'bytes':>9}")
+    for entry in report["results"]:
+        if entry["status"] != "ok":
+            print(f"{entry['engine']:<18}{entry['variant']:<11}  {entry['status']}: {entry.get('reason', '')[:60]}")
+            continue
+        cold, warm = entry.get("cold", {}), entry["warm"]
+        print(f"{entry['engine']:<18}{entry['variant']:<11}{cold.get('wall_ms', '-'):>9}{warm['median_ms']:>9}"
+              f"{warm['p95_ms']:>9}{warm['tracemalloc_peak_kb']:>10}{str(warm['rss_peak_mb']):>8}{warm['bytes']:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--no-cold", action="store_true", help="skip the fresh-process first renders")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report of a previous run")
+    args = parser.parse_args(argv)
+
+    engines = [name for name in args.engines.split(",") if name]
+    variants = [name for name in args.variants.split(",") if name]
+    for name in engines:
+        if name not in ENGINES:
+            parser.error(f"unknown engine {name!r} (choose from {', '.join(ENGINES)})")
+    for name in variants:
+        if name not in VARIANTS:
+            parser.error(f"unknown variant {name!r} (choose from {', '.join(VARIANTS)})")
+
+    report = run_suite(engines, variants, args.runs, cold=not args.no_cold)
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare(report, json.load(f))
+        print()
+        for row in rows:
+            print(f"{row['engine']:<18}{row['variant']:<11}{row['metric']:<28}"
+                  f"{row['before']:>10} -> {row['after']:>10}  {row['change_pct']:+.1f}%")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
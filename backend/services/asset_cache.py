@@ -0,0 +1,359 @@
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StoredAsset:
+    """A downloaded storage object plus the generation it was downloaded at."""
+
+    __slots__ = ("bucket", "path", "generation", "data", "checked_at", "_base64")
+
+    def __init__(self, bucket: str, path: str, generation: str, data: bytes, checked_at: float):
+        self.bucket = bucket
+        self.path = path
+        self.generation = generation
+        self.data = data
+        self.checked_at = checked_at
+        self._base64: Optional[str] = None
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return self._base64
+
+
+class LocalBlob:
+    def __init__(self, file_path: str):
+        self._file_path = file_path
+        self.generation = None
+        self.etag = None
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            self.generation = str(stat.st_mtime_ns)
+            self.etag = f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def download_as_bytes(self) -> bytes:
+        with open(self._file_path, "rb") as f:
+            return f.read()
+
+    def upload_from_string(self, data: bytes, content_type: Optional[str] = None) -> None:
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        with open(self._file_path, "wb") as f:
+            f.write(data)
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None) -> None:
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type=content_type)
+
+    def delete(self) -> None:
+        os.unlink(self._file_path)
+
+
+class LocalBucket:
+    """
+    Filesystem stand-in for a Firebase Storage bucket (tests / offline dev).
+    Objects live at <root>/<bucket>/<object path>; the mtime is the generation.
+    """
+
+    def __init__(self, root_dir: str, name: str):
+        self.name = name
+        self._root = os.path.join(root_dir, name)
+
+    def blob(self, object_path: str) -> LocalBlob:
+        return LocalBlob(os.path.join(self._root, object_path))
+
+    def get_blob(self, object_path: str) -> Optional[LocalBlob]:
+        blob = self.blob(object_path)
+        return blob if blob.generation is not None else None
+
+
+def firebase_bucket(bucket_name: str):
+    from backend.core.firebase_app import initialize_firebase
+    initialize_firebase()
+    from firebase_admin import storage as firebase_storage
+    return firebase_storage.bucket(bucket_name)
+
+
+class AssetCache:
+    """
+    Memory + disk cache for signature/logo images kept in Firebase Storage.
+
+    Entries are keyed by bucket and object path and remember the object's
+    generation. Within `revalidate_seconds` an entry is served without any
+    remote call; after that one metadata request (get_blob) checks the
+    generation and the bytes are downloaded again only if it changed. If
+    storage is unreachable the last known bytes are served. Missing objects
+    are remembered for the same window (memory only).
+
+    A caller that already knows the current generation passes it as
+    `expected_generation`: an entry (or a missing marker) that does not
+    match is revalidated right away. Render workers rely on this, since
+    profile saves only invalidate the API process's copy. The disk tier is
+    bounded by `disk_max_bytes` (least recently used evicted first).
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes: int,
+        disk_dir: Optional[str],
+        revalidate_seconds: float,
+        bucket_factory: Callable = firebase_bucket,
+        disk_max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.bucket_factory = bucket_factory
+        self._memory: "OrderedDict[str, StoredAsset]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._missing: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidations": 0, "downloads": 0, "errors": 0}
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".bin")
+                )
+            except OSError as exc:
+                logger.warning("Asset disk cache disabled: %s", exc)
+                self.disk_dir = None
+
+    @classmethod
+    def from_env(cls) -> "AssetCache":
+        local_dir = os.getenv("ASSET_STORAGE_LOCAL_DIR")
+        bucket_factory = (lambda name: LocalBucket(local_dir, name)) if local_dir else firebase_bucket
+        return cls(
+            memory_max_bytes=int(float(os.getenv("ASSET_CACHE_MEMORY_MB", "16")) * 1024 * 1024),
+            disk_dir=os.getenv("ASSET_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "vitalinuage-asset-cache"),
+            revalidate_seconds=float(os.getenv("ASSET_CACHE_REVALIDATE_MINUTES", "10")) * 60,
+            bucket_factory=bucket_factory,
+            disk_max_bytes=int(float(os.getenv("ASSET_CACHE_DISK_MB", "64")) * 1024 * 1024),
+        )
+
+    # -------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------
+    def get(self, bucket: str, path: str, expected_generation: Optional[str] = None) -> Optional[StoredAsset]:
+        key = self._key(bucket, path)
+        now = time.time()
+        entry = self._memory_get(key) or self._disk_load(key)
+        if expected_generation is None:
+            fresh = now - (entry.checked_at if entry is not None else self._missing.get(key, float("-inf")))
+            if fresh < self.revalidate_seconds:
+                self.stats["hits"] += 1
+                return entry
+        elif entry is not None and entry.generation == expected_generation:
+            self.stats["hits"] += 1
+            return entry
+
+        try:
+            self.stats["revalidations"] += 1
+            blob = self.bucket_factory(bucket).get_blob(path)
+        except Exception as exc:
+            self.stats["errors"] += 1
+            logger.warning("Asset revalidation failed for %s/%s: %s", bucket, path, exc)
+            return entry
+        if blob is None:
+            self.invalidate(bucket, path)
+            with self._lock:
+                self._missing[key] = now
+            return None
+
+        generation = str(getattr(blob, "generation", None) or getattr(blob, "etag", None) or "")
+        if entry is not None and generation and entry.generation == generation:
+            entry.checked_at = now
+            self._store(key, entry, write_data=False)
+            return entry
+
+        try:
+            data = blob.download_as_bytes()
+        except Exception as exc:
+            self.stats["errors"] += 1
+            logger.warning("Asset download failed for %s/%s: %s", bucket, path, exc)
+            return entry
+        self.stats["downloads"] += 1
+        entry = StoredAsset(bucket, path, generation, data, now)
+        self._store(key, entry, write_data=True)
+        return entry
+
+    def invalidate(self, bucket: str, path: str) -> None:
+        key = self._key(bucket, path)
+        with self._lock:
+            self._missing.pop(key, None)
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= len(entry.data)
+        if self.disk_dir:
+            self._disk_remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._missing.clear()
+            self._memory_bytes = 0
+        if self.disk_dir:
+            for entry in os.scandir(self.disk_dir):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_bytes = 0
+
+    # -------------------------------------------------------------------
+    # Storage tiers
+    # -------------------------------------------------------------------
+    @staticmethod
+    def _key(bucket: str, path: str) -> str:
+        return hashlib.sha256(f"{bucket}/{path}".encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key: str) -> Optional[StoredAsset]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key: str, entry: StoredAsset) -> None:
+        with self._lock:
+            self._missing.pop(key, None)
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous.data)
+            if len(entry.data) > self.memory_max_bytes:
+                return
+            self._memory[key] = entry
+            self._memory_bytes += len(entry.data)
+            while self._memory_bytes > self.memory_max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted.data)
+
+    def _store(self, key: str, entry: StoredAsset, write_data: bool) -> None:
+        self._memory_put(key, entry)
+        if self.disk_dir:
+            try:
+                if write_data:
+                    self._disk_remove(key)
+                    if len(entry.data) > self.disk_max_bytes:
+                        return
+                    self._atomic_write(key + ".bin", entry.data)
+                meta = {
+                    "bucket": entry.bucket,
+                    "path": entry.path,
+                    "generation": entry.generation,
+                    "checked_at": entry.checked_at,
+                }
+                self._atomic_write(key + ".json", json.dumps(meta).encode("utf-8"))
+            except OSError as exc:
+                logger.warning("Asset disk cache write failed: %s", exc)
+                return
+            if write_data:
+                with self._lock:
+                    self._disk_bytes += len(entry.data)
+                    over_cap = self._disk_bytes > self.disk_max_bytes
+                if over_cap:
+                    self._disk_evict()
+
+    def _atomic_write(self, name: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.disk_dir, name))
+
+    def _disk_load(self, key: str) -> Optional[StoredAsset]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, key + ".json"), "rb") as f:
+                meta = json.loads(f.read())
+            data_path = os.path.join(self.disk_dir, key + ".bin")
+            with open(data_path, "rb") as f:
+                data = f.read()
+            os.utime(data_path, None)  # recency for eviction
+        except (OSError, ValueError):
+            return None
+        entry = StoredAsset(meta["bucket"], meta["path"], meta["generation"], data, meta["checked_at"])
+        self._memory_put(key, entry)
+        return entry
+
+    def _disk_remove(self, key: str) -> None:
+        data_path = os.path.join(self.disk_dir, key + ".bin")
+        try:
+            size = os.stat(data_path).st_size
+            os.unlink(data_path)
+        except OSError:
+            size = 0
+        try:
+            os.unlink(os.path.join(self.disk_dir, key + ".json"))
+        except OSError:
+            pass
+        if size:
+            with self._lock:
+                self._disk_bytes -= size
+
+    def _disk_evict(self) -> None:
+        # Trim to 90% of the cap so we don't evict on every write
+        target = int(self.disk_max_bytes * 0.9)
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".bin")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except OSError:
+            return
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                total -= size
+            except OSError:
+                continue
+            try:
+                os.unlink(entry.path[:-len(".bin")] + ".json")
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+
+_expected = threading.local()
+
+
+@contextlib.contextmanager
+def expecting(versions: Optional[Dict[str, Tuple[str, str]]]) -> Iterator[None]:
+    """
+    Storage images read in this thread must match `versions`, a map of
+    storage value -> (object path, generation) as the API process saw them
+    when it computed the render's cache key (render workers).
+    """
+    previous = getattr(_expected, "versions", None)
+    _expected.versions = versions or {}
+    try:
+        yield
+    finally:
+        _expected.versions = previous
+
+
+def expected_version(storage_value: str) -> Optional[Tuple[str, str]]:
+    return (getattr(_expected, "versions", None) or {}).get(storage_value)
+
+
+asset_cache = AssetCache.from_env()
@@ -0,0 +1,412 @@
+"""
+Patient dossier: the full consultation history of a patient as one A4 PDF,
+written page by page so it can be streamed while later pages are still
+being laid out.
+
+ReportLab and pypdf both build the whole document in memory before writing
+it; here each page is serialized as soon as it is drawn and only object
+offsets are kept until the cross-reference table is written at the end.
+Text uses the bundled Arial as CID fonts (Identity-H): pages carry glyph
+ids only, and the font programs, subset to the glyphs actually used, are
+written by finish() together with the page tree.
+"""
+import datetime
+import functools
+import hashlib
+import io
+import logging
+import os
+import unicodedata
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from backend.services import pdf_profile, stationery
+from backend.services.stationery import MM_TO_PT, wrap_text
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = (595.28, 841.89)  # A4 en puntos
+MARGIN = 18 * MM_TO_PT
+BODY_FONT = "body"
+BOLD_FONT = "bold"
+FONT_FILES = {BODY_FONT: "arial.ttf", BOLD_FONT: "arialbd.ttf"}
+BODY_SIZE = 10.0
+LINE_HEIGHT = 1.35
+
+# Etiquetas de cada bloque de la consulta, en orden de lectura
+SECTIONS: Tuple[Tuple[str, str], ...] = (
+    ("motivo_consulta", "MOTIVO DE CONSULTA"),
+    ("examen_fisico", "EXAMEN FÍSICO"),
+    ("diagnostico", "DIAGNÓSTICO"),
+    ("plan_tratamiento", "PLAN DE TRATAMIENTO"),
+    ("receta", "RECETA"),
+    ("examenes_solicitados", "EXÁMENES SOLICITADOS"),
+    ("interconsulta", "INTERCONSULTA"),
+    ("licencia_medica", "LICENCIA MÉDICA"),
+    ("proximo_control", "PRÓXIMO CONTROL"),
+)
+
+_FONT_IDS = {BODY_FONT: "F1", BOLD_FONT: "F2"}
+
+
+def _pdf_string(text: str) -> bytes:
+    """PDF text string (document info): UTF-16BE with byte order mark."""
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+
+@functools.lru_cache(maxsize=None)
+def _font_tables(path: str) -> Tuple[Dict[int, int], List[int], int, dict]:
+    """cmap (code point -> glyph id), advance widths and metrics of a TTF, once per process."""
+    from fontTools.ttLib import TTFont
+
+    font = TTFont(path, lazy=True)
+    cmap = {code: font.getGlyphID(name) for code, name in font.getBestCmap().items()}
+    metrics = font["hmtx"].metrics
+    widths = [metrics[name][0] for name in font.getGlyphOrder()]
+    head, os2 = font["head"], font["OS/2"]
+    info = {
+        "name": font["name"].getDebugName(6) or "Arial",
+        "bbox": (head.xMin, head.yMin, head.xMax, head.yMax),
+        "ascent": os2.sTypoAscender,
+        "descent": os2.sTypoDescender,
+        "cap_height": getattr(os2, "sCapHeight", os2.sTypoAscender),
+    }
+    return cmap, widths, head.unitsPerEm, info
+
+
+class EmbeddedFont:
+    """
+    A bundled TrueType font written as a CIDFontType2 with Identity-H
+    encoding: text is encoded as glyph ids, and the glyphs used so far are
+    remembered so finish() embeds just those. Characters Arial has no glyph
+    for (CJK, emoji) are decomposed when that helps and become "?" otherwise,
+    with a warning.
+    """
+
+    def __init__(self, filename: str):
+        from backend.services.weasy_engine import FONTS_DIR
+
+        self.path = os.path.join(FONTS_DIR, filename)
+        self.cmap, self.widths, self.units_per_em, self.info = _font_tables(self.path)
+        self.used: Dict[int, str] = {}
+        self.missing = 0
+
+    def _glyphs(self, char: str) -> List[Tuple[int, str]]:
+        gid = self.cmap.get(ord(char))
+        if gid is not None:
+            return [(gid, char)]
+        decomposed = unicodedata.normalize("NFKD", char)
+        if decomposed != char and all(ord(part) in self.cmap for part in decomposed):
+            return [(self.cmap[ord(part)], part) for part in decomposed if not unicodedata.combining(part)]
+        self.missing += 1
+        return [(self.cmap[ord("?")], "?")]
+
+    def encode(self, text: str) -> bytes:
+        out = []
+        for char in text:
+            for gid, source in self._glyphs(char):
+                self.used.setdefault(gid, source)
+                out.append(b"%04X" % gid)
+        return b"<" + b"".join(out) + b">"
+
+    def objects(self, type0_id: int, first_id: int, strip_hinting: bool) -> List[Tuple[int, bytes]]:
+        """(object number, body) of the Type0 font and everything it points to."""
+        if self.missing:
+            logger.warning("Dossier: %d characters without a glyph in %s printed as '?'",
+                           self.missing, os.path.basename(self.path))
+        gids = sorted(set(self.used) | {0})
+        tag = "".join(chr(65 + byte % 26) for byte in hashlib.sha1(repr(gids).encode("ascii")).digest()[:6])
+        name = "%s+%s" % (tag, self.info["name"])
+        cid_id, descriptor_id, file_id, unicode_id = range(first_id, first_id + 4)
+        scale = 1000.0 / self.units_per_em
+
+        widths = " ".join("%d [%d]" % (gid, round(self.widths[gid] * scale)) for gid in gids)
+        x_min, y_min, x_max, y_max = (round(v * scale) for v in self.info["bbox"])
+        program = zlib.compress(self._subset(gids, strip_hinting))
+        cmap = self._to_unicode()
+        return [
+            (type0_id, (
+                "<< /Type /Font /Subtype /Type0 /BaseFont /%s /Encoding /Identity-H "
+                "/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>" % (name, cid_id, unicode_id)
+            ).encode("ascii")),
+            (cid_id, (
+                "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s "
+                "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+                "/FontDescriptor %d 0 R /W [%s] /CIDToGIDMap /Identity >>" % (name, descriptor_id, widths)
+            ).encode("ascii")),
+            (descriptor_id, (
+                "<< /Type /FontDescriptor /FontName /%s /Flags 32 /FontBBox [%d %d %d %d] /ItalicAngle 0 "
+                "/Ascent %d /Descent %d /CapHeight %d /StemV 80 /FontFile2 %d 0 R >>" % (
+                    name, x_min, y_min, x_max, y_max, round(self.info["ascent"] * scale),
+                    round(self.info["descent"] * scale), round(self.info["cap_height"] * scale), file_id
+                )
+            ).encode("ascii")),
+            (file_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(program) + program + b"\nendstream"),
+            (unicode_id, b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream"),
+        ]
+
+    def _subset(self, gids: List[int], strip_hinting: bool) -> bytes:
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+
+        options = subset.Options()
+        options.retain_gids = True          # glyph ids in the pages stay valid (CIDToGIDMap /Identity)
+        options.notdef_outline = True
+        options.hinting = not strip_hinting
+        options.layout_features = []
+        options.name_IDs = []
+        # Shaping tables are not used by a plain Tj and dominate the subsetting time
+        options.drop_tables += ["GSUB", "GPOS", "GDEF", "kern", "meta", "DSIG", "JSTF", "BASE",
+                                "hdmx", "VDMX", "LTSH", "PCLT"]
+        font = TTFont(self.path)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(gids=gids)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font.save(out)
+        return out.getvalue()
+
+    def _to_unicode(self) -> bytes:
+        entries = sorted(self.used.items())
+        lines = [
+            "/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+            "/CMapName /Adobe-Identity-UCS def", "/CMapType 2 def",
+            "1 begincodespacerange", "<0000> <FFFF>", "endcodespacerange",
+        ]
+        for start in range(0, len(entries), 100):
+            chunk = entries[start:start + 100]
+            lines.append("%d beginbfchar" % len(chunk))
+            lines.extend("<%04X> <%s>" % (gid, text.encode("utf-16-be").hex().upper()) for gid, text in chunk)
+            lines.append("endbfchar")
+        lines.extend(["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"])
+        return "\n".join(lines).encode("ascii")
+
+
+def document_fonts() -> Dict[str, EmbeddedFont]:
+    """Fresh per-document fonts: each document embeds its own glyph subset."""
+    return {key: EmbeddedFont(filename) for key, filename in FONT_FILES.items()}
+
+
+def _measure_font(font: str) -> str:
+    """ReportLab name of the same bundled face, used for widths and wrapping."""
+    body, bold = stationery.register_fonts()
+    return bold if font == BOLD_FONT else body
+
+
+class StreamingPDFWriter:
+    """
+    Minimal PDF 1.4 serializer. `start()`, each `add_page()` and `finish()`
+    return the bytes to send next; the page tree and the fonts are written
+    last and referenced by the pages ahead of them.
+    """
+
+    CATALOG, PAGES, FONT_BODY, FONT_BOLD, INFO = 1, 2, 3, 4, 5
+
+    def __init__(self, page_size: Tuple[float, float] = PAGE_SIZE, title: str = "",
+                 fonts: Optional[Dict[str, EmbeddedFont]] = None):
+        self.page_size = page_size
+        self.title = title
+        self.fonts = fonts if fonts is not None else document_fonts()
+        self._offset = 0
+        self._offsets = {}
+        self._next_id = self.INFO + 1
+        self._kids: List[int] = []
+
+    @property
+    def page_count(self) -> int:
+        return len(self._kids)
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        data = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        self._offsets[number] = self._offset
+        self._offset += len(data)
+        return data
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def start(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, content: bytes) -> bytes:
+        stream_id, page_id = self._next_id, self._next_id + 1
+        self._next_id += 2
+        self._kids.append(page_id)
+
+        compressed = zlib.compress(content)
+        out = self._object(stream_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(compressed)
+                           + compressed + b"\nendstream")
+        width, height = self.page_size
+        out += self._object(page_id, (
+            "<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R "
+            "/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>"
+            % (self.PAGES, width, height, stream_id, self.FONT_BODY, self.FONT_BOLD)
+        ).encode("ascii"))
+        return out
+
+    def finish(self) -> bytes:
+        kids = " ".join("%d 0 R" % kid for kid in self._kids)
+        out = self._object(self.PAGES, (
+            "<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids))
+        ).encode("ascii"))
+        out += self._object(self.CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES)
+        out += self._object(self.INFO, b"<< /Title " + _pdf_string(self.title) + b" /Producer (Vitalinuage) >>")
+        strip_hinting = pdf_profile.active().strip_font_hinting
+        for number, key in ((self.FONT_BODY, BODY_FONT), (self.FONT_BOLD, BOLD_FONT)):
+            objects = self.fonts[key].objects(number, self._next_id, strip_hinting)
+            self._next_id += len(objects) - 1
+            for object_id, body in objects:
+                out += self._object(object_id, body)
+
+        xref_offset = self._offset
+        size = self._next_id
+        lines = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        lines.extend(b"%010d 00000 n \n" % self._offsets[number] for number in range(1, size))
+        lines.append(b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (size, self.CATALOG, self.INFO, xref_offset))
+        return out + self._emit(b"".join(lines))
+
+
+class _Page:
+    """Content stream of one page: text runs and rules, y measured from the top."""
+
+    def __init__(self, fonts: Dict[str, EmbeddedFont]):
+        self._fonts = fonts
+        self._ops: List[bytes] = []
+
+    def text(self, x: float, top: float, text: str, font: str = BODY_FONT, size: float = BODY_SIZE,
+             gray: float = 0.0, align_right: bool = False) -> None:
+        if align_right:
+            from reportlab.pdfbase.pdfmetrics import stringWidth
+            x -= stringWidth(text, _measure_font(font), size)
+        y = PAGE_SIZE[1] - top - size
+        self._ops.append(b"%.3f g BT /%s %.1f Tf %.2f %.2f Td %s Tj ET" % (
+            gray, _FONT_IDS[font].encode("ascii"), size, x, y, self._fonts[font].encode(text)
+        ))
+
+    def rule(self, top: float, gray: float = 0.8, width: float = 0.75) -> None:
+        y = PAGE_SIZE[1] - top
+        self._ops.append(b"%.3f G %.2f w %.2f %.2f m %.2f %.2f l S" % (
+            gray, width, MARGIN, y, PAGE_SIZE[0] - MARGIN, y
+        ))
+
+    def content(self) -> bytes:
+        return b"\n".join(self._ops)
+
+
+class DossierLayout:
+    """
+    Lays consultations out top to bottom. Each consultation starts on a new
+    page; long ones continue on the following pages under a repeated header.
+    """
+
+    def __init__(self, patient: dict, doctor: dict, fonts: Dict[str, EmbeddedFont]):
+        self.patient = patient
+        self.doctor = doctor
+        self.fonts = fonts
+        self.pages_done = 0
+        self.text_width = PAGE_SIZE[0] - 2 * MARGIN
+
+    def _new_page(self) -> Tuple[_Page, float]:
+        page = _Page(self.fonts)
+        page.text(MARGIN, MARGIN, self.doctor.get("name", ""), BOLD_FONT, 11)
+        page.text(MARGIN, MARGIN + 14, self.doctor.get("specialty", ""), BODY_FONT, 9, gray=0.4)
+        page.text(PAGE_SIZE[0] - MARGIN, MARGIN, "HISTORIAL CLÍNICO", BOLD_FONT, 11, align_right=True)
+        page.text(PAGE_SIZE[0] - MARGIN, MARGIN + 14, "Emitido el %s" % self.patient["issued"], BODY_FONT, 9,
+                  gray=0.4, align_right=True)
+        page.rule(MARGIN + 30, gray=0.2, width=1.2)
+        page.text(MARGIN, MARGIN + 38, "Paciente: %s" % self.patient["name"], BOLD_FONT, 10)
+        page.text(PAGE_SIZE[0] - MARGIN, MARGIN + 38, "DNI / RUT: %s   Edad: %s" % (
+            self.patient["dni"], self.patient["age"]
+        ), BODY_FONT, 10, align_right=True)
+        page.rule(MARGIN + 56)
+        self.pages_done += 1
+        page.text(PAGE_SIZE[0] - MARGIN, PAGE_SIZE[1] - MARGIN + 4, "Página %d" % self.pages_done,
+                  BODY_FONT, 8, gray=0.5, align_right=True)
+        return page, MARGIN + 66
+
+    def consultation_lines(self, consultation) -> Iterator[Tuple[str, float, str, float]]:
+        """(font, size, text, space_before) rows of one consultation."""
+        for attr, label in SECTIONS:
+            value = getattr(consultation, attr, None)
+            if not value or not str(value).strip():
+                continue
+            yield BOLD_FONT, 8.0, label, 6.0
+            for line in wrap_text(str(value).strip(), _measure_font(BODY_FONT), BODY_SIZE, self.text_width):
+                yield BODY_FONT, BODY_SIZE, line, 0.0
+
+        vitals = _vital_signs(consultation)
+        if vitals:
+            yield BOLD_FONT, 8.0, "SIGNOS VITALES", 6.0
+            for line in wrap_text(vitals, _measure_font(BODY_FONT), BODY_SIZE, self.text_width):
+                yield BODY_FONT, BODY_SIZE, line, 0.0
+
+    def pages(self, consultation, title: str) -> Iterator[bytes]:
+        """Content streams of one consultation, yielded as each page fills up."""
+        bottom = PAGE_SIZE[1] - MARGIN - 12
+        page, top = self._new_page()
+        page.text(MARGIN, top, title, BOLD_FONT, 12, gray=0.1)
+        top += 12 * LINE_HEIGHT + 4
+
+        for font, size, text, space_before in self.consultation_lines(consultation):
+            height = space_before + size * LINE_HEIGHT
+            if top + height > bottom:
+                yield page.content()
+                page, top = self._new_page()
+                page.text(MARGIN, top, "%s (continuación)" % title, BOLD_FONT, 12, gray=0.1)
+                top += 12 * LINE_HEIGHT + 4
+                space_before = 0.0
+            top += space_before
+            page.text(MARGIN, top, text, font, size, gray=0.4 if font == BOLD_FONT else 0.0)
+            top += size * LINE_HEIGHT
+        yield page.content()
+
+    def empty_page(self) -> bytes:
+        page, top = self._new_page()
+        page.text(MARGIN, top, "El paciente no tiene consultas registradas.", BODY_FONT, BODY_SIZE, gray=0.4)
+        return page.content()
+
+
+def _vital_signs(consultation) -> str:
+    parts = []
+    for attr, template in (
+        ("peso_kg", "Peso %g kg"),
+        ("estatura_cm", "Estatura %g cm"),
+        ("imc", "IMC %.1f"),
+        ("presion_arterial", "PA %s"),
+        ("frecuencia_cardiaca", "FC %s lpm"),
+        ("temperatura_c", "T° %g °C"),
+    ):
+        value = getattr(consultation, attr, None)
+        if value not in (None, ""):
+            parts.append(template % value)
+    return " · ".join(parts)
+
+
+def render_dossier(
+    patient: dict,
+    doctor: dict,
+    consultations: Iterable,
+    consultation_date=None,
+) -> Iterator[bytes]:
+    """
+    Streams the dossier: the header bytes first, then every page as soon as
+    it is laid out, then the page tree and cross-reference table. Only the
+    consultation being laid out is held in memory.
+    """
+    fonts = document_fonts()
+    writer = StreamingPDFWriter(title="Historial clínico - %s" % patient["name"], fonts=fonts)
+    layout = DossierLayout(patient, doctor, fonts)
+    yield writer.start()
+
+    for consultation in consultations:
+        date: Optional[datetime.date] = consultation_date(consultation) if consultation_date else None
+        title = "Consulta del %s" % date.strftime("%d/%m/%Y") if date else "Consulta"
+        for content in layout.pages(consultation, title):
+            yield writer.add_page(content)
+
+    if writer.page_count == 0:
+        yield writer.add_page(layout.empty_page())
+    yield writer.finish()
@@ -1,5 +1,5 @@
 import resend
-from jinja2 import Template
+import jinja2
 import os
 import logging
 from typing import Optional
@@ -38,25 +38,19 @@ class EmailService:
                 
             resend.api_key = api_key
             
-            # Renderizar template
-            template_path = os.path.join(
-                os.path.dirname(__file__), 
-                'email_templates', 
-                'prescription_email.html'
-            )
+            # Renderizar template (compilado una sola vez por proceso)
+            from backend.services.template_registry import template_registry
             
             # Verificar si existe el template, si no usar un fallback simple
-            if os.path.exists(template_path):
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    template = Template(f.read())
-                
-                html_content = template.render(
+            try:
+                html_content = template_registry.render(
+                    'email/prescription_email.html',
                     patient_name=patient_name,
                     doctor_name=doctor_name,
                     pdf_url=pdf_url,
                     issue_date=issue_date
                 )
-            else:
+            except jinja2.TemplateNotFound:
                 # Fallback simple si no existe el archivo (para desarrollo)
                 html_content = f"""
                 <h1>Receta Médica</h1>
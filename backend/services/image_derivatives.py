@@ -0,0 +1,131 @@
+import io
+import logging
+import posixpath
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRINT_DPI = 300
+
+# Largest box (width, height in mm) each image is printed at. Covers the
+# HTML templates (.signature-image 180x50px, .logo-img 160x40px) and the
+# max_width_mm / max_height_mm a PrescriptionMap signature field may use.
+PRINT_BOXES_MM = {
+    "signature": (60.0, 20.0),
+    "logo": (50.0, 20.0),
+    "profile": (30.0, 30.0),
+}
+
+DERIVATIVE_SUFFIX = ".print.png"
+PALETTE_COLORS = 256
+
+
+def derivative_path(object_path: str) -> str:
+    """Storage path of the print derivative, next to the original."""
+    root, _ = posixpath.splitext(object_path)
+    if root.endswith(".print"):
+        return object_path
+    return root + DERIVATIVE_SUFFIX
+
+
+def is_derivative(object_path: str) -> bool:
+    return object_path.endswith(DERIVATIVE_SUFFIX)
+
+
+def box_pixels(kind: str, dpi: int = PRINT_DPI) -> Tuple[int, int]:
+    width_mm, height_mm = PRINT_BOXES_MM[kind]
+    return round(width_mm / 25.4 * dpi), round(height_mm / 25.4 * dpi)
+
+
+def make_print_derivative(data: bytes, kind: str) -> bytes:
+    """
+    Downscales an uploaded image to its printed size at 300 DPI, flattens
+    transparency onto white paper, quantizes to a palette and re-encodes it
+    as PNG without the original metadata (EXIF, ICC, text chunks).
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    image.thumbnail(box_pixels(kind), Image.Resampling.LANCZOS)
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        image = flattened
+    else:
+        image = image.convert("RGB")
+
+    image = image.quantize(colors=PALETTE_COLORS, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=True, dpi=(PRINT_DPI, PRINT_DPI))
+    return out.getvalue()
+
+
+def discard_print_derivative(storage_value: Optional[str]) -> None:
+    """
+    Deletes the print derivative of an image that is being replaced. Uploads
+    reuse the same Storage path, and renders prefer the derivative, so the
+    old one has to go before the new one is built: if that build fails the
+    original is printed instead of the previous image.
+    """
+    from backend.services.asset_cache import asset_cache
+    from backend.services.pdf_service import PDFService
+
+    bucket_name, object_path = PDFService.resolve_storage_value(storage_value)
+    if not bucket_name or not object_path or is_derivative(object_path):
+        return
+
+    target = derivative_path(object_path)
+    try:
+        blob = asset_cache.bucket_factory(bucket_name).get_blob(target)
+        if blob is not None:
+            blob.delete()
+    except Exception as exc:
+        logger.warning("Stale derivative not deleted %s/%s: %s", bucket_name, target, exc)
+    asset_cache.invalidate(bucket_name, target)
+
+
+def generate_print_derivative(storage_value: Optional[str], kind: str) -> Optional[str]:
+    """
+    Builds and uploads the print derivative of a signature, logo or profile
+    image. Meant to run as a background task right after the profile or
+    preferences save. Returns the derivative's object path, or None.
+    """
+    from backend.services.asset_cache import asset_cache
+    from backend.services.pdf_service import PDFService
+
+    bucket_name, object_path = PDFService.resolve_storage_value(storage_value)
+    if not bucket_name or not object_path or is_derivative(object_path):
+        return None
+
+    original = asset_cache.get(bucket_name, object_path)
+    if original is None:
+        logger.warning("Derivative skipped, original unavailable: %s/%s", bucket_name, object_path)
+        return None
+
+    try:
+        derivative = make_print_derivative(original.data, kind)
+    except Exception as exc:
+        logger.warning("Derivative failed for %s/%s: %s", bucket_name, object_path, exc)
+        return None
+
+    target = derivative_path(object_path)
+    try:
+        asset_cache.bucket_factory(bucket_name).blob(target).upload_from_string(
+            derivative, content_type="image/png"
+        )
+    except Exception as exc:
+        logger.warning("Derivative upload failed for %s/%s: %s", bucket_name, target, exc)
+        return None
+
+    asset_cache.invalidate(bucket_name, target)
+    logger.info(
+        "Print derivative %s/%s: %d -> %d bytes",
+        bucket_name, target, len(original.data), len(derivative)
+    )
+    return target
@@ -0,0 +1,352 @@
+import base64
+import io
+import logging
+from typing import List, Optional, Tuple
+
+from backend.services import pdf_profile, stationery
+from backend.services.stationery import ARIAL_ASCENT, MM_TO_PT, PAGE_MM
+
+logger = logging.getLogger(__name__)
+
+# print_template_id that selects this engine for the A5 recipe
+NATIVE_TEMPLATE_ID = "native"
+
+# Geometry of templates/recipe_template.html in PDF points (y from the top
+# of the page while laying out). 1 CSS px = 0.75pt.
+PX = 0.75
+PAGE_WIDTH, PAGE_HEIGHT = PAGE_MM[0] * MM_TO_PT, PAGE_MM[1] * MM_TO_PT
+PADDING = 20 * MM_TO_PT                        # body { padding: 20mm }
+LEFT, RIGHT = PADDING, PAGE_WIDTH - PADDING
+CONTENT_WIDTH = RIGHT - LEFT
+LINE_HEIGHT = 1.5                              # body { line-height: 1.5 }
+ARIAL_DESCENT = 0.212                          # hhea descender / unitsPerEm of arial.ttf
+
+BODY_SIZE = 10.0
+TEXT_COLOR = "#333333"
+LABEL_COLOR = "#64748b"
+BORDER_COLOR = "#e2e8f0"
+LOGO_BOX = (160 * PX, 40 * PX)                 # .logo-img max-width / max-height
+SIGNATURE_BOX = (180 * PX, 50 * PX)            # .signature-image
+SIGNATURE_LINE_WIDTH = 200 * PX
+TREATMENT_MIN_HEIGHT = 300 * PX                # .treatment-box { min-height: 300px }
+QR_SIZE = 25 * MM_TO_PT
+
+Line = Tuple[str, str, float]                  # (font, text, size)
+
+
+def is_selected(doctor) -> bool:
+    return bool(doctor and (doctor.print_template_id or "").lower() == NATIVE_TEMPLATE_ID)
+
+
+def _image(data_base64: Optional[str]):
+    if not data_base64:
+        return None
+    from reportlab.lib.utils import ImageReader
+    try:
+        return ImageReader(io.BytesIO(base64.b64decode(data_base64)))
+    except Exception as exc:
+        logger.warning("Image skipped in native recipe: %s", exc)
+        return None
+
+
+def _fitted_size(image, box: Tuple[float, float]) -> Tuple[float, float]:
+    """Rendered size of an <img> under max-width/max-height: 1 image pixel = 1 CSS px, never upscaled."""
+    img_w, img_h = image.getSize()
+    scale = min(box[0] / img_w, box[1] / img_h, PX)
+    return img_w * scale, img_h * scale
+
+
+def _collapse(text: Optional[str]) -> str:
+    # white-space: normal
+    return " ".join((text or "").split())
+
+
+def _baseline(top: float, size: float, line_height: float = LINE_HEIGHT) -> float:
+    """Baseline of a CSS line box starting at `top`: half-leading above the Arial ascent."""
+    return top + size * (line_height - ARIAL_ASCENT - ARIAL_DESCENT) / 2 + size * ARIAL_ASCENT
+
+
+def _y(top: float) -> float:
+    return PAGE_HEIGHT - top
+
+
+def _text(pdf, x: float, top: float, text: str, font: str, size: float, align: str = "left") -> None:
+    draw = {"left": pdf.drawString, "right": pdf.drawRightString, "center": pdf.drawCentredString}[align]
+    pdf.setFont(font, size)
+    draw(x, _y(_baseline(top, size)), text)
+
+
+def _rule(pdf, x1: float, x2: float, top: float, width: float, color: str) -> None:
+    """Border of `width` points whose outer edge is at `top`."""
+    from reportlab.lib import colors
+
+    pdf.setStrokeColor(colors.HexColor(color))
+    pdf.setLineWidth(width)
+    pdf.line(x1, _y(top + width / 2), x2, _y(top + width / 2))
+
+
+# ---------------------------------------------------------------------------
+# Blocks of recipe_template.html, in document order. Each draws itself from
+# `top` and returns where the next block starts.
+# ---------------------------------------------------------------------------
+def _header(pdf, context: dict, body_font: str, bold_font: str) -> float:
+    """.header: logo and doctor-info side by side (align-items: center), 2px rule below."""
+    from reportlab.lib import colors
+
+    primary = context.get("primary_color") or "#1e3a8a"
+    secondary = context.get("secondary_color") or "#666666"
+    doctor = context.get("doctor") or {}
+
+    # The logo sits on the baseline of an 18pt line box
+    logo = _image(context.get("logo_base64"))
+    strut_above = _baseline(0, 18)
+    strut_below = 18 * LINE_HEIGHT - strut_above
+    logo_size = _fitted_size(logo, LOGO_BOX) if logo is not None else None
+    logo_height = (max(strut_above, logo_size[1]) + strut_below) if logo_size else 18 * LINE_HEIGHT
+    info_height = 3 * 9 * LINE_HEIGHT
+    height = max(logo_height, info_height)
+
+    logo_top = PADDING + (height - logo_height) / 2
+    if logo_size:
+        image_top = logo_top + max(strut_above, logo_size[1]) - logo_size[1]
+        pdf.drawImage(logo, LEFT, _y(image_top + logo_size[1]), logo_size[0], logo_size[1], mask="auto")
+    else:
+        pdf.setFillColor(colors.HexColor(primary))
+        _text(pdf, LEFT, logo_top, "VITALINUAGE", bold_font, 18)
+
+    info_top = PADDING + (height - info_height) / 2
+    pdf.setFillColor(colors.HexColor(secondary))
+    for index, (font, text) in enumerate((
+        (bold_font, doctor.get("name", "")),
+        (body_font, doctor.get("specialty", "")),
+        (body_font, context.get("date", "")),
+    )):
+        _text(pdf, RIGHT, info_top + index * 9 * LINE_HEIGHT, str(text), font, 9, align="right")
+
+    rule_top = PADDING + height + 10 * PX
+    _rule(pdf, LEFT, RIGHT, rule_top, 2 * PX, primary)
+    return rule_top + 2 * PX + 20 * PX
+
+
+def _header_text(pdf, context: dict, body_font: str, top: float) -> float:
+    from reportlab.lib import colors
+
+    header_text = _collapse(context.get("header_text"))
+    if not header_text:
+        return top
+    pdf.setFillColor(colors.HexColor(context.get("secondary_color") or "#666666"))
+    for line in stationery.wrap_text(header_text, body_font, 9, CONTENT_WIDTH):
+        _text(pdf, LEFT, top, line, body_font, 9)
+        top += 9 * LINE_HEIGHT
+    return top + 12 * PX
+
+
+def _patient(pdf, context: dict, body_font: str, bold_font: str, top: float) -> float:
+    """.patient-info: rounded box, two rows of label over value, left and right."""
+    from reportlab.lib import colors
+
+    patient = context.get("patient") or {}
+    rows = (
+        ("PACIENTE", str(patient.get("name", "")), "DNI / RUT", str(patient.get("dni", ""))),
+        ("EDAD", f"{patient.get('age', '')} años", "FECHA DE EMISIÓN", context.get("date", "")),
+    )
+    row_height = 8 * LINE_HEIGHT + BODY_SIZE * LINE_HEIGHT
+    inset = PX + 15 * PX
+    bottom = top + 2 * inset + len(rows) * (row_height + 5 * PX)
+
+    pdf.setFillColor(colors.HexColor("#f8fafc"))
+    pdf.setStrokeColor(colors.HexColor(BORDER_COLOR))
+    pdf.setLineWidth(PX)
+    pdf.roundRect(LEFT + PX / 2, _y(bottom) + PX / 2, CONTENT_WIDTH - PX, bottom - top - PX, 8 * PX, stroke=1, fill=1)
+
+    row_top = top + inset
+    for left_label, left_value, right_label, right_value in rows:
+        pdf.setFillColor(colors.HexColor(LABEL_COLOR))
+        _text(pdf, LEFT + inset, row_top, left_label, bold_font, 8)
+        _text(pdf, RIGHT - inset, row_top, right_label, bold_font, 8, align="right")
+        # .value { font-weight: 600 } resolves to the bold face
+        pdf.setFillColor(colors.HexColor(TEXT_COLOR))
+        _text(pdf, LEFT + inset, row_top + 8 * LINE_HEIGHT, left_value, bold_font, BODY_SIZE)
+        _text(pdf, RIGHT - inset, row_top + 8 * LINE_HEIGHT, right_value, bold_font, BODY_SIZE, align="right")
+        row_top += row_height + 5 * PX
+    return bottom + 20 * PX
+
+
+def _treatment_title(pdf, context: dict, bold_font: str, top: float) -> float:
+    from reportlab.lib import colors
+
+    pdf.setFillColor(colors.HexColor(context.get("primary_color") or "#1e3a8a"))
+    _text(pdf, LEFT, top, "PRESCRIPCIÓN / INDICACIONES", bold_font, 11)
+    rule_top = top + 11 * LINE_HEIGHT + 5 * PX
+    _rule(pdf, LEFT, RIGHT, rule_top, PX, BORDER_COLOR)
+    return rule_top + PX + 10 * PX
+
+
+def _signature(pdf, context: dict, body_font: str, top: float) -> None:
+    """.signature-box: optional image, right aligned, over the signature line."""
+    from reportlab.lib import colors
+
+    signature = _image(context.get("signature_base64"))
+    if signature is not None:
+        width, height = _fitted_size(signature, SIGNATURE_BOX)
+        pdf.drawImage(signature, RIGHT - width, _y(top + height), width, height, mask="auto")
+        top += height + 6 * PX
+
+    left = RIGHT - SIGNATURE_LINE_WIDTH
+    _rule(pdf, left, RIGHT, top, PX, TEXT_COLOR)
+    pdf.setFillColor(colors.HexColor(TEXT_COLOR))
+    _text(pdf, left + SIGNATURE_LINE_WIDTH / 2, top + PX + 5 * PX, "Firma del Médico", body_font, BODY_SIZE,
+          align="center")
+
+
+def _signature_height(context: dict) -> float:
+    height = PX + 5 * PX + BODY_SIZE * LINE_HEIGHT
+    signature = _image(context.get("signature_base64"))
+    if signature is not None:
+        height += _fitted_size(signature, SIGNATURE_BOX)[1] + 6 * PX
+    return height
+
+
+def _footer_lines(context: dict, body_font: str) -> List[str]:
+    lines: List[str] = []
+    for text in (
+        _collapse(context.get("footer_text")),
+        "Documento generado electrónicamente por Vitalinuage Platform",
+        f"Verifique autenticidad en {context.get('verification_display_url', '')}",
+    ):
+        if text:
+            lines.extend(stationery.wrap_text(text, body_font, 8, CONTENT_WIDTH))
+    return lines
+
+
+def _footer(pdf, context: dict, body_font: str, qr: bool) -> Optional[Tuple[float, float, float]]:
+    """
+    .footer: position: fixed at bottom 20mm, on every page. Returns the QR
+    square as (x, y of its top, size) in PDF coordinates, or None.
+    """
+    from reportlab.graphics import renderPDF
+    from reportlab.lib import colors
+    from backend.services.qr_service import get_qr_drawing
+
+    lines = _footer_lines(context, body_font)
+    # The QR <img> (margin-bottom: 5px) sits on the baseline of an 8pt line box
+    qr_line = QR_SIZE + 5 * PX + (8 * LINE_HEIGHT - _baseline(0, 8)) if qr else 0.0
+    top = PAGE_HEIGHT - PADDING - (PX + 10 * PX + qr_line + len(lines) * 8 * LINE_HEIGHT)
+    _rule(pdf, LEFT, RIGHT, top, PX, "#dddddd")
+    top += PX + 10 * PX
+
+    box = None
+    if qr:
+        box = (PAGE_WIDTH / 2 - QR_SIZE / 2, _y(top), QR_SIZE)
+        verify_url = context.get("verification_url")
+        if verify_url:
+            renderPDF.draw(get_qr_drawing(verify_url, QR_SIZE), pdf, box[0], box[1] - QR_SIZE)
+        top += qr_line
+
+    pdf.setFillColor(colors.HexColor("#999999"))
+    for line in lines:
+        _text(pdf, PAGE_WIDTH / 2, top, line, body_font, 8, align="center")
+        top += 8 * LINE_HEIGHT
+    return box
+
+
+# ---------------------------------------------------------------------------
+# Treatment box and pagination
+# ---------------------------------------------------------------------------
+def body_lines(context: dict, body_font: str, bold_font: str) -> List[Line]:
+    """(font, text, size) lines of the treatment box: treatment (pre-wrap), then the diagnosis block."""
+    lines: List[Line] = [
+        (body_font, line, BODY_SIZE)
+        for line in stationery.wrap_text((context.get("treatment") or "").strip(), body_font, BODY_SIZE, CONTENT_WIDTH)
+    ]
+    diagnosis = _collapse(context.get("diagnosis"))
+    if diagnosis:
+        # margin-top: 20px is one empty 10pt line
+        lines.append((body_font, "", BODY_SIZE))
+        lines.append((bold_font, "DIAGNÓSTICO", 8.0))
+        lines.extend((body_font, line, BODY_SIZE) for line in stationery.wrap_text(diagnosis, body_font, BODY_SIZE, CONTENT_WIDTH))
+    return lines
+
+
+def _body_top(context: dict, body_font: str, bold_font: str) -> float:
+    """Where the treatment lines start: the blocks above, measured without drawing."""
+    null = _NullCanvas()
+    top = _header(null, context, body_font, bold_font)
+    top = _header_text(null, context, body_font, top)
+    top = _patient(null, context, body_font, bold_font, top)
+    return _treatment_title(null, context, bold_font, top)
+
+
+def split_pages(context: dict, lines: List[Line], body_font: str, bold_font: str) -> List[List[Line]]:
+    """
+    Chunks of body lines per page. The treatment box grows past its
+    min-height until the signature block would run past the bottom padding;
+    further lines continue on the next page.
+    """
+    capacity = PAGE_HEIGHT - PADDING - 50 * PX - _signature_height(context) - _body_top(context, body_font, bold_font)
+    pages: List[List[Line]] = [[]]
+    used = 0.0
+    for line in lines:
+        step = line[2] * LINE_HEIGHT
+        if used + step > capacity and pages[-1]:
+            pages.append([])
+            used = 0.0
+        pages[-1].append(line)
+        used += step
+    return pages
+
+
+class _NullCanvas:
+    """Accepts the drawing calls of the blocks above and ignores them (layout measurement)."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def draw_page(pdf, context: dict, body_font: str, bold_font: str, body: List[Line],
+              last: bool = True, qr: Optional[bool] = None) -> Optional[Tuple[float, float, float]]:
+    """
+    One page of the recipe: header, patient block, treatment box with the
+    given body lines, the signature block on the last page and the footer.
+    `qr` reserves the footer QR (default: when there is a verification
+    URL); its square is returned as (x, y of its top, size).
+    """
+    from reportlab.lib import colors
+
+    top = _header(pdf, context, body_font, bold_font)
+    top = _header_text(pdf, context, body_font, top)
+    box_top = top = _patient(pdf, context, body_font, bold_font, top)
+    top = _treatment_title(pdf, context, bold_font, top)
+
+    for font, text, size in body:
+        pdf.setFillColor(colors.HexColor(LABEL_COLOR if font == bold_font else TEXT_COLOR))
+        _text(pdf, LEFT, top, text, font, size)
+        top += size * LINE_HEIGHT
+
+    if last:
+        _signature(pdf, context, body_font, max(top, box_top + TREATMENT_MIN_HEIGHT) + 50 * PX)
+    return _footer(pdf, context, body_font, bool(context.get("verification_url")) if qr is None else qr)
+
+
+def render(context: dict) -> bytes:
+    """
+    Full A5 recipe in ReportLab (no WeasyPrint, no Pango/Cairo), laid out
+    like templates/recipe_template.html. Text that overflows the treatment
+    box continues on further pages, each with the header, patient block and
+    footer; the HTML flow would continue at the top edge of the next page.
+    """
+    from reportlab.pdfgen import canvas
+
+    body_font, bold_font = stationery.register_fonts()
+    pages = split_pages(context, body_lines(context, body_font, bold_font), body_font, bold_font)
+
+    buffer = io.BytesIO()
+    with pdf_profile.reportlab_document() as options:
+        pdf = canvas.Canvas(buffer, pagesize=(PAGE_WIDTH, PAGE_HEIGHT), **options)
+        pdf.setTitle("Receta Médica")
+        pdf.setProducer("Vitalinuage")
+        for index, body in enumerate(pages):
+            draw_page(pdf, context, body_font, bold_font, body, last=index == len(pages) - 1)
+            pdf.showPage()
+        pdf.save()
+    return buffer.getvalue()
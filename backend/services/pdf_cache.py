@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def digest_key(*parts) -> str:
+    """
+    Content address for a render: sha256 over the ordered render inputs.
+    """
+    raw = "\x1f".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    """
+    Two-tier cache for rendered PDFs, keyed by a digest of every render input.
+
+    - Memory: LRU bounded by total bytes.
+    - Disk: one file per digest, bounded by total bytes (oldest mtime evicted).
+
+    Keys are content addresses, so entries never need invalidation: any change
+    to the inputs produces a different key and stale entries simply age out.
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: Optional[str], disk_max_bytes: int):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".pdf")
+                )
+            except OSError as exc:
+                logger.warning("PDF disk cache disabled: %s", exc)
+                self.disk_dir = None
+
+    @classmethod
+    def from_env(cls) -> "PDFCache":
+        memory_mb = float(os.getenv("PDF_CACHE_MEMORY_MB", "32"))
+        disk_mb = float(os.getenv("PDF_CACHE_DISK_MB", "256"))
+        disk_dir = os.getenv("PDF_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "vitalinuage-pdf-cache")
+        return cls(int(memory_mb * 1024 * 1024), disk_dir, int(disk_mb * 1024 * 1024))
+
+    # -------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+
+        data = self._disk_read(key)
+        with self._lock:
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._memory_store(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if not data:
+            return
+        with self._lock:
+            self.stats["stores"] += 1
+            self._memory_store(key, data)
+        self._disk_write(key, data)
+
+    def path_for(self, key: str) -> Optional[str]:
+        """
+        Disk location of an entry (None when the disk tier is off or it is
+        absent), for responses streamed from the file. Counts as a use.
+        """
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            os.utime(path, None)  # recency for eviction
+        except OSError:
+            return None
+        return path
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in self.stats:
+                self.stats[key] = 0
+        if self.disk_dir:
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+            self._disk_bytes = 0
+
+    # -------------------------------------------------------------------
+    # Memory tier (caller holds the lock)
+    # -------------------------------------------------------------------
+    def _memory_store(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # -------------------------------------------------------------------
+    # Disk tier
+    # -------------------------------------------------------------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)  # recency for eviction
+            return data
+        except OSError:
+            return None
+
+    def _disk_write(self, key: str, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # atomic: readers never see partial files
+        except OSError as exc:
+            logger.warning("PDF disk cache write failed: %s", exc)
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_cap = self._disk_bytes > self.disk_max_bytes
+        if over_cap:
+            self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        # Trim to 90% of the cap so we don't evict on every write
+        target = int(self.disk_max_bytes * 0.9)
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".pdf")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except OSError:
+            return
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                total -= size
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+
+
+pdf_cache = PDFCache.from_env()
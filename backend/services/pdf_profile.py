@@ -0,0 +1,259 @@
+"""
+Output profiles for rendered PDFs: how fonts are embedded, how images are
+downsampled and recompressed, whether streams are compressed and whether
+the output is byte-for-byte reproducible.
+
+    PDF_OUTPUT_PROFILE=standard|mobile|legacy   (default: standard)
+
+- standard: unhinted font subsets, images as stored (300 DPI print
+  derivatives), binary compressed streams, deterministic output.
+- mobile: like standard, with images downsampled to 150 DPI and embedded as
+  JPEG, for prescriptions sent over WhatsApp and email on mobile data.
+- legacy: the previous output (hinted fonts, ASCII85 streams, timestamps),
+  kept as the benchmark baseline.
+
+Sizes and times of every render are logged and aggregated in
+`render_stats`; `python -m backend.scripts.benchmark_pdf_profiles` compares the
+profiles.
+"""
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = "standard"
+IMAGE_CACHE_SIZE = 32
+
+
+class OutputProfile:
+    __slots__ = ("name", "strip_font_hinting", "image_dpi", "jpeg_quality", "compress", "deterministic")
+
+    def __init__(self, name: str, strip_font_hinting: bool = True, image_dpi: Optional[int] = None,
+                 jpeg_quality: Optional[int] = None, compress: bool = True, deterministic: bool = True):
+        self.name = name
+        self.strip_font_hinting = strip_font_hinting
+        self.image_dpi = image_dpi
+        self.jpeg_quality = jpeg_quality
+        self.compress = compress
+        self.deterministic = deterministic
+
+    def __repr__(self) -> str:
+        return f"OutputProfile({self.name!r})"
+
+
+PROFILES: Dict[str, OutputProfile] = {
+    "standard": OutputProfile("standard"),
+    "mobile": OutputProfile("mobile", image_dpi=150, jpeg_quality=75),
+    "legacy": OutputProfile("legacy", strip_font_hinting=False, compress=False, deterministic=False),
+}
+
+_local = threading.local()
+
+
+def active() -> OutputProfile:
+    """Profile of the current render: a `using()` override, else PDF_OUTPUT_PROFILE."""
+    name = getattr(_local, "name", None) or os.getenv("PDF_OUTPUT_PROFILE", DEFAULT_PROFILE).lower()
+    profile = PROFILES.get(name)
+    if profile is None:
+        logger.warning("Unknown PDF_OUTPUT_PROFILE %r, using %s", name, DEFAULT_PROFILE)
+        profile = PROFILES[DEFAULT_PROFILE]
+    return profile
+
+
+@contextlib.contextmanager
+def using(name: str) -> Iterator[OutputProfile]:
+    """Renders in this thread use `name` (benchmarks, tests)."""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown PDF output profile: {name}")
+    previous = getattr(_local, "name", None)
+    _local.name = name
+    try:
+        yield PROFILES[name]
+    finally:
+        _local.name = previous
+
+
+# -------------------------------------------------------------------
+# Engines
+# -------------------------------------------------------------------
+_reportlab_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def reportlab_document(profile: Optional[OutputProfile] = None) -> Iterator[dict]:
+    """
+    Wraps one ReportLab document, from Canvas() to save(), and yields the
+    Canvas keyword arguments. `invariant` drops the timestamps and random
+    document id, so identical inputs produce identical bytes.
+
+    ASCII85 is a ReportLab global (rl_config.useA85) read while images are
+    drawn, pages closed and fonts embedded on save. It is set for the
+    profile and restored under a lock held for the whole document, so
+    concurrent renders with other profiles cannot change it halfway.
+    Binary streams are ~20% smaller and every delivery path here is
+    binary-safe. Page compression stays on rl_config.pageCompression.
+    """
+    from reportlab import rl_config
+
+    profile = profile or active()
+    with _reportlab_lock:
+        previous = rl_config.useA85
+        rl_config.useA85 = 0 if profile.compress else 1
+        try:
+            yield {"invariant": 1 if profile.deterministic else 0}
+        finally:
+            rl_config.useA85 = previous
+
+
+def weasyprint_options(profile: Optional[OutputProfile] = None) -> dict:
+    """
+    write_pdf options beyond WeasyPrint's defaults, which already embed
+    unhinted font subsets, compress streams and write no timestamps; only
+    image downsampling depends on the profile.
+    """
+    profile = profile or active()
+    options = {}
+    if profile.image_dpi:
+        options.update(optimize_images=True, dpi=profile.image_dpi)
+    if profile.jpeg_quality:
+        options["jpeg_quality"] = profile.jpeg_quality
+    return options
+
+
+# -------------------------------------------------------------------
+# Fonts
+# -------------------------------------------------------------------
+_font_lock = threading.Lock()
+
+
+def unhinted_font(path: str) -> Optional[str]:
+    """
+    Copy of a bundled TTF with the TrueType hinting removed (instructions
+    inside every glyph, fpgm/prep/cvt), built once next to the fontconfig
+    cache. ReportLab keeps the instructions in the subsets it embeds, which
+    makes up most of their size; viewers and printers do not need them.
+    Every glyph and metric is kept, so layout does not change. The
+    PostScript name gets a suffix: ReportLab shares one face per PostScript
+    name, so the hinted and unhinted files could not both be registered.
+    Returns None when fontTools is unavailable.
+    """
+    from backend.services.weasy_engine import FONTS_CACHE_DIR
+
+    root, ext = os.path.splitext(os.path.basename(path))
+    target = os.path.join(FONTS_CACHE_DIR, f"{root}.unhinted{ext}")
+    with _font_lock:
+        try:
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                return target
+            from fontTools import subset
+            from fontTools.ttLib import TTFont
+
+            options = subset.Options()
+            options.hinting = False
+            options.glyph_names = True
+            options.notdef_outline = True
+            options.name_IDs = ["*"]
+            options.name_languages = ["*"]
+            options.drop_tables += ["meta"]
+            font = TTFont(path)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(glyphs=font.getGlyphOrder())
+            subsetter.subset(font)
+            for record in font["name"].names:
+                if record.nameID == 6:
+                    record.string = f"{record.toUnicode()}-Unhinted"
+            os.makedirs(FONTS_CACHE_DIR, exist_ok=True)
+            temporary = f"{target}.{os.getpid()}.tmp"
+            font.save(temporary)
+            os.replace(temporary, target)
+            return target
+        except Exception as exc:
+            logger.warning("Unhinted font unavailable for %s: %s", path, exc)
+            return None
+
+
+# -------------------------------------------------------------------
+# Images
+# -------------------------------------------------------------------
+_images: "OrderedDict[tuple, bytes]" = OrderedDict()
+_images_lock = threading.Lock()
+
+
+def optimize_image(data: Optional[bytes], kind: str, profile: Optional[OutputProfile] = None) -> Optional[bytes]:
+    """
+    Signature/logo bytes for this profile: downsampled to the printed box
+    at `image_dpi` and, with `jpeg_quality`, flattened on white and encoded
+    as JPEG (embedded as-is by ReportLab instead of re-encoded as raw RGB).
+    Unchanged when the profile keeps images as stored.
+    """
+    profile = profile or active()
+    if not data or not profile.image_dpi:
+        return data
+
+    key = (hashlib.sha1(data).hexdigest(), kind, profile.image_dpi, profile.jpeg_quality)
+    with _images_lock:
+        cached = _images.get(key)
+        if cached is not None:
+            _images.move_to_end(key)
+            return cached
+
+    try:
+        optimized = _recompress(data, kind, profile)
+    except Exception as exc:
+        logger.warning("Image optimization skipped (%s): %s", kind, exc)
+        return data
+
+    with _images_lock:
+        _images[key] = optimized
+        while len(_images) > IMAGE_CACHE_SIZE:
+            _images.popitem(last=False)
+    return optimized
+
+
+def _recompress(data: bytes, kind: str, profile: OutputProfile) -> bytes:
+    from PIL import Image, ImageOps
+    from backend.services.image_derivatives import box_pixels
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    image.thumbnail(box_pixels(kind, profile.image_dpi), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if profile.jpeg_quality:
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        flattened.save(out, format="JPEG", quality=profile.jpeg_quality, optimize=True,
+                       dpi=(profile.image_dpi, profile.image_dpi))
+    else:
+        image.save(out, format="PNG", optimize=True, dpi=(profile.image_dpi, profile.image_dpi))
+    optimized = out.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+# -------------------------------------------------------------------
+# Per-render report
+# -------------------------------------------------------------------
+_stats_lock = threading.Lock()
+render_stats: Dict[str, dict] = {}
+
+
+def record(strategy: str, size: int, seconds: float, profile: Optional[OutputProfile] = None) -> None:
+    """Logs one render and adds it to `render_stats[f"{strategy}/{profile}"]`."""
+    profile = profile or active()
+    logger.info("PDF render %s [%s]: %d bytes in %.1f ms", strategy, profile.name, size, seconds * 1000)
+    key = f"{strategy}/{profile.name}"
+    with _stats_lock:
+        entry = render_stats.setdefault(key, {"renders": 0, "bytes": 0, "seconds": 0.0})
+        entry["renders"] += 1
+        entry["bytes"] += size
+        entry["seconds"] += seconds
+        entry["last_bytes"] = size
+        entry["last_ms"] = round(seconds * 1000, 1)
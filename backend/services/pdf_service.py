@@ -3,15 +3,13 @@
 # from reportlab.lib.units import mm as reportlab_mm
 # from reportlab.lib.pagesizes import A5
 # from weasyprint import HTML
-import base64
 import io
 import logging
 import os
-import tempfile
 import urllib.parse
-from typing import Optional
+from typing import Iterator, Optional, Tuple
 from sqlalchemy.orm import Session
-from backend import models
+from backend import models, repository
 
 logger = logging.getLogger(__name__)
 
@@ -53,79 +51,98 @@ class PDFService:
         return default_bucket, object_path or None
 
     @classmethod
-    def _fetch_signature_assets(
-        cls,
-        doctor_email: str,
-        db: Session
-    ) -> tuple[Optional[str], Optional[bytes]]:
-        if not doctor_email or not db:
-            return None, None
+    def resolve_storage_value(cls, storage_value: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+        default_bucket = os.getenv("FIREBASE_STORAGE_BUCKET") or os.getenv("VITE_FIREBASE_STORAGE_BUCKET")
+        return cls._resolve_storage_object(storage_value, default_bucket)
 
-        doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
-        if not doctor or not doctor.signature_image:
-            return None, None
+    @classmethod
+    def storage_asset(cls, storage_value: Optional[str]):
+        """
+        Imagen de Storage (firma/logo) servida desde la cache local de assets.
+        Usa el derivado de impresion (300 DPI) si existe; si no, el original.
+        En un worker de render se usa la version que vio el proceso de la API
+        (asset_cache.expecting). Devuelve un StoredAsset o None si no existe o
+        no se pudo descargar.
+        """
+        from backend.services.asset_cache import asset_cache, expected_version
+        from backend.services.image_derivatives import derivative_path
 
-        default_bucket = os.getenv("FIREBASE_STORAGE_BUCKET") or os.getenv("VITE_FIREBASE_STORAGE_BUCKET")
-        bucket_name, object_path = cls._resolve_storage_object(doctor.signature_image, default_bucket)
+        bucket_name, object_path = cls.resolve_storage_value(storage_value)
         if not bucket_name or not object_path:
-            logger.warning("Signature storage bucket or path missing")
-            return None, None
+            return None
+        expected = expected_version(storage_value)
+        if expected is not None:
+            asset = asset_cache.get(bucket_name, expected[0], expected_generation=expected[1])
+            if asset is not None:
+                return asset
+        return (
+            asset_cache.get(bucket_name, derivative_path(object_path))
+            or asset_cache.get(bucket_name, object_path)
+        )
+
+    @classmethod
+    def storage_versions(cls, doctor: Optional[models.User]) -> dict:
+        """
+        {valor en Storage: (ruta, generation)} de la firma y el logo que se
+        imprimen, para que el worker de render use exactamente esas versiones.
+        """
+        versions = {}
+        for storage_value in (doctor.signature_image, doctor.print_logo_path) if doctor else ():
+            asset = cls.storage_asset(storage_value) if storage_value else None
+            if asset is not None:
+                versions[storage_value] = (asset.path, asset.generation)
+        return versions
 
-        try:
-            from backend.core.firebase_app import initialize_firebase
-            initialize_firebase()
-            from firebase_admin import storage as firebase_storage
+    @classmethod
+    def invalidate_storage_asset(cls, storage_value: Optional[str]) -> None:
+        """Descarta la copia cacheada de una imagen y de su derivado (el perfil cambio)."""
+        from backend.services.asset_cache import asset_cache
+        from backend.services.image_derivatives import derivative_path
 
-            bucket = firebase_storage.bucket(bucket_name)
-            blob = bucket.blob(object_path)
-            if not blob.exists():
-                logger.warning("Signature blob not found: %s", object_path)
-                return None, None
+        bucket_name, object_path = cls.resolve_storage_value(storage_value)
+        if bucket_name and object_path:
+            asset_cache.invalidate(bucket_name, object_path)
+            asset_cache.invalidate(bucket_name, derivative_path(object_path))
 
-            signature_bytes = blob.download_as_bytes()
-        except Exception as exc:
-            logger.warning("Signature fetch failed: %s", exc)
+    @classmethod
+    def _fetch_signature_assets(
+        cls,
+        doctor_email: str,
+        db: Session,
+        doctor: Optional[models.User] = None
+    ) -> tuple[Optional[str], Optional[bytes]]:
+        if doctor is None:
+            if not doctor_email or not db:
+                return None, None
+            doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
+        if not doctor or not doctor.signature_image:
             return None, None
 
-        signature_base64 = base64.b64encode(signature_bytes).decode("ascii")
-        return signature_base64, signature_bytes
+        asset = cls.storage_asset(doctor.signature_image)
+        if asset is None:
+            logger.warning("Signature unavailable: %s", doctor.signature_image)
+            return None, None
+        return asset.base64, asset.data
 
     @classmethod
     def _fetch_logo_base64(
         cls,
         doctor_email: str,
-        db: Session
+        db: Session,
+        doctor: Optional[models.User] = None
     ) -> Optional[str]:
-        if not doctor_email or not db:
-            return None
-
-        doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
+        if doctor is None:
+            if not doctor_email or not db:
+                return None
+            doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
         if not doctor or not doctor.print_logo_path:
             return None
 
-        default_bucket = os.getenv("FIREBASE_STORAGE_BUCKET") or os.getenv("VITE_FIREBASE_STORAGE_BUCKET")
-        bucket_name, object_path = cls._resolve_storage_object(doctor.print_logo_path, default_bucket)
-        if not bucket_name or not object_path:
-            logger.warning("Logo storage bucket or path missing")
-            return None
-
-        try:
-            from backend.core.firebase_app import initialize_firebase
-            initialize_firebase()
-            from firebase_admin import storage as firebase_storage
-
-            bucket = firebase_storage.bucket(bucket_name)
-            blob = bucket.blob(object_path)
-            if not blob.exists():
-                logger.warning("Logo blob not found: %s", object_path)
-                return None
-
-            logo_bytes = blob.download_as_bytes()
-        except Exception as exc:
-            logger.warning("Logo fetch failed: %s", exc)
+        asset = cls.storage_asset(doctor.print_logo_path)
+        if asset is None:
+            logger.warning("Logo unavailable: %s", doctor.print_logo_path)
             return None
-
-        return base64.b64encode(logo_bytes).decode("ascii")
+        return asset.base64
     
     @staticmethod
     def mm_to_points(millimeters: float) -> float:
@@ -158,8 +175,17 @@ class PDFService:
             models.PrescriptionMap.is_active == True
         ).first()
     
-    @staticmethod
-    def extract_field_value(consultation: models.ClinicalConsultation, field_key: str) -> str:
+    FIELD_MAPPING = {
+        'patient_name': lambda c: f"{c.patient.nombre} {c.patient.apellido_paterno}",
+        'patient_dni': lambda c: c.patient.dni or "N/A",
+        'date': lambda c: c.created_at.strftime('%d/%m/%Y') if c.created_at else "",
+        'diagnosis': lambda c: c.diagnostico or "",
+        'treatment': lambda c: c.plan_tratamiento or "",
+        'doctor_signature': lambda c: "Firma y Sello MÃ©dico"
+    }
+
+    @classmethod
+    def extract_field_value(cls, consultation: models.ClinicalConsultation, field_key: str) -> str:
         """
         Mapea field_key a datos reales de la consulta.
         
@@ -170,16 +196,7 @@ class PDFService:
         Returns:
             str: Valor del campo o cadena vacÃ­a si no existe
         """
-        FIELD_MAPPING = {
-            'patient_name': lambda c: f"{c.patient.nombre} {c.patient.apellido_paterno}",
-            'patient_dni': lambda c: c.patient.dni or "N/A",
-            'date': lambda c: c.created_at.strftime('%d/%m/%Y') if c.created_at else "",
-            'diagnosis': lambda c: c.diagnostico or "",
-            'treatment': lambda c: c.plan_tratamiento or "",
-            'doctor_signature': lambda c: "Firma y Sello MÃ©dico"
-        }
-        
-        mapper = FIELD_MAPPING.get(field_key)
+        mapper = cls.FIELD_MAPPING.get(field_key)
         return mapper(consultation) if mapper else ""
     
     @classmethod
@@ -187,129 +204,86 @@ class PDFService:
         cls,
         consultation: models.ClinicalConsultation,
         prescription_map: models.PrescriptionMap,
-        output_path: str,
+        output_path: Optional[str] = None,
         db: Session = None,
         signature_bytes: Optional[bytes] = None
     ) -> bytes:
         """
         Genera PDF usando ReportLab con coordenadas exactas.
+        El PDF se escribe en memoria; el mapa se compila una sola vez
+        (ver render_plan) y se reutiliza mientras no cambie updated_at.
         
         Args:
             consultation: Datos de la consulta clÃ­nica
             prescription_map: ConfiguraciÃ³n de coordenadas
-            output_path: Ruta temporal para el PDF
+            output_path: Opcional, ademas escribe el PDF en esta ruta
             db: SesiÃ³n de base de datos (para crear verificaciones QR)
         
         Returns:
             bytes: Contenido del PDF generado
         """
         from reportlab.lib.utils import ImageReader
-        from services.qr_service import generate_qr_image
-        import uuid as uuid_lib
-        import datetime
-        
-        import uuid as uuid_lib
-        import datetime
+        from reportlab.graphics import renderPDF
         from reportlab.pdfgen import canvas
-        
-        # 1. Crear canvas con dimensiones del mapa
-        width_pt = cls.mm_to_points(prescription_map.canvas_width_mm)
-        height_pt = cls.mm_to_points(prescription_map.canvas_height_mm)
-        
-        c = canvas.Canvas(output_path, pagesize=(width_pt, height_pt))
-        
-        # 2. Si hay imagen de fondo, renderizarla primero
-        if prescription_map.background_image_url:
-            # TODO: Implementar en fase futura
-            pass
-        
-        # 3. Iterar sobre fields_config y posicionar cada campo
-        for field_config in prescription_map.fields_config:
-            if field_config['field_key'] == 'doctor_signature' and signature_bytes:
-                x_pt = cls.mm_to_points(field_config['x_mm'])
-                y_pt = height_pt - cls.mm_to_points(field_config['y_mm'])
-                width_mm = field_config.get('max_width_mm', 25.0)
-                height_mm = field_config.get('max_height_mm', width_mm)
-                width_pt = cls.mm_to_points(width_mm)
-                height_pt_signature = cls.mm_to_points(height_mm)
-
-                c.drawImage(
-                    ImageReader(io.BytesIO(signature_bytes)),
-                    x_pt,
-                    y_pt - height_pt_signature,
-                    width=width_pt,
-                    height=height_pt_signature,
-                    preserveAspectRatio=True,
-                    mask='auto'
-                )
-                continue
-
-            if field_config['field_key'] == 'qr_code' and db:
-                # Get doctor info
-                doctor = db.query(models.User).filter(
-                    models.User.email == consultation.owner_id
-                ).first()
-                doctor_name = doctor.professional_name if doctor and doctor.professional_name else "Dr. Vitalinuage"
-                
-                # Generar registro de verificaciÃ³n
-                verification_uuid = str(uuid_lib.uuid4())
-                verification = models.PrescriptionVerification(
-                    uuid=verification_uuid,
-                    consultation_id=consultation.id,
-                    doctor_email=consultation.owner_id,
-                    doctor_name=doctor_name,
-                    issue_date=datetime.datetime.utcnow()
-                )
-                db.add(verification)
-                db.commit()
-                db.refresh(verification)
-                
-                # Persistence Confirmation Log
-                import logging
-                logging.getLogger(__name__).info(f"QR Persistence Confirmed [Coords]: {verification.uuid}")
-                
-                # Generar QR
-                from backend.services.qr_service import get_verification_url
-                qr_url = get_verification_url(verification_uuid)
-                qr_image = generate_qr_image(qr_url, field_config.get('max_width_mm', 25.0))
-                
-                # Posicionar en canvas
-                x_pt = cls.mm_to_points(field_config['x_mm'])
-                y_pt = height_pt - cls.mm_to_points(field_config['y_mm'])
-                size_pt = cls.mm_to_points(field_config.get('max_width_mm', 25.0))
-                
-                # Dibujar imagen
-                c.drawImage(
-                    ImageReader(qr_image),
-                    x_pt,
-                    y_pt - size_pt,  # Ajuste para alineaciÃ³n
-                    width=size_pt,
-                    height=size_pt,
-                    preserveAspectRatio=True
-                )
-            else:
-                # LÃ³gica existente para campos de texto
-                field_value = cls.extract_field_value(consultation, field_config['field_key'])
-                
-                # Convertir coordenadas mm â†’ puntos
-                x_pt = cls.mm_to_points(field_config['x_mm'])
-                # IMPORTANTE: ReportLab usa origen en esquina inferior izquierda
-                # Invertir Y: y_pdf = height - y_mm
-                y_pt = height_pt - cls.mm_to_points(field_config['y_mm'])
-                
-                # Configurar fuente
-                font_size = field_config.get('font_size_pt', 10)
-                c.setFont("Helvetica", font_size)
-                
-                # Dibujar texto
-                c.drawString(x_pt, y_pt, field_value)
-        
-        # 4. Finalizar y guardar
-        c.save()
-        
-        # 5. Leer bytes del archivo
-        with open(output_path, 'rb') as f:
-            return f.read()
+        from backend.services import pdf_profile
+        from backend.services.qr_service import get_qr_drawing, get_verification_url
+        from backend.services.render_plan import get_map_plan
+        
+        plan = get_map_plan(prescription_map)
+        verification = None
+        
+        # Verificacion de la consulta: se reutiliza en cada render (idempotente).
+        # Se resuelve antes del canvas para no tener la BD dentro del lock de ReportLab
+        if db and any(field.kind == 'qr' for field in plan.fields):
+            verification = repository.get_or_create_verification(
+                db, consultation.id, consultation.owner_id
+            )
+
+        # 1. Crear canvas con dimensiones del mapa (en memoria)
+        buffer = io.BytesIO()
+        with pdf_profile.reportlab_document() as options:
+            c = canvas.Canvas(buffer, pagesize=(plan.width_pt, plan.height_pt), **options)
+        
+            # 2. Si hay imagen de fondo, renderizarla primero
+            if prescription_map.background_image_url:
+                # TODO: Implementar en fase futura
+                pass
+        
+            # 3. Recorrer el plan compilado (coordenadas ya en puntos)
+            for field in plan.fields:
+                if field.kind == 'signature' and signature_bytes:
+                    c.drawImage(
+                        ImageReader(io.BytesIO(signature_bytes)),
+                        field.x_pt,
+                        field.y_pt - field.height_pt,
+                        width=field.width_pt,
+                        height=field.height_pt,
+                        preserveAspectRatio=True,
+                        mask='auto'
+                    )
+                    continue
+
+                if field.kind == 'qr' and db:
+                    # Dibujar QR vectorial (sin PNG intermedio)
+                    renderPDF.draw(
+                        get_qr_drawing(get_verification_url(verification.uuid), field.width_pt),
+                        c,
+                        field.x_pt,
+                        field.y_pt - field.width_pt  # Ajuste para alineaciÃ³n
+                    )
+                else:
+                    # Campos de texto: fuente y extractor resueltos al compilar
+                    c.setFont(field.font_name, field.font_size)
+                    c.drawString(field.x_pt, field.y_pt, field.extract(consultation))
+        
+            # 4. Finalizar
+            c.save()
+        pdf_bytes = buffer.getvalue()
+        
+        if output_path:
+            with open(output_path, 'wb') as f:
+                f.write(pdf_bytes)
+        return pdf_bytes
     
     @classmethod
     def generate_with_template(
@@ -332,22 +306,13 @@ class PDFService:
         Returns:
             bytes: Contenido del PDF generado
         """
-        from backend.pdf_templates import MINIMAL_TEMPLATE, MODERN_TEMPLATE, CLASSIC_TEMPLATE
-        from jinja2 import Template
-        try:
-            from weasyprint import HTML
-        except ImportError:
-             raise Exception("WeasyPrint module not found. Please install backend dependencies.")
+        from backend.services.template_registry import template_registry, BUILTIN_TEMPLATES
+        from backend.services import weasy_engine
 
 
         
-        # 1. Seleccionar template
-        templates = {
-            'minimal': MINIMAL_TEMPLATE,
-            'modern': MODERN_TEMPLATE,
-            'classic': CLASSIC_TEMPLATE
-        }
-        template_html = templates.get(template_id, MODERN_TEMPLATE)
+        # 1. Seleccionar template (precompilado en el registro)
+        template_name = BUILTIN_TEMPLATES.get(template_id, BUILTIN_TEMPLATES['modern'])
         
         # 2. Preparar datos para el template
         # Create mock objects that match template structure
@@ -380,11 +345,10 @@ class PDFService:
         }
         
         # 3. Renderizar template
-        template = Template(template_html)
-        html_content = template.render(**context)
+        html_content = template_registry.render(template_name, **context)
         
         # 4. Generar PDF con WeasyPrint
-        pdf_bytes = HTML(string=html_content).write_pdf()
+        pdf_bytes = weasy_engine.write_pdf(html_content)
         
         return pdf_bytes
     
@@ -414,7 +378,7 @@ class PDFService:
         return None
 
     @classmethod
-    def generate_from_html_file(
+    def prescription_context(
         cls,
         consultation: models.ClinicalConsultation,
         verification_uuid: str = "",
@@ -424,23 +388,14 @@ class PDFService:
         secondary_color: Optional[str] = None,
         header_text: Optional[str] = None,
         footer_text: Optional[str] = None,
-        db: Session = None  # New Argument injected from API
-    ) -> bytes:
+        db: Session = None
+    ) -> dict:
         """
-        Generates PDF using the A5 HTML template file.
+        Contexto de la receta A5 (template HTML y capa sobre membrete).
         Uses db session to fetch or create PrescriptionVerification.
         """
-        import jinja2
-        import os
         import datetime
-        import uuid as uuid_lib
-        
-        # Paths
-        base_dir = os.path.dirname(os.path.dirname(__file__)) # backend/
-        template_dir = os.path.join(base_dir, 'templates')
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
-        template = env.get_template('recipe_template.html')
-        
+
         # Context Data
         age = "N/A"
         dob = cls._parse_date(consultation.patient.fecha_nacimiento) if consultation.patient else None
@@ -462,36 +417,12 @@ class PDFService:
         final_uuid = verification_uuid
         
         if db and not final_uuid:
-            # 1. Try to find existing
-            verification = db.query(models.PrescriptionVerification).filter(
-                models.PrescriptionVerification.consultation_id == consultation.id
-            ).first()
-            
-            if verification:
-                final_uuid = verification.uuid
-            else:
-                # 2. Create new if missing
-                try:
-                    new_uuid = str(uuid_lib.uuid4())
-                    
-                    # Resolve Doctor Info for Verification Record
-                    doc_user = db.query(models.User).filter(models.User.email == consultation.owner_id).first()
-                    doc_name = doc_user.professional_name if doc_user and doc_user.professional_name else doctor
-                    
-                    new_verification = models.PrescriptionVerification(
-                        uuid=new_uuid,
-                        consultation_id=consultation.id,
-                        doctor_email=consultation.owner_id,
-                        doctor_name=doc_name,
-                        issue_date=datetime.datetime.utcnow()
-                    )
-                    db.add(new_verification)
-                    db.commit()
-                    db.refresh(new_verification)
-                    final_uuid = new_uuid
-                except Exception as e:
-                    print(f"Error creating verification record: {e}")
-                    final_uuid = "ERROR-GEN-UUID"
+            # Reutiliza la verificacion de la consulta o la crea (una sola por consulta)
+            try:
+                final_uuid = repository.get_or_create_verification(db, consultation.id, consultation.owner_id).uuid
+            except Exception as e:
+                print(f"Error creating verification record: {e}")
+                final_uuid = "ERROR-GEN-UUID"
 
         context = {
             'doctor': {
@@ -525,9 +456,10 @@ class PDFService:
              display_url = verify_url.replace("https://", "").replace("http://", "")
              
              try:
-                 from backend.services.qr_service import get_qr_base64
+                 from backend.services.qr_service import get_qr_svg_base64
                  context['verification_display_url'] = display_url
-                 context['qr_base64'] = get_qr_base64(verify_url)
+                 context['verification_url'] = verify_url
+                 context['qr_svg_base64'] = get_qr_svg_base64(verify_url)
              except Exception as e:
                  print(f"QR Gen failed: {e}")
                  context['qr_base64'] = None
@@ -538,21 +470,128 @@ class PDFService:
              context['qr_base64'] = None
              base_url_neat = get_base_url().replace("https://", "").replace("http://", "")
              context['verification_display_url'] = f"{base_url_neat}/v/..."
-        
+        return context
+
+    @classmethod
+    def generate_from_html_file(
+        cls,
+        consultation: models.ClinicalConsultation,
+        verification_uuid: str = "",
+        signature_base64: Optional[str] = None,
+        logo_base64: Optional[str] = None,
+        primary_color: Optional[str] = None,
+        secondary_color: Optional[str] = None,
+        header_text: Optional[str] = None,
+        footer_text: Optional[str] = None,
+        db: Session = None  # New Argument injected from API
+    ) -> bytes:
+        """
+        Generates PDF using the A5 HTML template file.
+        Uses db session to fetch or create PrescriptionVerification.
+        """
+        from backend.services.template_registry import template_registry
+        
+        base_dir = os.path.dirname(os.path.dirname(__file__)) # backend/ (base_url de WeasyPrint)
+        template = template_registry.get('pdf/recipe_template.html')
+
+        context = cls.prescription_context(
+            consultation,
+            verification_uuid=verification_uuid,
+            signature_base64=signature_base64,
+            logo_base64=logo_base64,
+            primary_color=primary_color,
+            secondary_color=secondary_color,
+            header_text=header_text,
+            footer_text=footer_text,
+            db=db
+        )
         html_content = template.render(**context)
         
 
         
-        # WeasyPrint
+        # WeasyPrint (configuracion de fuentes compartida, ver weasy_engine)
         # Ensure we are in backend root or set base_url for assets if needed
-        try:
-             from weasyprint import HTML
-        except ImportError:
-             raise Exception("WeasyPrint module not found. PDF generation unavailable.")
+        from backend.services import weasy_engine
 
-        pdf_bytes = HTML(string=html_content, base_url=base_dir).write_pdf()
+        pdf_bytes = weasy_engine.write_pdf(html_content, base_url=base_dir)
         return pdf_bytes
 
+    # Bump when templates or layout code change so cached PDFs are not reused
+    RENDER_VERSION = "5"
+
+    @classmethod
+    def asset_version(cls, storage_value: Optional[str]) -> Optional[str]:
+        # Generation de la imagen en Storage: re-subir la misma ruta cambia la clave
+        # (claves de cache del PDF y de los previews)
+        if not storage_value:
+            return None
+        asset = cls.storage_asset(storage_value)
+        return asset.generation if asset else None
+
+    @classmethod
+    def render_cache_key(
+        cls,
+        consultation: models.ClinicalConsultation,
+        doctor: Optional[models.User],
+        prescription_map: Optional[models.PrescriptionMap]
+    ) -> str:
+        """
+        Digest de todos los insumos del render: consulta (id + updated_at),
+        paciente, preferencias de impresion, version del mapa activo y
+        assets (ruta + generation de firma/logo). Incluye la fecha del dia porque
+        la edad del paciente se calcula al renderizar. El perfil de salida
+        (pdf_profile) tambien entra: cambia fuentes, imagenes y compresion.
+        """
+        import datetime
+        from backend.services import pdf_profile, stationery
+        from backend.services.pdf_cache import digest_key
+        from backend.services.qr_service import get_base_url
+
+        patient = consultation.patient
+        return digest_key(
+            "prescription",
+            cls.RENDER_VERSION,
+            consultation.id,
+            consultation.updated_at,
+            patient.id if patient else None,
+            getattr(patient, "updated_at", None),
+            patient.nombre if patient else None,
+            patient.apellido_paterno if patient else None,
+            patient.dni if patient else None,
+            patient.fecha_nacimiento if patient else None,
+            datetime.date.today().isoformat(),
+            doctor.professional_name if doctor else None,
+            doctor.print_template_id if doctor else None,
+            doctor.print_paper_size if doctor else None,
+            doctor.print_header_text if doctor else None,
+            doctor.print_footer_text if doctor else None,
+            doctor.print_primary_color if doctor else None,
+            doctor.print_secondary_color if doctor else None,
+            doctor.print_logo_path if doctor else None,
+            cls.asset_version(doctor.print_logo_path if doctor else None),
+            doctor.signature_image if doctor else None,
+            cls.asset_version(doctor.signature_image if doctor else None),
+            prescription_map.id if prescription_map else "no-map",
+            prescription_map.updated_at if prescription_map else None,
+            get_base_url(),
+            stationery.STATIONERY_VERSION if stationery.enabled() else "html",
+            pdf_profile.active().name,
+        )
+
+    @classmethod
+    def prescription_render_inputs(
+        cls,
+        consultation: models.ClinicalConsultation,
+        doctor_email: str,
+        db: Session
+    ) -> Tuple[Optional[models.User], Optional[models.PrescriptionMap], str]:
+        """
+        Medico, mapa activo y clave de cache de una receta, sin renderizar.
+        """
+        doc_user = db.query(models.User).filter(models.User.email == doctor_email).first()
+        prescription_map = cls.get_active_map(doctor_email, db)
+        return doc_user, prescription_map, cls.render_cache_key(consultation, doc_user, prescription_map)
+
     @classmethod
     def generate_prescription_pdf(
         cls,
@@ -562,36 +601,121 @@ class PDFService:
     ) -> bytes:
         """
         Metodo principal: decide que estrategia usar (coordenadas vs template).
+        Los PDFs se sirven desde la cache (memoria + disco) cuando ningun
+        insumo del render cambio desde la ultima descarga.
         """
-        signature_base64, signature_bytes = cls._fetch_signature_assets(doctor_email, db)
-        logo_base64 = cls._fetch_logo_base64(doctor_email, db)
+        from backend.services.pdf_cache import pdf_cache
+
+        doc_user, prescription_map, cache_key = cls.prescription_render_inputs(consultation, doctor_email, db)
+        cached = pdf_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        pdf_bytes = cls._render_prescription_pdf(consultation, doctor_email, doc_user, prescription_map, db)
+        pdf_cache.put(cache_key, pdf_bytes)
+        return pdf_bytes
+
+    @classmethod
+    def generate_patient_dossier(
+        cls,
+        patient: models.Patient,
+        doctor_email: str,
+        db: Session
+    ) -> Iterator[bytes]:
+        """
+        Historial clinico completo del paciente como un PDF A4, entregado por
+        partes: cada pagina se envia apenas se compone y las consultas se leen
+        por lotes, asi la memoria no crece con la cantidad de visitas.
+        """
+        import datetime
+        from backend.services import dossier
+
         doc_user = db.query(models.User).filter(models.User.email == doctor_email).first()
+        dob = cls._parse_date(patient.fecha_nacimiento)
+        age = "N/A"
+        if dob:
+            today = datetime.date.today()
+            age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
 
-        # 1. Buscar mapa activo del medico
-        prescription_map = cls.get_active_map(doctor_email, db)
+        patient_info = {
+            'name': " ".join(part for part in (patient.nombre, patient.apellido_paterno, patient.apellido_materno) if part),
+            'dni': patient.dni or "N/A",
+            'age': age,
+            'issued': datetime.date.today().strftime('%d/%m/%Y'),
+        }
+        doctor_info = {
+            'name': (doc_user.professional_name if doc_user else None) or "Dr. Vitalinuage",
+            'specialty': (doc_user.specialty if doc_user else None) or "Medicina General",
+        }
+        consultations = repository.iter_patient_consultations(db, doctor_email, patient.id)
+        return dossier.render_dossier(
+            patient_info, doctor_info, consultations,
+            consultation_date=lambda consultation: cls._parse_date(consultation.created_at)
+        )
+
+    @classmethod
+    def _render_prescription_pdf(
+        cls,
+        consultation: models.ClinicalConsultation,
+        doctor_email: str,
+        doc_user: Optional[models.User],
+        prescription_map: Optional[models.PrescriptionMap],
+        db: Session
+    ) -> bytes:
+        """
+        Render sin cache con el perfil de salida activo; registra bytes y
+        tiempo de cada render (pdf_profile.render_stats).
+        """
+        import time
+        from backend.services import pdf_profile
+
+        profile = pdf_profile.active()
+        started = time.perf_counter()
+        strategy, pdf_bytes = cls._render_with_strategy(consultation, doctor_email, doc_user, prescription_map, db)
+        pdf_profile.record(strategy, len(pdf_bytes), time.perf_counter() - started, profile)
+        return pdf_bytes
+
+    @staticmethod
+    def _profile_image(data: Optional[bytes], kind: str) -> Tuple[Optional[str], Optional[bytes]]:
+        """Firma/logo re-muestreados segun el perfil, como (base64, bytes)."""
+        import base64
+        from backend.services import pdf_profile
+
+        optimized = pdf_profile.optimize_image(data, kind)
+        if not optimized:
+            return None, None
+        return base64.b64encode(optimized).decode("ascii"), optimized
+
+    @classmethod
+    def _render_with_strategy(
+        cls,
+        consultation: models.ClinicalConsultation,
+        doctor_email: str,
+        doc_user: Optional[models.User],
+        prescription_map: Optional[models.PrescriptionMap],
+        db: Session
+    ) -> Tuple[str, bytes]:
+        import base64
+        from backend.services import native_recipe, pdf_profile, stationery
+
+        signature_base64, signature_bytes = cls._fetch_signature_assets(doctor_email, db, doctor=doc_user)
+        logo_base64 = cls._fetch_logo_base64(doctor_email, db, doctor=doc_user)
+        if pdf_profile.active().image_dpi:
+            signature_base64, signature_bytes = cls._profile_image(signature_bytes, "signature")
+            if logo_base64:
+                logo_base64, _ = cls._profile_image(base64.b64decode(logo_base64), "logo")
         
         # 2. Decidir estrategia
         if prescription_map:
-            # Usar coordenadas personalizadas (ReportLab)
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-                pdf_bytes = cls.generate_with_coordinates(
-                    consultation, 
-                    prescription_map, 
-                    tmp.name,
-                    db=db,
-                    signature_bytes=signature_bytes
-                )
-                try:
-                    os.unlink(tmp.name)
-                except:
-                    pass
-            return pdf_bytes
+            # Usar coordenadas personalizadas (ReportLab, en memoria)
+            return "coordinates", cls.generate_with_coordinates(
+                consultation, 
+                prescription_map, 
+                db=db,
+                signature_bytes=signature_bytes
+            )
         else:
             # Usar nueva estrategia: Template HTML A5 del sistema
-            from backend import models
-            import uuid as uuid_lib
-            import datetime
-            
             # Buscar verificacion para el footer
             # SLICE 31.1: Now handled inside generate_from_html_file via db param
             # We pass existing verification UUID if we have it, or let the function resolve it.
@@ -601,10 +725,7 @@ class PDFService:
             ).first()
             
             uuid_str = verification.uuid if verification else ""
-            
-            return cls.generate_from_html_file(
-                consultation,
-                verification_uuid=uuid_str,
+            template_args = dict(
                 signature_base64=signature_base64,
                 logo_base64=logo_base64,
                 primary_color=doc_user.print_primary_color if doc_user and doc_user.print_primary_color else None,
@@ -614,3 +735,16 @@ class PDFService:
                 db=db
             )
 
+            if native_recipe.is_selected(doc_user):
+                # Motor ReportLab nativo (print_template_id = "native"), sin WeasyPrint
+                context = cls.prescription_context(consultation, verification_uuid=uuid_str, **template_args)
+                return "native", native_recipe.render(context)
+
+            if stationery.enabled():
+                # Membrete cacheado por medico + capa ReportLab con los datos de la receta
+                context = cls.prescription_context(consultation, verification_uuid=uuid_str, **template_args)
+                pdf_bytes = stationery.render_prescription(context)
+                if pdf_bytes is not None:
+                    return "stationery", pdf_bytes
+
+            return "html", cls.generate_from_html_file(consultation, verification_uuid=uuid_str, **template_args)
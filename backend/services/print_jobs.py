@@ -0,0 +1,324 @@
+"""
+Batch print queue: renders a selection of prescriptions (a clinic day or an
+explicit list) as one background job and produces a single merged PDF or a
+ZIP with one PDF per consultation.
+"""
+import contextlib
+import datetime
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from typing import Callable, List, Optional
+
+from backend.services.render_pool import render_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _load_owned_consultation(db, consultation_id: int, owner_id: str):
+    from sqlalchemy.orm import joinedload
+    from backend import models
+
+    return db.query(models.ClinicalConsultation).options(
+        joinedload(models.ClinicalConsultation.patient)
+    ).filter(
+        models.ClinicalConsultation.id == consultation_id,
+        models.ClinicalConsultation.owner_id == owner_id
+    ).first()
+
+
+def job_filename(job) -> str:
+    day = job.created_at.strftime("%Y%m%d")
+    return f"recetas_{day}.{job.format}"
+
+
+def job_status(job) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "format": job.format,
+        "total": len(job.consultation_ids),
+        "done": job.done,
+        "failed_ids": list(job.failed_ids or []),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "error": job.error,
+        "download_url": f"/api/consultas/print-jobs/{job.id}/download" if job.status == "done" else None,
+    }
+
+
+class PrintJobStore:
+    """
+    Print jobs are rows of models.PrintJob, so any instance behind the load
+    balancer can report status and serve the download. The job is rendered by
+    the instance that accepted it (a background task) into `directory`, then
+    uploaded to `bucket` under print-jobs/; without a bucket the file stays
+    local and only that instance can serve it (single-instance / dev setups).
+    Jobs and their output are purged once older than `ttl_seconds`, checked at
+    most every `purge_interval` seconds on create, status and download. A
+    queued or running job with no progress for `stall_seconds` was lost with
+    its instance and is reported as failed.
+
+    Each prescription is one render_prescription call on the shared render
+    pool, one after another: it gets the normal single-render timeout, goes
+    through the PDF cache and coalescing, and a batch never holds more than
+    one worker, so interactive renders keep the rest. Progress is saved
+    after every prescription. ZIP output is written entry by entry; the
+    merged PDF keeps every page in memory until it is written (pypdf has no
+    incremental writer), which is why merged jobs are capped at
+    PRINT_JOB_MAX_MERGED_ITEMS.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: float = 3600.0,
+        bucket: Optional[str] = None,
+        stall_seconds: float = 300.0,
+        purge_interval: float = 60.0,
+        session_factory: Optional[Callable] = None,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.bucket = bucket
+        self.stall_seconds = stall_seconds
+        self.purge_interval = purge_interval
+        self._session_factory = session_factory
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PrintJobStore":
+        return cls(
+            directory=os.getenv("PRINT_JOB_DIR") or os.path.join(tempfile.gettempdir(), "vitalinuage-print-jobs"),
+            ttl_seconds=float(os.getenv("PRINT_JOB_TTL_MINUTES", "60")) * 60,
+            bucket=os.getenv("FIREBASE_STORAGE_BUCKET") or os.getenv("VITE_FIREBASE_STORAGE_BUCKET"),
+        )
+
+    # -------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------
+    def create(self, owner_id: str, consultation_ids: List[int], output_format: str):
+        from backend import models
+
+        self._maybe_purge()
+        now = datetime.datetime.utcnow()
+        job = models.PrintJob(
+            id=uuid.uuid4().hex, owner_id=owner_id, consultation_ids=list(consultation_ids),
+            format=output_format, status="queued", done=0, failed_ids=[],
+            created_at=now, updated_at=now,
+        )
+        with self._session() as db:
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        return job
+
+    def get(self, job_id: str, owner_id: str):
+        """Owner-scoped lookup: another doctor's job reads as missing."""
+        self._maybe_purge()
+        job = self._load(job_id)
+        if job is None or job.owner_id != owner_id:
+            return None
+        stalled_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.stall_seconds)
+        if job.status in ("queued", "running") and job.updated_at < stalled_before:
+            self._save(job, status="failed", error="Trabajo interrumpido", finished_at=datetime.datetime.utcnow())
+        return job
+
+    def output(self, job) -> Optional[bytes]:
+        """The finished file, or None if it is gone (purged, or local to another instance)."""
+        if job.status != "done" or not job.output_path:
+            return None
+        try:
+            if job.output_bucket:
+                blob = self._bucket(job.output_bucket).get_blob(job.output_path)
+                return blob.download_as_bytes() if blob is not None else None
+            with open(job.output_path, "rb") as handle:
+                return handle.read()
+        except Exception as exc:
+            logger.warning("Print job %s output unavailable: %s", job.id, exc)
+            return None
+
+    def purge_expired(self) -> int:
+        from backend import models
+
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+        with self._session() as db:
+            expired = db.query(models.PrintJob).filter(models.PrintJob.created_at < cutoff).all()
+            for job in expired:
+                self._remove_output(job)
+                db.delete(job)
+            db.commit()
+        return len(expired)
+
+    async def run(self, job_id: str) -> None:
+        """Background task scheduled by the create endpoint."""
+        from fastapi.concurrency import run_in_threadpool
+
+        job = await run_in_threadpool(self._load, job_id)
+        if job is None:
+            return
+        path = os.path.join(self.directory, f"{job.id}.{job.format}")
+        await run_in_threadpool(self._save, job, status="running")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if job.format == "zip":
+                produced = await self._write_zip(job, path)
+            else:
+                produced = await self._write_pdf(job, path)
+            if not produced:
+                raise RuntimeError("Ninguna receta pudo generarse")
+            output_path = await run_in_threadpool(self._publish, job, path)
+            saved = await run_in_threadpool(
+                self._save, job, status="done", output_bucket=self.bucket, output_path=output_path,
+                finished_at=datetime.datetime.utcnow()
+            )
+            if not saved:
+                # Purged while rendering: nobody can download it any more
+                await run_in_threadpool(self._remove_output, job)
+        except Exception as exc:
+            logger.warning("Print job %s failed: %s", job.id, exc)
+            self._remove_file(path)
+            await run_in_threadpool(
+                self._save, job, status="failed", error=str(exc), finished_at=datetime.datetime.utcnow()
+            )
+
+    # -------------------------------------------------------------------
+    # Rendering
+    # -------------------------------------------------------------------
+    async def _rendered(self, job):
+        """Yields (consultation_id, pdf_bytes) prescription by prescription, tracking progress."""
+        from fastapi.concurrency import run_in_threadpool
+        from backend.database import SessionLocal
+
+        db = SessionLocal()
+        done, failed_ids = 0, []
+        try:
+            for consultation_id in job.consultation_ids:
+                try:
+                    consultation = await run_in_threadpool(_load_owned_consultation, db, consultation_id, job.owner_id)
+                    if consultation is None:
+                        raise LookupError("Consulta no encontrada")
+                    pdf_bytes = await render_pool.render_prescription(consultation, job.owner_id, db)
+                except Exception as exc:
+                    logger.warning("Print job %s: consultation %s failed: %s", job.id, consultation_id, exc)
+                    pdf_bytes = None
+                if pdf_bytes is None:
+                    failed_ids.append(consultation_id)
+                done += 1
+                await run_in_threadpool(self._save, job, done=done, failed_ids=list(failed_ids))
+                if pdf_bytes is not None:
+                    yield consultation_id, pdf_bytes
+        finally:
+            await run_in_threadpool(db.close)
+
+    async def _write_pdf(self, job, path: str) -> int:
+        """Merged PDF: pages accumulate in the writer until the single write() at the end."""
+        from pypdf import PdfReader, PdfWriter
+
+        writer = PdfWriter()
+        produced = 0
+        async for _, pdf_bytes in self._rendered(job):
+            writer.append(PdfReader(io.BytesIO(pdf_bytes)))
+            produced += 1
+        if produced:
+            writer.add_metadata({"/Title": "Recetas Médicas", "/Producer": "Vitalinuage"})
+            with open(path, "wb") as handle:
+                writer.write(handle)
+        return produced
+
+    async def _write_zip(self, job, path: str) -> int:
+        """One entry per prescription, written as it arrives: one PDF in memory at a time."""
+        produced = 0
+        # PDFs are already compressed: store them as-is
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+            async for consultation_id, pdf_bytes in self._rendered(job):
+                archive.writestr(f"receta_{consultation_id}.pdf", pdf_bytes)
+                produced += 1
+        return produced
+
+    # -------------------------------------------------------------------
+    # Storage
+    # -------------------------------------------------------------------
+    def _session(self):
+        if self._session_factory is None:
+            from backend.database import SessionLocal
+            self._session_factory = SessionLocal
+        return contextlib.closing(self._session_factory())
+
+    def _load(self, job_id: str):
+        from backend import models
+
+        with self._session() as db:
+            job = db.query(models.PrintJob).filter(models.PrintJob.id == job_id).first()
+            if job is not None:
+                db.expunge(job)
+            return job
+
+    def _save(self, job, **fields) -> bool:
+        """Updates the row and the detached copy. False if the row was purged."""
+        from backend import models
+
+        fields["updated_at"] = datetime.datetime.utcnow()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        with self._session() as db:
+            updated = db.query(models.PrintJob).filter(models.PrintJob.id == job.id).update(
+                fields, synchronize_session=False
+            )
+            db.commit()
+        return bool(updated)
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+        try:
+            self.purge_expired()
+        except Exception as exc:
+            logger.warning("Print job purge failed: %s", exc)
+
+    @staticmethod
+    def _bucket(name: str):
+        from backend.services.asset_cache import asset_cache
+        return asset_cache.bucket_factory(name)
+
+    def _publish(self, job, path: str) -> str:
+        """Moves the finished file to Storage; returns where it is kept now."""
+        if not self.bucket:
+            return path
+        object_path = f"print-jobs/{job.id}.{job.format}"
+        media_type = "application/zip" if job.format == "zip" else "application/pdf"
+        self._bucket(self.bucket).blob(object_path).upload_from_filename(path, content_type=media_type)
+        self._remove_file(path)
+        return object_path
+
+    def _remove_output(self, job) -> None:
+        if not job.output_path:
+            return
+        if not job.output_bucket:
+            self._remove_file(job.output_path)
+            return
+        try:
+            blob = self._bucket(job.output_bucket).get_blob(job.output_path)
+            if blob is not None:
+                blob.delete()
+        except Exception as exc:
+            logger.warning("Print job %s output not deleted: %s", job.id, exc)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+print_jobs = PrintJobStore.from_env()
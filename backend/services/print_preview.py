@@ -0,0 +1,428 @@
+"""
+Low-fidelity PNG previews for the print settings screens:
+
+- page 1 of the A5 recipe for the print preferences, drawn by the same
+  layout code as the native engine (native_recipe.draw_page) on a Pillow
+  image instead of a PDF canvas, with screen-sized thumbnails of the logo
+  and signature. The HTML, stationery and native engines share that
+  layout; a doctor with an active PrescriptionMap prints with the map
+  instead, and gets the map preview;
+- a PrescriptionMap for the visual map editor, drawn from its compiled
+  render plan over the scanned stationery.
+
+Both use sample consultation data. Previews are never printed: the final
+PDF still goes through PDFService.
+"""
+import base64
+import datetime
+import functools
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+from backend.services.pdf_cache import PDFCache, digest_key
+from backend.services.stationery import MM_TO_PT, PAGE_MM
+
+logger = logging.getLogger(__name__)
+
+# Bump when the preview drawing changes so cached previews are rebuilt
+PREVIEW_VERSION = "1"
+PREVIEW_DPI = 72
+MIN_DPI, MAX_DPI = 36, 150
+
+SAMPLE_TREATMENT = (
+    "Paracetamol 500 mg: 1 comprimido cada 8 horas por 5 días.\n"
+    "Ibuprofeno 400 mg: 1 comprimido cada 12 horas si hay dolor.\n"
+    "Reposo relativo e hidratación abundante."
+)
+SAMPLE_DIAGNOSIS = "Cuadro viral agudo"
+
+# Memory-only LRU for preview PNGs and asset thumbnails
+preview_cache = PDFCache(int(float(os.getenv("PDF_PREVIEW_CACHE_MB", "16")) * 1024 * 1024), None, 0)
+
+MAP_FIELD_OUTLINE = (147, 197, 253)
+PLACEHOLDER_FILL = (226, 232, 240)
+
+
+def _rgb(color) -> Tuple[int, int, int]:
+    return round(color.red * 255), round(color.green * 255), round(color.blue * 255)
+
+
+@functools.lru_cache(maxsize=64)
+def _font(name: str, pixels: int):
+    from PIL import ImageFont
+    from backend.services.weasy_engine import FONTS_DIR
+
+    filename = "arialbd.ttf" if "Bold" in name else "arial.ttf"
+    try:
+        return ImageFont.truetype(os.path.join(FONTS_DIR, filename), max(pixels, 1))
+    except OSError:
+        return ImageFont.load_default(size=max(pixels, 1))
+
+
+@functools.lru_cache(maxsize=2048)
+def _text_mask(name: str, pixels: int, text: str, anchor: str):
+    """
+    Rasterized text run as an alpha mask plus its offset from the anchor.
+    FreeType hinting makes small Arial sizes slow to rasterize, and most
+    runs (labels, sample data) repeat across previews; only the color and
+    the edited texts change.
+    """
+    from PIL import Image, ImageDraw
+
+    font = _font(name, pixels)
+    left, top, right, bottom = font.getbbox(text, anchor=anchor)
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font, anchor=anchor)
+    return mask, (left, top)
+
+
+class PreviewCanvas:
+    """
+    The subset of the ReportLab canvas API the recipe layout uses, drawn on
+    a Pillow image. Coordinates are PDF points with the origin at the
+    bottom-left, as on the real canvas.
+    """
+
+    def __init__(self, dpi: int = PREVIEW_DPI, page_mm: Tuple[float, float] = PAGE_MM, background=None):
+        from PIL import Image, ImageDraw
+
+        self.scale = dpi / 72.0
+        self.page_height = page_mm[1] * MM_TO_PT
+        size = (round(page_mm[0] * MM_TO_PT * self.scale), round(self.page_height * self.scale))
+        self.image = background.copy() if background is not None else Image.new("RGB", size, (255, 255, 255))
+        self.draw = ImageDraw.Draw(self.image)
+        self._fill = (0, 0, 0)
+        self._stroke = (0, 0, 0)
+        self._line_width = 1.0
+        self._font = ("Helvetica", 10.0)
+
+    def _xy(self, x: float, y: float) -> Tuple[float, float]:
+        return x * self.scale, (self.page_height - y) * self.scale
+
+    def setFillColor(self, color) -> None:
+        self._fill = _rgb(color)
+
+    def setStrokeColor(self, color) -> None:
+        self._stroke = _rgb(color)
+
+    def setLineWidth(self, width: float) -> None:
+        self._line_width = width
+
+    def setFont(self, name: str, size: float) -> None:
+        self._font = (name, size)
+
+    def _text(self, x: float, y: float, text: str, anchor: str) -> None:
+        name, size = self._font
+        mask, (left, top) = _text_mask(name, round(size * self.scale), str(text), anchor)
+        px, py = self._xy(x, y)
+        self.image.paste(self._fill, (round(px) + left, round(py) + top), mask)
+
+    def drawString(self, x: float, y: float, text: str) -> None:
+        self._text(x, y, text, "ls")
+
+    def drawRightString(self, x: float, y: float, text: str) -> None:
+        self._text(x, y, text, "rs")
+
+    def drawCentredString(self, x: float, y: float, text: str) -> None:
+        self._text(x, y, text, "ms")
+
+    def line(self, x1: float, y1: float, x2: float, y2: float) -> None:
+        self.draw.line([self._xy(x1, y1), self._xy(x2, y2)], fill=self._stroke,
+                       width=max(1, round(self._line_width * self.scale)))
+
+    def roundRect(self, x: float, y: float, width: float, height: float, radius: float,
+                  stroke: int = 1, fill: int = 0) -> None:
+        left, bottom = self._xy(x, y)
+        right, top = self._xy(x + width, y + height)
+        self.draw.rounded_rectangle(
+            [left, top, right, bottom], radius=radius * self.scale,
+            fill=self._fill if fill else None, outline=self._stroke if stroke else None,
+            width=max(1, round(self._line_width * self.scale)),
+        )
+
+    def drawImage(self, image, x: float, y: float, width: float, height: float, mask=None) -> None:
+        from PIL import Image
+
+        picture = Image.frombytes("RGB", image.getSize(), image.getRGBData())
+        size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        left, top = self._xy(x, y + height)
+        self.image.paste(picture.resize(size, Image.Resampling.BILINEAR), (round(left), round(top)))
+
+    def rect(self, x: float, top: float, width: float, height: float, fill=None, outline=None) -> None:
+        """Rectangle hanging from its top-left corner (points, y up)."""
+        left, upper = self._xy(x, top)
+        self.draw.rectangle([left, upper, left + width * self.scale, upper + height * self.scale],
+                            fill=fill, outline=outline)
+
+    def placeholder(self, x: float, top: float, width: float, height: float) -> None:
+        """Grey box where the real render draws a vector QR."""
+        self.rect(x, top, width, height, fill=PLACEHOLDER_FILL)
+
+    def png(self) -> bytes:
+        out = io.BytesIO()
+        self.image.save(out, format="PNG")
+        return out.getvalue()
+
+
+def thumbnail_base64(data: Optional[bytes], box: str, dpi: int = PREVIEW_DPI) -> Optional[str]:
+    """
+    Asset downscaled to its layout box at preview resolution, flattened on
+    white. Never below 1 pixel per CSS px: the layout draws images at
+    their natural size up to the box, as the HTML template does.
+    """
+    if not data:
+        return None
+    from PIL import Image, ImageOps
+    from backend.services import native_recipe
+
+    width_pt, height_pt = {"logo": native_recipe.LOGO_BOX, "signature": native_recipe.SIGNATURE_BOX}[box]
+    scale = max(dpi, 96) / 72.0
+    size = (max(1, round(width_pt * scale)), max(1, round(height_pt * scale)))
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            # JPEG scans decode straight at a reduced scale
+            original.draft("RGB", size)
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail(size, Image.Resampling.BILINEAR)
+            rgba = image.convert("RGBA")
+    except Exception as exc:
+        logger.warning("Preview thumbnail skipped: %s", exc)
+        return None
+    flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+    flattened.paste(rgba, mask=rgba.getchannel("A"))
+    out = io.BytesIO()
+    flattened.save(out, format="PNG")
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def _asset_thumbnail(storage_value: Optional[str], box: str, dpi: int) -> Optional[str]:
+    # Cached by Storage path + generation: large scans are decoded once per version
+    from backend.services.pdf_service import PDFService
+
+    if not storage_value:
+        return None
+    asset = PDFService.storage_asset(storage_value)
+    if asset is None:
+        return None
+    key = digest_key("preview-asset", storage_value, asset.generation, box, dpi)
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached.decode("ascii")
+    encoded = thumbnail_base64(asset.data, box, dpi)
+    if encoded:
+        preview_cache.put(key, encoded.encode("ascii"))
+    return encoded
+
+
+def sample_consultation() -> SimpleNamespace:
+    patient = SimpleNamespace(nombre="Paciente", apellido_paterno="de Ejemplo",
+                              dni="12.345.678-9", fecha_nacimiento="1984-01-01")
+    return SimpleNamespace(id=0, patient=patient, created_at=datetime.datetime.utcnow(),
+                           plan_tratamiento=SAMPLE_TREATMENT, diagnostico=SAMPLE_DIAGNOSIS)
+
+
+def preview_key(preferences: dict, signature_image: Optional[str], dpi: int, prescription_map=None) -> str:
+    from backend.services.pdf_service import PDFService
+
+    if prescription_map is not None:
+        return map_preview_key(prescription_map, dpi, with_background=True, with_boxes=False)
+    logo_path = preferences.get("logo_path")
+    return digest_key(
+        "preview",
+        PREVIEW_VERSION,
+        dpi,
+        datetime.date.today().isoformat(),
+        preferences.get("template_id"),
+        preferences.get("header_text"),
+        preferences.get("footer_text"),
+        preferences.get("primary_color"),
+        preferences.get("secondary_color"),
+        logo_path,
+        PDFService.asset_version(logo_path),
+        signature_image,
+        PDFService.asset_version(signature_image),
+    )
+
+
+def render_preview(preferences: dict, signature_image: Optional[str] = None, dpi: int = PREVIEW_DPI,
+                   prescription_map=None) -> bytes:
+    """
+    PNG of page 1 for a preference set (the doctor's saved preferences with
+    any unsaved edits applied). Cached per preference set. Pass the
+    doctor's active PrescriptionMap, if any: prints then use the map's
+    coordinates (PDFService), so the preview is the map over its scan.
+    """
+    from backend.services import native_recipe, stationery
+    from backend.services.pdf_service import PDFService
+
+    if prescription_map is not None:
+        return render_map_preview(prescription_map, dpi, with_background=True, with_boxes=False)
+
+    dpi = min(max(int(dpi), MIN_DPI), MAX_DPI)
+    key = preview_key(preferences, signature_image, dpi)
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached
+
+    context = PDFService.prescription_context(
+        sample_consultation(),
+        signature_base64=_asset_thumbnail(signature_image, "signature", dpi),
+        logo_base64=_asset_thumbnail(preferences.get("logo_path"), "logo", dpi),
+        primary_color=preferences.get("primary_color") or None,
+        secondary_color=preferences.get("secondary_color") or None,
+        header_text=preferences.get("header_text") or None,
+        footer_text=preferences.get("footer_text") or None,
+    )
+    context.pop("verification_url", None)
+
+    body_font, bold_font = stationery.register_fonts()
+    canvas = PreviewCanvas(dpi)
+    pages = native_recipe.split_pages(context, native_recipe.body_lines(context, body_font, bold_font),
+                                      body_font, bold_font)
+    qr_x, qr_top, qr_size = native_recipe.draw_page(canvas, context, body_font, bold_font, pages[0],
+                                                    last=len(pages) == 1, qr=True)
+    canvas.placeholder(qr_x, qr_top, qr_size, qr_size)
+
+    png = canvas.png()
+    preview_cache.put(key, png)
+    return png
+
+
+class ImageCache:
+    """
+    LRU of decoded Pillow images bounded by their pixel bytes. Keeps large
+    scans decoded (and already scaled to the preview size) between renders.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._images: "OrderedDict[tuple, object]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "decodes": 0}
+
+    @staticmethod
+    def _size(image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key: tuple):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.stats["hits"] += 1
+            return image
+
+    def put(self, key: tuple, image) -> None:
+        size = self._size(image)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._size(previous)
+            self._images[key] = image
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._images:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+
+background_images = ImageCache(int(float(os.getenv("PDF_PREVIEW_IMAGE_CACHE_MB", "32")) * 1024 * 1024))
+
+
+def background_image(storage_value: Optional[str], size: Tuple[int, int]):
+    """
+    Scanned stationery stretched over the whole page at preview size,
+    decoded once per Storage generation and kept in background_images.
+    """
+    from PIL import Image, ImageOps
+    from backend.services.pdf_service import PDFService
+
+    if not storage_value:
+        return None
+    asset = PDFService.storage_asset(storage_value)
+    if asset is None:
+        logger.warning("Map background unavailable: %s", storage_value)
+        return None
+
+    key = (storage_value, asset.generation, size)
+    image = background_images.get(key)
+    if image is not None:
+        return image
+    try:
+        with Image.open(io.BytesIO(asset.data)) as original:
+            original.draft("RGB", size)
+            image = ImageOps.exif_transpose(original).convert("RGB").resize(size, Image.Resampling.BILINEAR)
+    except Exception as exc:
+        logger.warning("Map background skipped: %s", exc)
+        return None
+    background_images.stats["decodes"] += 1
+    background_images.put(key, image)
+    return image
+
+
+def map_preview_key(prescription_map, dpi: int, with_background: bool, with_boxes: bool) -> str:
+    from backend.services.pdf_service import PDFService
+
+    background = prescription_map.background_image_url if with_background else None
+    return digest_key(
+        "map-preview",
+        PREVIEW_VERSION,
+        prescription_map.id,
+        prescription_map.updated_at,
+        dpi,
+        with_boxes,
+        datetime.date.today().isoformat(),
+        background,
+        PDFService.asset_version(background),
+    )
+
+
+def render_map_preview(prescription_map, dpi: int = PREVIEW_DPI, with_background: bool = True,
+                       with_boxes: bool = True) -> bytes:
+    """
+    PNG of a PrescriptionMap filled with sample data: the same compiled
+    plan as generate_with_coordinates (render_plan), drawn over the scanned
+    background. Signature and QR fields show as placeholders; `with_boxes`
+    outlines every field's box for the editor. Cached per map id and
+    updated_at.
+    """
+    from reportlab.lib import colors
+    from backend.services.render_plan import get_map_plan
+
+    dpi = min(max(int(dpi), MIN_DPI), MAX_DPI)
+    key = map_preview_key(prescription_map, dpi, with_background, with_boxes)
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached
+
+    plan = get_map_plan(prescription_map)
+    page_mm = (prescription_map.canvas_width_mm, prescription_map.canvas_height_mm)
+    scale = dpi / 72.0
+    size = (round(plan.width_pt * scale), round(plan.height_pt * scale))
+    background = background_image(prescription_map.background_image_url, size) if with_background else None
+    canvas = PreviewCanvas(dpi, page_mm, background=background)
+
+    consultation = sample_consultation()
+    canvas.setFillColor(colors.black)
+    for field in plan.fields:
+        if field.kind == "signature":
+            canvas.rect(field.x_pt, field.y_pt, field.width_pt, field.height_pt, fill=PLACEHOLDER_FILL)
+        elif field.kind == "qr":
+            canvas.rect(field.x_pt, field.y_pt, field.width_pt, field.width_pt, fill=PLACEHOLDER_FILL)
+        else:
+            canvas.setFont(field.font_name, field.font_size)
+            canvas.drawString(field.x_pt, field.y_pt, field.extract(consultation))
+            if with_boxes:
+                canvas.rect(field.x_pt, field.y_pt + field.font_size, field.width_pt, field.font_size * 1.2,
+                            outline=MAP_FIELD_OUTLINE)
+
+    png = canvas.png()
+    preview_cache.put(key, png)
+    return png
@@ -1,19 +1,15 @@
 import qrcode
+from functools import lru_cache
 from io import BytesIO
+from typing import Tuple
 from PIL import Image
 
+# Verification URLs are unique per prescription; this covers the
+# prescriptions being printed/re-printed in a busy period.
+QR_CACHE_SIZE = 512
 
-def generate_qr_image(url: str, size_mm: float = 25.0) -> BytesIO:
-    """
-    Genera imagen QR en memoria.
-    
-    Args:
-        url: URL de verificación
-        size_mm: Tamaño del QR en milímetros (no usado actualmente, para compatibilidad)
-    
-    Returns:
-        BytesIO: Imagen PNG del QR
-    """
+
+def _build_qr(url: str) -> qrcode.QRCode:
     qr = qrcode.QRCode(
         version=1,  # Tamaño automático
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -22,23 +18,108 @@ def generate_qr_image(url: str, size_mm: float = 25.0) -> BytesIO:
     )
     qr.add_data(url)
     qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convertir a bytes
+    return qr
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _qr_matrix(url: str) -> Tuple[Tuple[bool, ...], ...]:
+    """Modulos del QR (incluye el borde de 1 modulo), cacheados por URL."""
+    return tuple(tuple(row) for row in _build_qr(url).get_matrix())
+
+
+def _dark_runs(matrix):
+    """(x, y, largo) de cada tramo horizontal de modulos oscuros."""
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                yield start, y, x - start
+            else:
+                x += 1
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _qr_png_bytes(url: str) -> bytes:
+    img = _build_qr(url).make_image(fill_color="black", back_color="white")
     buffer = BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    return buffer
+    return buffer.getvalue()
+
+
+def generate_qr_image(url: str, size_mm: float = 25.0) -> BytesIO:
+    """
+    Genera imagen QR en memoria.
+
+    Args:
+        url: URL de verificación
+        size_mm: Tamaño del QR en milímetros (no usado actualmente, para compatibilidad)
+
+    Returns:
+        BytesIO: Imagen PNG del QR
+    """
+    # Convertir a bytes (cacheado por URL; cada llamada recibe su propio buffer)
+    return BytesIO(_qr_png_bytes(url))
 
 def get_qr_base64(url: str) -> str:
     """
     Generates QR code and returns it as a Base64 string for HTML embedding.
     """
     import base64
-    buffer = generate_qr_image(url)
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return base64.b64encode(_qr_png_bytes(url)).decode('utf-8')
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_svg(url: str) -> str:
+    """
+    QR vectorial (SVG) para WeasyPrint: un solo <path> con los tramos
+    oscuros, escalable a cualquier tamaño sin rasterizar.
+    """
+    matrix = _qr_matrix(url)
+    size = len(matrix)
+    path = "".join(f"M{x} {y}h{length}v1h-{length}z" for x, y, length in _dark_runs(matrix))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{path}" fill="#000"/></svg>'
+    )
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_svg_base64(url: str) -> str:
+    """SVG del QR en Base64, para <img src="data:image/svg+xml;base64,...">."""
+    import base64
+    return base64.b64encode(get_qr_svg(url).encode('utf-8')).decode('ascii')
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_drawing(url: str, size_pt: float):
+    """
+    QR como Drawing nativo de ReportLab (rectangulos vectoriales) de
+    size_pt x size_pt puntos. Dibujar con renderPDF.draw(drawing, canvas, x, y).
+    """
+    from reportlab.graphics.shapes import Drawing, Rect
+    from reportlab.lib import colors
+
+    matrix = _qr_matrix(url)
+    module = size_pt / len(matrix)
+    drawing = Drawing(size_pt, size_pt)
+    drawing.add(Rect(0, 0, size_pt, size_pt, fillColor=colors.white, strokeColor=None))
+    for x, y, length in _dark_runs(matrix):
+        # ReportLab: origen abajo a la izquierda
+        drawing.add(Rect(
+            x * module,
+            size_pt - (y + 1) * module,
+            length * module,
+            module,
+            fillColor=colors.black,
+            strokeColor=None
+        ))
+    return drawing
+
 
 def get_base_url() -> str:
     import os
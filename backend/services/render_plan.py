@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+# 1mm = 2.83465 points (same factor as PDFService.mm_to_points)
+MM_TO_PT = 2.83465
+PLAN_CACHE_SIZE = 128
+DEFAULT_FONT = "Helvetica"
+
+
+class FieldPlan:
+    """One PrescriptionMap field with its coordinates already in PDF points."""
+
+    __slots__ = ("key", "kind", "x_pt", "y_pt", "width_pt", "height_pt", "font_name", "font_size", "extract")
+
+    def __init__(self, key: str, kind: str, x_pt: float, y_pt: float, width_pt: float,
+                 height_pt: float, font_name: str, font_size: float, extract: Callable):
+        self.key = key
+        self.kind = kind
+        self.x_pt = x_pt
+        self.y_pt = y_pt
+        self.width_pt = width_pt
+        self.height_pt = height_pt
+        self.font_name = font_name
+        self.font_size = font_size
+        self.extract = extract
+
+
+class MapPlan:
+    __slots__ = ("map_id", "version", "width_pt", "height_pt", "fields")
+
+    def __init__(self, map_id, version, width_pt: float, height_pt: float, fields: Tuple[FieldPlan, ...]):
+        self.map_id = map_id
+        self.version = version
+        self.width_pt = width_pt
+        self.height_pt = height_pt
+        self.fields = fields
+
+
+def _empty(consultation) -> str:
+    return ""
+
+
+def compile_map(prescription_map) -> MapPlan:
+    """
+    Turns the raw fields_config JSON into a render plan: ReportLab
+    coordinates (origin bottom-left), sizes, fonts and value extractors.
+    """
+    from backend.services.pdf_service import PDFService
+
+    width_pt = prescription_map.canvas_width_mm * MM_TO_PT
+    height_pt = prescription_map.canvas_height_mm * MM_TO_PT
+    fields = []
+    for config in prescription_map.fields_config or []:
+        key = config['field_key']
+        # max_width_mm is optional in FieldConfig and may be stored as null
+        width_mm = config.get('max_width_mm') or 25.0
+        height_mm = config.get('max_height_mm') or width_mm
+        kind = {'doctor_signature': 'signature', 'qr_code': 'qr'}.get(key, 'text')
+        fields.append(FieldPlan(
+            key=key,
+            kind=kind,
+            x_pt=config['x_mm'] * MM_TO_PT,
+            # Invertir Y: y_pdf = height - y_mm
+            y_pt=height_pt - config['y_mm'] * MM_TO_PT,
+            width_pt=width_mm * MM_TO_PT,
+            height_pt=height_mm * MM_TO_PT,
+            font_name=DEFAULT_FONT,
+            font_size=config.get('font_size_pt', 10),
+            extract=PDFService.FIELD_MAPPING.get(key, _empty),
+        ))
+    return MapPlan(prescription_map.id, prescription_map.updated_at, width_pt, height_pt, tuple(fields))
+
+
+_plans: "OrderedDict[tuple, MapPlan]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_map_plan(prescription_map) -> MapPlan:
+    """Compiled plan for a map, reused until its id/updated_at changes."""
+    if prescription_map.id is None:
+        return compile_map(prescription_map)
+
+    key = (prescription_map.id, prescription_map.updated_at)
+    with _lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+
+    plan = compile_map(prescription_map)
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def clear_plans() -> None:
+    with _lock:
+        _plans.clear()
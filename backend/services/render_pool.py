@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(Exception):
+    """A render did not finish within the pool timeout."""
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _run_job(fn: Callable, args: tuple) -> Tuple[Any, int]:
+    """Runs inside the worker: returns the result plus the worker's peak RSS."""
+    return fn(*args), _peak_rss_bytes()
+
+
+def _init_worker() -> None:
+    # Compile templates and load fonts once per worker instead of on its first render
+    from backend.services.template_registry import template_registry
+    from backend.services import weasy_engine
+    # Spawned workers start clean: without this import the change_log listener
+    # is not registered and rows written by renders (verifications) never sync
+    from backend.services import sync_service  # noqa: F401
+    template_registry.warm()
+    weasy_engine.warm_up()
+
+
+def _warm_up_job() -> bool:
+    from backend.services import weasy_engine
+    return weasy_engine.warm_up()
+
+
+def render_prescription_job(consultation_id: int, doctor_email: str, asset_versions: Optional[dict] = None) -> bytes:
+    """
+    Worker entry point: loads the consultation in a fresh session and renders it.
+    Only ids cross the process boundary; ORM objects are not picklable.
+    `asset_versions` are the signature/logo generations the cache key was
+    computed with; the worker's own asset cache refetches on a mismatch.
+    """
+    from backend.database import SessionLocal
+    from backend.services.asset_cache import expecting
+    from backend.services.pdf_service import PDFService
+
+    db = SessionLocal()
+    try:
+        consultation = _load_consultation(db, consultation_id)
+        if consultation is None:
+            raise LookupError(f"Consultation {consultation_id} not found")
+        with expecting(asset_versions):
+            return PDFService.generate_prescription_pdf(consultation, doctor_email, db)
+    finally:
+        db.close()
+
+
+def _load_consultation(db, consultation_id: int):
+    from sqlalchemy.orm import joinedload
+    from backend import models
+
+    return db.query(models.ClinicalConsultation).options(
+        joinedload(models.ClinicalConsultation.patient)
+    ).filter(models.ClinicalConsultation.id == consultation_id).first()
+
+
+def _render_inputs(consultation, doctor_email: str, db, cache_key: Optional[str]) -> Tuple[str, Optional[bytes], dict]:
+    """(cache key, cached PDF or None, asset versions for the worker); blocking, run in a thread."""
+    from backend import models
+    from backend.services.pdf_cache import pdf_cache
+    from backend.services.pdf_service import PDFService
+
+    if cache_key is None:
+        _, _, cache_key = PDFService.prescription_render_inputs(consultation, doctor_email, db)
+    cached = pdf_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, cached, {}
+    doctor = db.query(models.User).filter(models.User.email == doctor_email).first()
+    return cache_key, None, PDFService.storage_versions(doctor)
+
+
+def prerender_enabled() -> bool:
+    """PDF_PRERENDER_ON_SAVE=1 renders the prescription right after a consultation is saved."""
+    return os.getenv("PDF_PRERENDER_ON_SAVE", "").lower() in ("1", "true", "yes")
+
+
+class RenderPool:
+    """
+    Runs CPU-heavy PDF renders off the event loop.
+
+    - mode "process" (default): a ProcessPoolExecutor; workers are recycled
+      after `max_tasks` renders or once a worker's peak RSS exceeds
+      `max_rss_bytes`, so WeasyPrint memory growth is returned to the OS.
+    - mode "thread": a ThreadPoolExecutor sharing the API process (no recycling).
+
+    `max_workers` caps concurrent renders; extra requests queue. `timeout`
+    bounds how long a request waits. In process mode the pool that timed out
+    is retired and its workers are terminated, so hung renders never pile up
+    beyond `max_workers` (other renders on that pool fail with it); in thread
+    mode the render cannot be interrupted and finishes in the background.
+    Concurrent prescription renders with the same cache key share one render
+    (counted in `stats["coalesced"]`). metrics() is served at /api/health/render.
+    """
+
+    def __init__(
+        self,
+        mode: str = "process",
+        max_workers: int = 2,
+        timeout: float = 60.0,
+        max_tasks: int = 50,
+        max_rss_bytes: int = 512 * 1024 * 1024,
+    ):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown render pool mode: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.max_rss_bytes = max_rss_bytes
+        self._executor: Optional[Executor] = None
+        self._completed = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self.stats = {"renders": 0, "timeouts": 0, "recycles": 0, "prerenders": 0, "coalesced": 0}
+
+    @classmethod
+    def from_env(cls) -> "RenderPool":
+        return cls(
+            mode=os.getenv("PDF_RENDER_MODE", "process"),
+            max_workers=int(os.getenv("PDF_RENDER_WORKERS", "2")),
+            timeout=float(os.getenv("PDF_RENDER_TIMEOUT_SECONDS", "60")),
+            max_tasks=int(os.getenv("PDF_RENDER_MAX_TASKS", "50")),
+            max_rss_bytes=int(float(os.getenv("PDF_RENDER_MAX_RSS_MB", "512")) * 1024 * 1024),
+        )
+
+    # -------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------
+    async def run(self, fn: Callable, *args) -> Any:
+        """Runs fn(*args) on the pool. fn must be a module-level function in process mode."""
+        executor = self._current_executor()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, _run_job, fn, args)
+        try:
+            result, peak_rss = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self._retire(executor, terminate=True)
+            raise RenderTimeout(f"Render exceeded {self.timeout:g}s")
+        except BrokenProcessPool:
+            self._retire(executor)
+            raise
+
+        self._after_render(executor, peak_rss)
+        return result
+
+    def metrics(self) -> dict:
+        """Counters (renders, timeouts, recycles, prerenders, coalesced) plus the pool's shape and load."""
+        with self._lock:
+            return {
+                **self.stats,
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "timeout_seconds": self.timeout,
+                "inflight": len(self._inflight),
+            }
+
+    async def render_prescription(self, consultation, doctor_email: str, db, cache_key: Optional[str] = None) -> bytes:
+        """
+        Cached prescription PDF. Cache lookups stay in the API process; only
+        misses are sent to a worker. Callers that already computed the
+        render's cache key (conditional downloads) pass it along.
+
+        Concurrent misses for the same cache key are coalesced: the first
+        caller starts the render, later callers await the same task and get
+        the same bytes (or the same error). The render is a task of its own,
+        so a caller that disconnects does not cancel it for the others.
+        """
+        from fastapi.concurrency import run_in_threadpool
+
+        # Key, cache lookup and asset versions query the DB and Storage
+        cache_key, cached, asset_versions = await run_in_threadpool(
+            _render_inputs, consultation, doctor_email, db, cache_key
+        )
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(cache_key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                self.stats["coalesced"] += 1
+            else:
+                task = loop.create_task(
+                    self._render_and_store(cache_key, consultation.id, doctor_email, asset_versions)
+                )
+                self._inflight[cache_key] = task
+                task.add_done_callback(lambda done, key=cache_key: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    async def _render_and_store(
+        self, cache_key: str, consultation_id: int, doctor_email: str, asset_versions: dict
+    ) -> bytes:
+        from backend.services.pdf_cache import pdf_cache
+
+        pdf_bytes = await self.run(render_prescription_job, consultation_id, doctor_email, asset_versions)
+        pdf_cache.put(cache_key, pdf_bytes)
+        return pdf_bytes
+
+    def _forget(self, cache_key: str, task: "asyncio.Task") -> None:
+        with self._lock:
+            if self._inflight.get(cache_key) is task:
+                del self._inflight[cache_key]
+        if not task.cancelled():
+            # Mark the error as retrieved when every waiter has gone away
+            task.exception()
+
+    async def prerender(self, consultation_id: int, doctor_email: str) -> bool:
+        """
+        Background task for the consultation save endpoints: renders the
+        prescription (creating its verification record) into the PDF cache,
+        so print, email and WhatsApp serve a ready file. Uses its own
+        session because the request's session is closed by then.
+        Failures are logged; the on-demand render remains the fallback.
+        """
+        from fastapi.concurrency import run_in_threadpool
+        from backend.database import SessionLocal
+
+        # Background tasks run on the event loop: the query goes to a thread,
+        # and render_prescription does the same for the key and asset lookups
+        db = SessionLocal()
+        try:
+            consultation = await run_in_threadpool(_load_consultation, db, consultation_id)
+            if consultation is None:
+                return False
+            await self.render_prescription(consultation, doctor_email, db)
+            self.stats["prerenders"] += 1
+            return True
+        except Exception as exc:
+            logger.warning("Pre-render of consultation %s failed: %s", consultation_id, exc)
+            return False
+        finally:
+            await run_in_threadpool(db.close)
+
+    async def warm(self) -> bool:
+        """
+        Starts the workers and runs a throwaway render on them, so the first
+        real prescription does not pay for process start-up or font loading.
+        """
+        try:
+            return await self.run(_warm_up_job)
+        except Exception as exc:
+            logger.warning("Render pool warm-up failed: %s", exc)
+            return False
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    # -------------------------------------------------------------------
+    # Executor lifecycle
+    # -------------------------------------------------------------------
+    def _current_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._build_executor()
+                self._completed = 0
+            return self._executor
+
+    def _build_executor(self) -> Executor:
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-render")
+        # spawn: workers must not inherit the parent's DB connections or event loop
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _after_render(self, executor: Executor, peak_rss: int) -> None:
+        with self._lock:
+            self.stats["renders"] += 1
+            if executor is not self._executor or self.mode != "process":
+                return
+            self._completed += 1
+            over_tasks = self.max_tasks > 0 and self._completed >= self.max_tasks
+            over_rss = self.max_rss_bytes > 0 and peak_rss > self.max_rss_bytes
+        if over_tasks or over_rss:
+            logger.info(
+                "Recycling PDF render workers (renders=%s, peak_rss=%.0fMB)",
+                self._completed, peak_rss / (1024 * 1024)
+            )
+            self._retire(executor)
+
+    def _retire(self, executor: Executor, terminate: bool = False) -> None:
+        # New work gets a fresh executor. In-flight renders on the old one
+        # finish, unless it is terminated (a hung worker would keep its slot
+        # and memory while the replacement pool starts new workers).
+        with self._lock:
+            current = executor is self._executor
+            if current:
+                self._executor = None
+                self.stats["recycles"] += 1
+        if terminate and isinstance(executor, ProcessPoolExecutor):
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+        elif current:
+            executor.shutdown(wait=False)
+
+
+render_pool = RenderPool.from_env()
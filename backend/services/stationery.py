@@ -0,0 +1,293 @@
+import io
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.services import pdf_profile
+
+logger = logging.getLogger(__name__)
+
+STATIONERY_TEMPLATE = "pdf/recipe_stationery.html"
+# Bump when recipe_stationery.html or LAYOUT_MM change so cached letterheads are rebuilt
+STATIONERY_VERSION = "2"
+
+MM_TO_PT = 2.83465
+PAGE_MM = (148.0, 210.0)  # A5
+
+# Boxes of the A5 recipe as (x, y, width, height) in mm from the top-left
+# corner. Shared by the letterhead template and the per-prescription overlay.
+LAYOUT_MM: Dict[str, Tuple[float, float, float, float]] = {
+    "logo": (20.0, 16.0, 45.0, 12.0),
+    "doctor_info": (70.0, 16.0, 58.0, 10.0),
+    "date": (70.0, 26.0, 58.0, 5.0),
+    "header_rule": (20.0, 33.0, 108.0, 0.0),
+    "header_text": (20.0, 35.0, 108.0, 6.0),
+    "patient": (20.0, 43.0, 108.0, 20.0),
+    "treatment_title": (20.0, 66.0, 108.0, 6.0),
+    "treatment": (20.0, 74.0, 108.0, 66.0),
+    "signature": (68.0, 142.0, 60.0, 14.0),
+    "signature_line": (75.0, 158.0, 53.0, 5.0),
+    "footer_rule": (20.0, 166.0, 108.0, 0.0),
+    "qr": (20.0, 168.0, 22.0, 22.0),
+    "footer_text": (45.0, 168.0, 83.0, 13.0),
+    "verification": (45.0, 182.0, 83.0, 8.0),
+}
+
+BODY_FONT = "Arial"
+BOLD_FONT = "Arial-Bold"
+BODY_SIZE = 10.0
+LINE_HEIGHT = 1.4
+ARIAL_ASCENT = 0.905  # hhea ascender / unitsPerEm of the bundled arial.ttf
+
+_fonts_lock = threading.Lock()
+_fonts: Dict[bool, Tuple[str, str]] = {}
+
+stats = {"builds": 0, "overlays": 0, "fallbacks": 0}
+
+
+def enabled() -> bool:
+    """PDF_STATIONERY_ENABLED=1 renders A5 recipes as letterhead + overlay."""
+    return os.getenv("PDF_STATIONERY_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+def register_fonts() -> Tuple[str, str]:
+    """
+    Registers the bundled Arial (same files WeasyPrint uses) with ReportLab,
+    once per process and font variant of the output profile: unhinted copies
+    under "-Unhinted" names, or the files as shipped. Falls back to the
+    Helvetica core fonts.
+    """
+    unhinted = pdf_profile.active().strip_font_hinting
+    fonts = _fonts.get(unhinted)
+    if fonts is None:
+        with _fonts_lock:
+            fonts = _fonts.get(unhinted)
+            if fonts is None:
+                fonts = _fonts[unhinted] = _register(unhinted)
+    return fonts
+
+
+def _register(unhinted: bool) -> Tuple[str, str]:
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from backend.services.weasy_engine import FONTS_DIR
+
+    try:
+        names = []
+        for name, filename in ((BODY_FONT, "arial.ttf"), (BOLD_FONT, "arialbd.ttf")):
+            path = os.path.join(FONTS_DIR, filename)
+            if unhinted:
+                path = pdf_profile.unhinted_font(path)
+                if path is None:
+                    return _register(False)
+                name = f"{name}-Unhinted"
+            pdfmetrics.registerFont(TTFont(name, path))
+            names.append(name)
+        return names[0], names[1]
+    except Exception as exc:
+        logger.warning("Bundled fonts unavailable for ReportLab: %s", exc)
+        return ("Helvetica", "Helvetica-Bold")
+
+
+def box_pt(name: str) -> Tuple[float, float, float, float]:
+    """Box in PDF points, with y measured from the bottom of the page (top edge of the box)."""
+    x, y, width, height = LAYOUT_MM[name]
+    return x * MM_TO_PT, (PAGE_MM[1] - y) * MM_TO_PT, width * MM_TO_PT, height * MM_TO_PT
+
+
+# ---------------------------------------------------------------------------
+# Letterhead (static per doctor)
+# ---------------------------------------------------------------------------
+def stationery_key(context: dict) -> str:
+    """
+    Digest of everything the letterhead shows. Logo and signature enter by
+    content, so a re-uploaded image yields a new letterhead.
+    """
+    from backend.services.pdf_cache import digest_key
+
+    doctor = context.get("doctor") or {}
+    return digest_key(
+        "stationery",
+        STATIONERY_VERSION,
+        STATIONERY_TEMPLATE,
+        doctor.get("name"),
+        doctor.get("specialty"),
+        context.get("primary_color"),
+        context.get("secondary_color"),
+        context.get("header_text"),
+        context.get("footer_text"),
+        digest_key(context.get("logo_base64")),
+        digest_key(context.get("signature_base64")),
+        pdf_profile.active().name,
+    )
+
+
+def build_stationery(context: dict) -> bytes:
+    """Renders the letterhead (WeasyPrint, full HTML/CSS layout)."""
+    from backend.services import weasy_engine
+    from backend.services.template_registry import template_registry
+
+    html = template_registry.render(STATIONERY_TEMPLATE, layout=LAYOUT_MM, **context)
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return weasy_engine.write_pdf(html, base_url=base_dir)
+
+
+def get_stationery(context: dict, builder: Optional[Callable[[dict], bytes]] = None) -> bytes:
+    """Letterhead from the PDF cache, built on the first use after any change."""
+    from backend.services.pdf_cache import pdf_cache
+
+    key = stationery_key(context)
+    cached = pdf_cache.get(key)
+    if cached is not None:
+        return cached
+
+    data = (builder or build_stationery)(context)
+    stats["builds"] += 1
+    pdf_cache.put(key, data)
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Overlay (per prescription)
+# ---------------------------------------------------------------------------
+def wrap_text(text: str, font: str, size: float, width: float) -> List[str]:
+    from reportlab.lib.utils import simpleSplit
+    return simpleSplit(text or "", font, size, width)
+
+
+def baseline(top: float, size: float, line_height: float = LINE_HEIGHT) -> float:
+    """Baseline of a text line whose CSS line box starts at `top` (points, y up)."""
+    return top - size * (line_height - 1) / 2 - size * ARIAL_ASCENT
+
+
+def body_lines(context: dict, body_font: str, bold_font: str) -> List[Tuple[str, str, float]]:
+    """(font, text, size) lines of the treatment box: treatment, then the diagnosis block."""
+    _, _, width, _ = box_pt("treatment")
+    lines: List[Tuple[str, str, float]] = [
+        (body_font, line, BODY_SIZE) for line in wrap_text(context.get("treatment", "").strip(), body_font, BODY_SIZE, width)
+    ]
+    diagnosis = context.get("diagnosis")
+    if diagnosis:
+        lines.append((body_font, "", BODY_SIZE))
+        lines.append((bold_font, "DIAGNÓSTICO", 8.0))
+        lines.extend((body_font, line, BODY_SIZE) for line in wrap_text(diagnosis.strip(), body_font, BODY_SIZE, width))
+    return lines
+
+
+def split_pages(lines: List[Tuple[str, str, float]]) -> List[List[Tuple[str, str, float]]]:
+    """Chunks of body lines that fit the fixed treatment box, one per page."""
+    _, _, _, height = box_pt("treatment")
+    pages: List[List[Tuple[str, str, float]]] = [[]]
+    used = 0.0
+    for line in lines:
+        step = line[2] * LINE_HEIGHT
+        if used + step > height and pages[-1]:
+            pages.append([])
+            used = 0.0
+        pages[-1].append(line)
+        used += step
+    return pages
+
+
+def draw_variable_content(pdf, context: dict, body_font: str, bold_font: str,
+                          body: List[Tuple[str, str, float]]) -> None:
+    """
+    Draws the per-prescription fields (date, patient block, the given
+    treatment/diagnosis lines, QR and verification URL) on a ReportLab canvas.
+    """
+    from reportlab.graphics import renderPDF
+    from reportlab.lib import colors
+    from backend.services.qr_service import get_qr_drawing
+
+    # Fecha bajo nombre y especialidad
+    dx, dtop, dwidth, _ = box_pt("date")
+    pdf.setFillColor(colors.HexColor(context.get("secondary_color") or "#64748b"))
+    pdf.setFont(body_font, 9)
+    pdf.drawRightString(dx + dwidth, baseline(dtop, 9), context.get("date", ""))
+
+    # Bloque paciente (las etiquetas vienen en el membrete)
+    px, ptop, pwidth, _ = box_pt("patient")
+    inset = 4 * MM_TO_PT
+    patient = context.get("patient") or {}
+    pdf.setFillColor(colors.HexColor("#333333"))
+    pdf.setFont(bold_font, BODY_SIZE)
+    row_one = ptop - 8.5 * MM_TO_PT
+    row_two = ptop - 17 * MM_TO_PT
+    pdf.drawString(px + inset, row_one, str(patient.get("name", "")))
+    pdf.drawRightString(px + pwidth - inset, row_one, str(patient.get("dni", "")))
+    pdf.drawString(px + inset, row_two, f"{patient.get('age', '')} años")
+    pdf.drawRightString(px + pwidth - inset, row_two, context.get("date", ""))
+
+    # Tratamiento y diagnostico
+    x, y, _, _ = box_pt("treatment")
+    for font, text, size in body:
+        if font == bold_font:
+            pdf.setFillColor(colors.HexColor("#64748b"))
+        else:
+            pdf.setFillColor(colors.HexColor("#333333"))
+        pdf.setFont(font, size)
+        pdf.drawString(x, baseline(y, size), text)
+        y -= size * LINE_HEIGHT
+
+    # QR vectorial y URL de verificacion
+    verify_url = context.get("verification_url")
+    if verify_url:
+        qx, qtop, qsize, _ = box_pt("qr")
+        renderPDF.draw(get_qr_drawing(verify_url, qsize), pdf, qx, qtop - qsize)
+
+    vx, vtop, _, _ = box_pt("verification")
+    pdf.setFillColor(colors.HexColor("#999999"))
+    pdf.setFont(body_font, 8)
+    pdf.drawString(vx, baseline(vtop, 8), "Verifique autenticidad en")
+    pdf.drawString(vx, baseline(vtop - 8 * LINE_HEIGHT, 8), context.get("verification_display_url", ""))
+
+
+def render_overlay(context: dict) -> Optional[bytes]:
+    """Transparent A5 page with only the variable content, or None if it overflows."""
+    from reportlab.pdfgen import canvas
+
+    body_font, bold_font = register_fonts()
+    pages = split_pages(body_lines(context, body_font, bold_font))
+    if len(pages) > 1:
+        return None
+
+    buffer = io.BytesIO()
+    with pdf_profile.reportlab_document() as options:
+        pdf = canvas.Canvas(buffer, pagesize=(PAGE_MM[0] * MM_TO_PT, PAGE_MM[1] * MM_TO_PT), **options)
+        draw_variable_content(pdf, context, body_font, bold_font, pages[0])
+        pdf.showPage()
+        pdf.save()
+    return buffer.getvalue()
+
+
+def merge_overlay(stationery_pdf: bytes, overlay_pdf: bytes) -> bytes:
+    """Stamps the overlay page onto the first page of the letterhead."""
+    from pypdf import PdfReader, PdfWriter
+
+    page = PdfReader(io.BytesIO(stationery_pdf)).pages[0]
+    page.merge_page(PdfReader(io.BytesIO(overlay_pdf)).pages[0])
+
+    writer = PdfWriter()
+    page = writer.add_page(page)
+    if pdf_profile.active().compress:
+        page.compress_content_streams()
+        writer.compress_identical_objects()
+    writer.add_metadata({"/Title": "Receta Médica", "/Producer": "Vitalinuage"})
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def render_prescription(context: dict, builder: Optional[Callable[[dict], bytes]] = None) -> Optional[bytes]:
+    """
+    Prescription = cached letterhead + ReportLab overlay. Returns None when the
+    treatment/diagnosis text does not fit the fixed layout; callers then fall
+    back to the full HTML render.
+    """
+    overlay = render_overlay(context)
+    if overlay is None:
+        stats["fallbacks"] += 1
+        return None
+    stats["overlays"] += 1
+    return merge_overlay(get_stationery(context, builder), overlay)
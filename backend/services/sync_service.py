@@ -0,0 +1,211 @@
+import datetime
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from backend import models
+
+# Entities exposed through /api/sync, keyed by the name used in the feed
+TRACKED_ENTITIES = {
+    "patients": models.Patient,
+    "consultations": models.ClinicalConsultation,
+    "backgrounds": models.MedicalBackground,
+    "clinical_records": models.ClinicalRecord,
+    "verifications": models.PrescriptionVerification,
+}
+_ENTITY_BY_MODEL = {model: name for name, model in TRACKED_ENTITIES.items()}
+
+
+def _direct_owner(obj) -> Optional[str]:
+    if isinstance(obj, models.PrescriptionVerification):
+        return obj.doctor_email
+    return getattr(obj, "owner_id", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session: Session, flush_context) -> None:
+    """
+    Writes one change_log row per tracked insert/update/delete, inside the
+    same transaction as the change itself (so the feed never gets ahead of
+    the data). Bulk query.update()/delete() and raw SQL bypass this hook.
+    """
+    pending = []
+    for obj in session.new:
+        if type(obj) in _ENTITY_BY_MODEL:
+            pending.append((obj, "upsert"))
+    for obj in session.dirty:
+        if type(obj) in _ENTITY_BY_MODEL and session.is_modified(obj, include_collections=False):
+            pending.append((obj, "upsert"))
+    for obj in session.deleted:
+        if type(obj) in _ENTITY_BY_MODEL:
+            pending.append((obj, "delete"))
+    if not pending:
+        return
+
+    # Backgrounds/records carry no owner: resolve it through the patient.
+    # Patients in this flush may already be gone from the table (cascade).
+    patient_owners = {
+        obj.id: obj.owner_id for obj, _ in pending if isinstance(obj, models.Patient)
+    }
+    missing = {
+        obj.patient_id for obj, _ in pending
+        if isinstance(obj, (models.MedicalBackground, models.ClinicalRecord))
+        and obj.patient_id not in patient_owners
+    }
+    connection = session.connection()
+    if missing:
+        rows = connection.execute(
+            models.Patient.__table__.select()
+            .with_only_columns(models.Patient.id, models.Patient.owner_id)
+            .where(models.Patient.id.in_(missing))
+        )
+        patient_owners.update({row.id: row.owner_id for row in rows})
+
+    now = datetime.datetime.utcnow()
+    entries = []
+    for obj, op in pending:
+        owner_id = _direct_owner(obj) or patient_owners.get(getattr(obj, "patient_id", None))
+        if not owner_id or obj.id is None:
+            continue
+        entries.append({
+            "owner_id": owner_id,
+            "entity": _ENTITY_BY_MODEL[type(obj)],
+            "entity_id": obj.id,
+            "op": op,
+            "changed_at": now,
+        })
+    if entries:
+        connection.execute(models.ChangeLog.__table__.insert(), entries)
+
+
+class SyncTokenExpired(Exception):
+    """The change_log rows after this token were pruned; the client must resync from since=0."""
+
+
+class SyncService:
+    """
+    Delta sync for offline-capable clients.
+    Clients keep the returned `next_token` and send it back as `since`;
+    since=0 bootstraps with a full snapshot of the practice.
+    change_log rows older than SYNC_RETENTION_DAYS are pruned; a token from
+    before the pruned range raises SyncTokenExpired (full resync).
+    """
+
+    DEFAULT_LIMIT = 500
+    DEFAULT_RETENTION_DAYS = 90
+
+    @staticmethod
+    def settle_seconds() -> float:
+        # Changes this recent are withheld: ids are assigned at flush, so a
+        # slower transaction can still commit a lower token than one already
+        # served. Short requests make a couple of seconds enough.
+        try:
+            return float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+        except ValueError:
+            return 2.0
+
+    @classmethod
+    def retention_days(cls) -> float:
+        try:
+            return float(os.getenv("SYNC_RETENTION_DAYS", cls.DEFAULT_RETENTION_DAYS))
+        except ValueError:
+            return float(cls.DEFAULT_RETENTION_DAYS)
+
+    @classmethod
+    def _settled_before(cls) -> datetime.datetime:
+        return datetime.datetime.utcnow() - datetime.timedelta(seconds=cls.settle_seconds())
+
+    @staticmethod
+    def serialize(obj) -> dict:
+        return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+    @staticmethod
+    def _owned_query(db: Session, entity: str, owner_id: str):
+        model = TRACKED_ENTITIES[entity]
+        query = db.query(model)
+        if model is models.PrescriptionVerification:
+            return query.filter(model.doctor_email == owner_id)
+        if model in (models.MedicalBackground, models.ClinicalRecord):
+            return query.join(models.Patient, models.Patient.id == model.patient_id).filter(
+                models.Patient.owner_id == owner_id
+            )
+        return query.filter(model.owner_id == owner_id)
+
+    @classmethod
+    def _empty_changes(cls) -> Dict[str, dict]:
+        return {entity: {"upserts": [], "deletes": []} for entity in TRACKED_ENTITIES}
+
+    @classmethod
+    def snapshot(cls, db: Session, owner_id: str) -> dict:
+        # Token is read first and with the same settle window as delta: anything
+        # committed meanwhile, or still settling, is re-sent by the next delta,
+        # and upserts are idempotent on the client.
+        token = db.query(func.max(models.ChangeLog.id)).filter(
+            models.ChangeLog.changed_at <= cls._settled_before()
+        ).scalar() or 0
+        changes = cls._empty_changes()
+        for entity in TRACKED_ENTITIES:
+            changes[entity]["upserts"] = [
+                cls.serialize(obj) for obj in cls._owned_query(db, entity, owner_id).all()
+            ]
+        return {"next_token": token, "has_more": False, "full": True, "changes": changes}
+
+    @classmethod
+    def delta(cls, db: Session, owner_id: str, since: int, limit: int = DEFAULT_LIMIT) -> dict:
+        # A token below oldest - 1 may have missed pruned rows; oldest - 1 itself
+        # still has every later change in the log
+        oldest = db.query(func.min(models.ChangeLog.id)).scalar()
+        if oldest is not None and since < oldest - 1:
+            raise SyncTokenExpired(f"Sync token {since} is older than the change log ({oldest})")
+
+        settled_before = cls._settled_before()
+        log_rows = db.query(models.ChangeLog).filter(
+            models.ChangeLog.owner_id == owner_id,
+            models.ChangeLog.id > since,
+            models.ChangeLog.changed_at <= settled_before
+        ).order_by(models.ChangeLog.id).limit(limit + 1).all()
+
+        has_more = len(log_rows) > limit
+        log_rows = log_rows[:limit]
+        next_token = log_rows[-1].id if log_rows else since
+
+        # Last operation wins per entity
+        latest: Dict[str, Dict[int, str]] = {entity: {} for entity in TRACKED_ENTITIES}
+        for row in log_rows:
+            if row.entity in latest:
+                latest[row.entity][row.entity_id] = row.op
+
+        changes = cls._empty_changes()
+        for entity, ops in latest.items():
+            upsert_ids = [entity_id for entity_id, op in ops.items() if op == "upsert"]
+            deletes: List[int] = [entity_id for entity_id, op in ops.items() if op == "delete"]
+            if upsert_ids:
+                model = TRACKED_ENTITIES[entity]
+                rows = cls._owned_query(db, entity, owner_id).filter(model.id.in_(upsert_ids)).all()
+                changes[entity]["upserts"] = [cls.serialize(obj) for obj in rows]
+                # Rows removed outside the ORM (raw SQL) surface as tombstones
+                found = {obj.id for obj in rows}
+                deletes.extend(entity_id for entity_id in upsert_ids if entity_id not in found)
+            changes[entity]["deletes"] = sorted(deletes)
+
+        return {"next_token": next_token, "has_more": has_more, "full": False, "changes": changes}
+
+    @classmethod
+    def prune(cls, db: Session) -> int:
+        """
+        Deletes change_log rows older than the retention window. The newest
+        row is always kept, so the oldest remaining id still tells expired
+        tokens apart after a quiet period.
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=cls.retention_days())
+        newest = db.query(func.max(models.ChangeLog.id)).scalar()
+        if newest is None:
+            return 0
+        deleted = db.query(models.ChangeLog).filter(
+            models.ChangeLog.changed_at < cutoff,
+            models.ChangeLog.id < newest
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
@@ -0,0 +1,112 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import jinja2
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_TEMPLATE_DIR = os.path.join(_BACKEND_DIR, "templates")
+EMAIL_TEMPLATE_DIR = os.path.join(_BACKEND_DIR, "services", "email_templates")
+
+# Names under which the inline pdf_templates.py strings are registered
+BUILTIN_TEMPLATES = {
+    "minimal": "builtin/minimal.html",
+    "modern": "builtin/modern.html",
+    "classic": "builtin/classic.html",
+}
+
+
+def _builtin_sources() -> Dict[str, str]:
+    from backend.pdf_templates import MINIMAL_TEMPLATE, MODERN_TEMPLATE, CLASSIC_TEMPLATE
+    return {
+        "minimal.html": MINIMAL_TEMPLATE,
+        "modern.html": MODERN_TEMPLATE,
+        "classic.html": CLASSIC_TEMPLATE,
+    }
+
+
+class TemplateRegistry:
+    """
+    Process-wide Jinja environment for PDF and email templates.
+
+    Every template is compiled once and kept for the life of the process:
+    - "pdf/<file>"      -> backend/templates
+    - "email/<file>"    -> backend/services/email_templates
+    - "builtin/<id>.html" -> inline strings from backend/pdf_templates.py
+
+    TEMPLATE_AUTO_RELOAD=1 re-checks file mtimes on each lookup (development).
+    TEMPLATE_BYTECODE_CACHE_DIR persists compiled bytecode across restarts.
+    """
+
+    def __init__(self, auto_reload: bool = False, bytecode_cache_dir: Optional[str] = None):
+        self.auto_reload = auto_reload
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self._env: Optional[jinja2.Environment] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TemplateRegistry":
+        return cls(
+            auto_reload=os.getenv("TEMPLATE_AUTO_RELOAD", "").lower() in ("1", "true", "yes"),
+            bytecode_cache_dir=os.getenv("TEMPLATE_BYTECODE_CACHE_DIR") or None,
+        )
+
+    @property
+    def env(self) -> jinja2.Environment:
+        if self._env is None:
+            with self._lock:
+                if self._env is None:
+                    self._env = self._build_env()
+        return self._env
+
+    def _build_env(self) -> jinja2.Environment:
+        bytecode_cache = None
+        if self.bytecode_cache_dir:
+            try:
+                os.makedirs(self.bytecode_cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(self.bytecode_cache_dir)
+            except OSError as exc:
+                logger.warning("Template bytecode cache disabled: %s", exc)
+
+        loader = jinja2.PrefixLoader({
+            "pdf": jinja2.FileSystemLoader(PDF_TEMPLATE_DIR),
+            "email": jinja2.FileSystemLoader(EMAIL_TEMPLATE_DIR),
+            "builtin": jinja2.DictLoader(_builtin_sources()),
+        })
+        # Same rendering semantics as the ad-hoc Template()/Environment() calls
+        # this replaces (no autoescape); cache_size=-1 never evicts.
+        return jinja2.Environment(
+            loader=loader,
+            auto_reload=self.auto_reload,
+            cache_size=-1,
+            bytecode_cache=bytecode_cache,
+        )
+
+    # -------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------
+    def get(self, name: str) -> jinja2.Template:
+        return self.env.get_template(name)
+
+    def render(self, name: str, **context) -> str:
+        return self.get(name).render(**context)
+
+    def names(self) -> List[str]:
+        return sorted(self.env.list_templates(filter_func=lambda name: name.endswith(".html")))
+
+    def warm(self) -> int:
+        """Compile every known template up front (called at startup)."""
+        compiled = 0
+        for name in self.names():
+            try:
+                self.get(name)
+                compiled += 1
+            except jinja2.TemplateError as exc:
+                logger.error("Template %s failed to compile: %s", name, exc)
+        return compiled
+
+
+template_registry = TemplateRegistry.from_env()
@@ -0,0 +1,117 @@
+"""
+Merges duplicate prescription verifications (several rows for one
+consultation, left by coordinate renders that inserted a new uuid on every
+download) and adds the unique constraint that prevents new duplicates.
+
+    python -m backend.services.verification_compaction [--batch-size N]
+"""
+import argparse
+import logging
+from typing import Dict, List
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from backend import models
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_INDEX = "uix_prescription_verification_consultation"
+
+
+def _latest(*values):
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+def _earliest(*values):
+    present = [value for value in values if value is not None]
+    return min(present) if present else None
+
+
+def duplicate_consultation_ids(db: Session, limit: int) -> List[int]:
+    rows = db.query(models.PrescriptionVerification.consultation_id).group_by(
+        models.PrescriptionVerification.consultation_id
+    ).having(func.count(models.PrescriptionVerification.id) > 1).order_by(
+        models.PrescriptionVerification.consultation_id
+    ).limit(limit).all()
+    return [consultation_id for consultation_id, in rows]
+
+
+def merge_consultation(db: Session, consultation_id: int) -> int:
+    """
+    Keeps the oldest row of the consultation and folds the others into it:
+    scan counts are added up, timestamps keep the first issue and the latest
+    scan/dispatch, and each removed uuid becomes an alias of the survivor.
+    Returns the number of rows removed. Does not commit.
+    """
+    rows = db.query(models.PrescriptionVerification).filter(
+        models.PrescriptionVerification.consultation_id == consultation_id
+    ).order_by(models.PrescriptionVerification.id).all()
+    if len(rows) < 2:
+        return 0
+
+    keep, duplicates = rows[0], rows[1:]
+    for duplicate in duplicates:
+        keep.scanned_count = (keep.scanned_count or 0) + (duplicate.scanned_count or 0)
+        keep.last_scanned_at = _latest(keep.last_scanned_at, duplicate.last_scanned_at)
+        keep.email_sent_at = _latest(keep.email_sent_at, duplicate.email_sent_at)
+        keep.whatsapp_sent_at = _latest(keep.whatsapp_sent_at, duplicate.whatsapp_sent_at)
+        keep.issue_date = _earliest(keep.issue_date, duplicate.issue_date)
+
+        # Aliases that pointed at the duplicate move to the survivor
+        db.query(models.PrescriptionVerificationAlias).filter(
+            models.PrescriptionVerificationAlias.verification_id == duplicate.id
+        ).update({models.PrescriptionVerificationAlias.verification_id: keep.id}, synchronize_session=False)
+        db.add(models.PrescriptionVerificationAlias(uuid=duplicate.uuid, verification_id=keep.id))
+        db.delete(duplicate)
+    return len(duplicates)
+
+
+def compact_verifications(db: Session, batch_size: int = 200) -> Dict[str, int]:
+    """Merges every duplicated consultation, committing once per batch."""
+    stats = {"consultations": 0, "removed": 0}
+    while True:
+        consultation_ids = duplicate_consultation_ids(db, batch_size)
+        if not consultation_ids:
+            break
+        for consultation_id in consultation_ids:
+            stats["removed"] += merge_consultation(db, consultation_id)
+            stats["consultations"] += 1
+        db.commit()
+        logger.info("Verification compaction: %s", stats)
+    return stats
+
+
+def ensure_unique_constraint(db: Session, batch_size: int = 200) -> Dict[str, int]:
+    """
+    Startup migration for existing databases (create_all does not alter
+    tables): compacts first, then adds the unique index on consultation_id.
+    """
+    stats = compact_verifications(db, batch_size)
+    db.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} "
+        "ON prescription_verifications (consultation_id)"
+    ))
+    db.commit()
+    return stats
+
+
+def main() -> None:
+    from backend.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Merge duplicate prescription verifications")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        stats = ensure_unique_constraint(db, args.batch_size)
+    finally:
+        db.close()
+    print(f"Merged {stats['removed']} duplicate verifications across {stats['consultations']} consultations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+from backend.services import pdf_profile
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONTS_DIR = os.path.join(_BACKEND_DIR, "static", "fonts")
+FONTS_CONF = os.path.join(FONTS_DIR, "fonts.conf")
+FONTS_CSS = os.path.join(FONTS_DIR, "fonts.css")
+FONTS_CACHE_DIR = os.path.join(FONTS_DIR, "cache")
+
+_WARMUP_HTML = "<html><body><p style='font-family: Arial'>Vitalinuage</p><p style='font-family: Georgia'><b>Rx</b></p></body></html>"
+
+_lock = threading.Lock()
+_font_config = None
+_stylesheets: Optional[List] = None
+
+
+def configure_fontconfig() -> None:
+    """
+    Points fontconfig at the bundled fonts (see docs/GUIA_OPTIMIZACION_FONTCONFIG.md).
+    Must run before pango is loaded, i.e. before the first `import weasyprint`.
+    Values already present in the environment win.
+    """
+    os.environ.setdefault("FONTCONFIG_PATH", FONTS_DIR)
+    os.environ.setdefault("FONTCONFIG_FILE", FONTS_CONF)
+    try:
+        os.makedirs(FONTS_CACHE_DIR, exist_ok=True)
+    except OSError as exc:
+        logger.warning("Font cache directory unavailable: %s", exc)
+
+
+def _load_weasyprint():
+    try:
+        import weasyprint
+        from weasyprint.text.fonts import FontConfiguration
+    except (ImportError, OSError) as exc:
+        # OSError: python package present but pango/cairo system libraries missing
+        raise Exception(f"WeasyPrint module not found. PDF generation unavailable. ({exc})")
+    return weasyprint, FontConfiguration
+
+
+def _shared_resources():
+    """One FontConfiguration and the parsed bundled @font-face CSS per process."""
+    global _font_config, _stylesheets
+    weasyprint, FontConfiguration = _load_weasyprint()
+    if _font_config is None:
+        with _lock:
+            if _font_config is None:
+                font_config = FontConfiguration()
+                stylesheets = []
+                if os.path.exists(FONTS_CSS):
+                    stylesheets.append(weasyprint.CSS(filename=FONTS_CSS, font_config=font_config))
+                _stylesheets = stylesheets
+                _font_config = font_config
+    return weasyprint, _font_config, _stylesheets
+
+
+def write_pdf(html_content: str, base_url: Optional[str] = None) -> bytes:
+    """Renders HTML with the shared font configuration and bundled fonts."""
+    weasyprint, font_config, stylesheets = _shared_resources()
+    return weasyprint.HTML(string=html_content, base_url=base_url).write_pdf(
+        stylesheets=stylesheets,
+        font_config=font_config,
+        **pdf_profile.weasyprint_options()
+    )
+
+
+def warm_up() -> bool:
+    """
+    Throwaway render so font discovery, pango and cairo initialise before
+    the first real prescription. Returns False when WeasyPrint is unavailable.
+    """
+    configure_fontconfig()
+    start = time.perf_counter()
+    try:
+        write_pdf(_WARMUP_HTML)
+    except Exception as exc:
+        logger.warning("WeasyPrint warm-up skipped: %s", exc)
+        return False
+    logger.info("WeasyPrint warm-up finished in %.2fs", time.perf_counter() - start)
+    return True
+
+
+configure_fontconfig()
@@ -1,6 +1,7 @@
 ﻿import os
 import sys
 import pytest
+from fastapi.testclient import TestClient
 
 # --- Ensure project root is on path ---
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
@@ -35,3 +36,36 @@ def db_session():
         yield session
     finally:
         session.close()
+
+
+class AuthClient(TestClient):
+    """TestClient whose requests run as the user given to login()."""
+
+    def login(self, user):
+        from backend.dependencies import get_current_user
+
+        self.app.dependency_overrides[get_current_user] = lambda: user
+        return self
+
+    def logout(self):
+        from backend.dependencies import get_current_user
+
+        self.app.dependency_overrides.pop(get_current_user, None)
+        return self
+
+
+@pytest.fixture
+def auth_client(db_session):
+    """
+    Client over the app sharing db_session with the test. Call
+    auth_client.login(user) before authenticated requests; the overrides
+    are reset after the test.
+    """
+    from backend.database import get_db
+    from backend.main import app
+
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        yield AuthClient(app)
+    finally:
+        app.dependency_overrides = {}
@@ -0,0 +1,27 @@
+"""Rows the API tests seed over and over: a verified doctor, a patient, a consultation."""
+from backend import models
+
+
+def seed_doctor(db, email, **fields):
+    user = models.User(email=email, hashed_password="pw", is_verified=True, **fields)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def seed_patient(db, owner, dni, **fields):
+    values = {"nombre": "Paciente", "apellido_paterno": "Prueba", "fecha_nacimiento": "1980-01-01"}
+    values.update(fields)
+    patient = models.Patient(dni=dni, owner_id=owner.email, **values)
+    db.add(patient)
+    db.commit()
+    return patient
+
+
+def seed_consultation(db, patient, **fields):
+    values = {"motivo_consulta": "Control", "diagnostico": "Dx", "plan_tratamiento": "Tx"}
+    values.update(fields)
+    consultation = models.ClinicalConsultation(patient_id=patient.id, owner_id=patient.owner_id, **values)
+    db.add(consultation)
+    db.commit()
+    return consultation
@@ -0,0 +1,143 @@
+import os
+
+from backend import models
+from backend.services import asset_cache as asset_cache_module
+from backend.services.asset_cache import AssetCache, LocalBucket, expecting
+from backend.services.pdf_service import PDFService
+from backend.tests.factories import seed_doctor
+
+
+class CountingBucket(LocalBucket):
+    calls = []
+
+    def get_blob(self, object_path):
+        CountingBucket.calls.append(object_path)
+        return super().get_blob(object_path)
+
+
+def _make_cache(tmp_path, revalidate_seconds=600, disk_max_bytes=1024 * 1024):
+    CountingBucket.calls = []
+    storage_root = tmp_path / "storage"
+    return AssetCache(
+        memory_max_bytes=1024 * 1024,
+        disk_dir=str(tmp_path / "cache"),
+        revalidate_seconds=revalidate_seconds,
+        bucket_factory=lambda name: CountingBucket(str(storage_root), name),
+        disk_max_bytes=disk_max_bytes,
+    )
+
+
+def _upload(tmp_path, path, data, mtime):
+    target = tmp_path / "storage" / "bucket" / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    os.utime(target, (mtime, mtime))
+
+
+def test_fresh_entries_skip_storage(tmp_path):
+    _upload(tmp_path, "signatures/doc.png", b"firma-v1", 1_000_000)
+    cache = _make_cache(tmp_path)
+
+    assert cache.get("bucket", "signatures/doc.png").data == b"firma-v1"
+    assert cache.get("bucket", "signatures/doc.png").data == b"firma-v1"
+    assert CountingBucket.calls == ["signatures/doc.png"]
+
+    # Another worker process shares the disk tier
+    other = _make_cache(tmp_path)
+    assert other.get("bucket", "signatures/doc.png").base64 == "ZmlybWEtdjE="
+    assert CountingBucket.calls == []
+
+
+def test_revalidation_downloads_only_new_generations(tmp_path):
+    _upload(tmp_path, "logos/doc.png", b"logo-v1", 1_000_000)
+    cache = _make_cache(tmp_path, revalidate_seconds=0)
+
+    first = cache.get("bucket", "logos/doc.png")
+    same = cache.get("bucket", "logos/doc.png")
+    assert same.generation == first.generation
+    assert cache.stats["downloads"] == 1
+    assert cache.stats["revalidations"] == 2
+
+    _upload(tmp_path, "logos/doc.png", b"logo-v2", 2_000_000)
+    updated = cache.get("bucket", "logos/doc.png")
+    assert updated.data == b"logo-v2"
+    assert updated.generation != first.generation
+    assert cache.stats["downloads"] == 2
+
+
+def test_storage_errors_serve_last_known_copy(tmp_path):
+    _upload(tmp_path, "logos/doc.png", b"logo-v1", 1_000_000)
+    cache = _make_cache(tmp_path, revalidate_seconds=0)
+    cache.get("bucket", "logos/doc.png")
+
+    def broken(name):
+        raise ConnectionError("storage down")
+
+    cache.bucket_factory = broken
+    assert cache.get("bucket", "logos/doc.png").data == b"logo-v1"
+    assert cache.stats["errors"] == 1
+
+
+def test_profile_update_invalidates_signature(db_session, auth_client, monkeypatch, tmp_path):
+    monkeypatch.setenv("FIREBASE_STORAGE_BUCKET", "bucket")
+    cache = _make_cache(tmp_path)
+    monkeypatch.setattr(asset_cache_module, "asset_cache", cache)
+    _upload(tmp_path, "signatures/doc.png", b"firma-v1", 1_000_000)
+
+    user = seed_doctor(db_session, "asset_doctor@example.com", signature_image="signatures/doc.png")
+
+    assert PDFService._fetch_signature_assets(user.email, db_session)[1] == b"firma-v1"
+
+    # Same Storage path, new content: the profile save must drop the cached copy
+    _upload(tmp_path, "signatures/doc.png", b"firma-v2", 2_000_000)
+    res = auth_client.login(user).put("/api/doctors/profile", json={
+        "professional_name": "Dr. Asset",
+        "specialty": "General",
+        "medical_license": "123",
+        "registration_number": "456",
+        "signature_image": "signatures/doc.png",
+    })
+
+    assert res.status_code == 200, res.text
+    assert PDFService._fetch_signature_assets(user.email, db_session)[1] == b"firma-v2"
+
+
+def test_worker_refetches_when_the_api_saw_a_newer_generation(db_session, monkeypatch, tmp_path):
+    monkeypatch.setenv("FIREBASE_STORAGE_BUCKET", "bucket")
+    api, worker = _make_cache(tmp_path), _make_cache(tmp_path)
+    _upload(tmp_path, "signatures/doc.png", b"firma-v1", 1_000_000)
+    assert worker.get("bucket", "signatures/doc.png").data == b"firma-v1"
+    assert worker.get("bucket", "logos/doc.png") is None
+
+    # The profile save invalidates only the API process's cache
+    _upload(tmp_path, "signatures/doc.png", b"firma-v2", 2_000_000)
+    _upload(tmp_path, "logos/doc.png", b"logo-v1", 2_000_000)
+    user = models.User(email="worker_doctor@example.com", hashed_password="pw", is_verified=True,
+                       signature_image="signatures/doc.png", print_logo_path="logos/doc.png")
+    monkeypatch.setattr(asset_cache_module, "asset_cache", api)
+    api.invalidate("bucket", "signatures/doc.png")
+    versions = PDFService.storage_versions(user)
+
+    monkeypatch.setattr(asset_cache_module, "asset_cache", worker)
+    assert PDFService.storage_asset("signatures/doc.png").data == b"firma-v1"
+    with expecting(versions):
+        assert PDFService.storage_asset("signatures/doc.png").data == b"firma-v2"
+        assert PDFService.storage_asset("logos/doc.png").data == b"logo-v1"
+        calls = len(CountingBucket.calls)
+        # Matching generations are served without asking Storage again
+        assert PDFService.storage_asset("signatures/doc.png").data == b"firma-v2"
+        assert len(CountingBucket.calls) == calls
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = _make_cache(tmp_path, disk_max_bytes=2500)
+    for index in range(4):
+        _upload(tmp_path, f"logos/{index}.png", bytes([index]) * 1000, 1_000_000 + index)
+        cache.get("bucket", f"logos/{index}.png")
+        os.utime(tmp_path / "cache" / (AssetCache._key("bucket", f"logos/{index}.png") + ".bin"),
+                 (1_000_000 + index, 1_000_000 + index))
+
+    kept = sorted(entry.name for entry in os.scandir(tmp_path / "cache") if entry.name.endswith(".bin"))
+    assert kept == sorted(AssetCache._key("bucket", f"logos/{index}.png") + ".bin" for index in (2, 3))
+    assert cache._disk_bytes == 2000
+    assert len(os.listdir(tmp_path / "cache")) == 4
@@ -0,0 +1,43 @@
+from backend.schemas.batch import BATCH_MAX_IDS
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _seed(db_session):
+    user = seed_doctor(db_session, "batch_doctor@example.com")
+    other = seed_doctor(db_session, "batch_other@example.com")
+    patients = [seed_patient(db_session, user, f"BATCH-{i}", nombre=f"P{i}") for i in range(3)]
+    foreign = seed_patient(db_session, other, "BATCH-X", nombre="Ajeno")
+    return user, patients, foreign
+
+
+def test_patients_batch_keeps_order_and_scope(db_session, auth_client):
+    user, patients, foreign = _seed(db_session)
+    ids = [patients[2].id, foreign.id, patients[0].id, 999999, patients[2].id]
+
+    res = auth_client.login(user).post("/api/patients/batch", json={"ids": ids})
+
+    assert res.status_code == 200, res.text
+    assert [p["dni"] for p in res.json()] == ["BATCH-2", "BATCH-0"]
+
+
+def test_patients_batch_limits_size(db_session, auth_client):
+    user, _, _ = _seed(db_session)
+    auth_client.login(user)
+
+    assert auth_client.post("/api/patients/batch", json={"ids": []}).status_code == 422
+    too_many = list(range(1, BATCH_MAX_IDS + 2))
+    assert auth_client.post("/api/patients/batch", json={"ids": too_many}).status_code == 422
+
+
+def test_consultations_batch(db_session, auth_client):
+    user, patients, foreign = _seed(db_session)
+    own = seed_consultation(db_session, patients[0])
+    alien = seed_consultation(db_session, foreign, diagnostico="Ajeno")
+
+    res = auth_client.login(user).post("/api/consultas/batch", json={"ids": [alien.id, own.id]})
+
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert [c["id"] for c in body] == [own.id]
+    assert body[0]["diagnostico"] == "Dx"
+    assert body[0]["email_sent_at"] is None
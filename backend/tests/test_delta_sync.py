@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.db_core import Base
+from backend.services.render_pool import RenderPool, render_prescription_job
+from backend.services.sync_service import SyncService, SyncTokenExpired
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _seed(db_session):
+    user = seed_doctor(db_session, "sync_doctor@example.com")
+    other = seed_doctor(db_session, "sync_other@example.com")
+    patient = seed_patient(db_session, user, "SYNC-001", nombre="Delta", apellido_paterno="Sync",
+                           fecha_nacimiento="1970-07-07")
+    seed_patient(db_session, other, "SYNC-999", nombre="Otro", apellido_paterno="Medico",
+                 fecha_nacimiento="1970-07-07")
+    return user, patient
+
+
+def _sync(client, since):
+    res = client.get(f"/api/sync?since={since}")
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_snapshot_then_delta_with_tombstones(db_session, auth_client, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "0")
+    user, patient = _seed(db_session)
+    auth_client.login(user)
+
+    snapshot = _sync(auth_client, 0)
+    assert snapshot["full"] is True
+    assert [p["dni"] for p in snapshot["changes"]["patients"]["upserts"]] == ["SYNC-001"]
+    token = snapshot["next_token"]
+    assert token > 0
+
+    # Nothing changed since the snapshot
+    idle = _sync(auth_client, token)
+    assert all(not c["upserts"] and not c["deletes"] for c in idle["changes"].values())
+    assert idle["next_token"] == token
+
+    consultation = models.ClinicalConsultation(
+        patient_id=patient.id,
+        owner_id=user.email,
+        motivo_consulta="Control",
+        diagnostico="Dx",
+        plan_tratamiento="Tx",
+    )
+    db_session.add(consultation)
+    db_session.add(models.MedicalBackground(patient_id=patient.id, alergias="Polen"))
+    patient.telefono = "555-1111"
+    db_session.commit()
+
+    delta = _sync(auth_client, token)
+    assert delta["full"] is False
+    assert delta["changes"]["patients"]["upserts"][0]["telefono"] == "555-1111"
+    assert delta["changes"]["consultations"]["upserts"][0]["diagnostico"] == "Dx"
+    assert delta["changes"]["backgrounds"]["upserts"][0]["alergias"] == "Polen"
+    token = delta["next_token"]
+
+    consultation_id = consultation.id
+    db_session.delete(consultation)
+    db_session.commit()
+
+    tombstone = _sync(auth_client, token)
+    assert tombstone["changes"]["consultations"]["deletes"] == [consultation_id]
+    assert tombstone["changes"]["consultations"]["upserts"] == []
+
+
+def test_delta_is_tenant_scoped(db_session, auth_client, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "0")
+    user, _ = _seed(db_session)
+    auth_client.login(user)
+
+    delta = _sync(auth_client, 0)
+    dnis = [p["dni"] for p in delta["changes"]["patients"]["upserts"]]
+    assert "SYNC-999" not in dnis
+
+    log_owners = {row.owner_id for row in db_session.query(models.ChangeLog).all()}
+    assert log_owners == {"sync_doctor@example.com", "sync_other@example.com"}
+
+
+def test_recent_changes_wait_for_settle_window(db_session, auth_client, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "60")
+    user, _ = _seed(db_session)
+    auth_client.login(user)
+
+    delta = _sync(auth_client, 1)
+    assert delta["changes"]["patients"]["upserts"] == []
+    assert delta["next_token"] == 1
+
+
+def test_snapshot_token_skips_changes_still_settling(db_session, auth_client, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "60")
+    user, _ = _seed(db_session)
+    auth_client.login(user)
+    db_session.query(models.ChangeLog).update(
+        {models.ChangeLog.changed_at: datetime.datetime.utcnow() - datetime.timedelta(minutes=5)}
+    )
+    settled = db_session.query(models.ChangeLog.id).order_by(models.ChangeLog.id.desc()).first()[0]
+    db_session.add(models.Patient(nombre="Nuevo", apellido_paterno="Reciente", dni="SYNC-002",
+                                  fecha_nacimiento="1980-01-01", owner_id=user.email))
+    db_session.commit()
+
+    snapshot = _sync(auth_client, 0)
+    # The new patient is in the data but its log row is re-sent once it settles
+    assert "SYNC-002" in [p["dni"] for p in snapshot["changes"]["patients"]["upserts"]]
+    assert snapshot["next_token"] == settled
+
+
+def test_pruned_token_gets_410(db_session, auth_client, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "0")
+    monkeypatch.setenv("SYNC_RETENTION_DAYS", "30")
+    user, patient = _seed(db_session)
+    auth_client.login(user)
+    token = _sync(auth_client, 0)["next_token"]
+    # A change after the token that gets pruned with the rest
+    patient.telefono = "555-1111"
+    db_session.commit()
+
+    db_session.query(models.ChangeLog).update(
+        {models.ChangeLog.changed_at: datetime.datetime.utcnow() - datetime.timedelta(days=31)}
+    )
+    patient.telefono = "555-2222"
+    db_session.commit()
+    assert SyncService.prune(db_session) == 3
+
+    expired = auth_client.get(f"/api/sync?since={token}")
+    assert expired.status_code == 410
+
+    resync = _sync(auth_client, 0)
+    assert resync["full"] is True
+    assert resync["next_token"] > token
+    assert _sync(auth_client, resync["next_token"])["full"] is False
+
+
+def test_token_just_below_the_oldest_row_is_still_valid(db_session, monkeypatch):
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "0")
+    monkeypatch.setenv("SYNC_RETENTION_DAYS", "30")
+    user, patient = _seed(db_session)
+    db_session.query(models.ChangeLog).update(
+        {models.ChangeLog.changed_at: datetime.datetime.utcnow() - datetime.timedelta(days=31)}
+    )
+    patient.telefono = "555-3333"
+    db_session.commit()
+    SyncService.prune(db_session)
+    oldest = db_session.query(models.ChangeLog.id).order_by(models.ChangeLog.id).first()[0]
+
+    delta = SyncService.delta(db_session, user.email, oldest - 1)
+    assert delta["changes"]["patients"]["upserts"][0]["telefono"] == "555-3333"
+    with pytest.raises(SyncTokenExpired):
+        SyncService.delta(db_session, user.email, oldest - 2)
+
+
+def test_verifications_created_by_render_workers_are_synced(monkeypatch, tmp_path):
+    # Spawned workers open their own engine: share a file database with them
+    url = f"sqlite:///{tmp_path / 'sync.db'}"
+    monkeypatch.setenv("SYNC_SETTLE_SECONDS", "0")
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.delenv("TESTING", raising=False)
+    monkeypatch.delenv("PYTEST_CURRENT_TEST", raising=False)
+    # The coordinates engine imports `services.*`; workers inherit sys.path
+    monkeypatch.syspath_prepend(str(Path(__file__).resolve().parents[1]))
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    user = seed_doctor(db, "worker_sync@example.com")
+    db.add(models.PrescriptionMap(
+        doctor_id=user.email,
+        name="Recetario",
+        fields_config=[{"field_key": "qr_code", "x_mm": 10, "y_mm": 10}],
+        is_active=True,
+    ))
+    db.commit()
+    consultation = seed_consultation(db, seed_patient(db, user, "SYNC-W1"))
+    token = SyncService.snapshot(db, user.email)["next_token"]
+
+    pool = RenderPool(mode="process", max_workers=1, timeout=60)
+    try:
+        pdf_bytes = asyncio.run(pool.run(render_prescription_job, consultation.id, user.email))
+    finally:
+        pool.shutdown()
+        db.expire_all()
+
+    assert pdf_bytes.startswith(b"%PDF")
+    delta = SyncService.delta(db, user.email, token)
+    upserts = delta["changes"]["verifications"]["upserts"]
+    assert [row["consultation_id"] for row in upserts] == [consultation.id]
+    db.close()
+    engine.dispose()
@@ -0,0 +1,98 @@
+import datetime
+import io
+from types import SimpleNamespace
+
+from pypdf import PdfReader
+
+from backend.services import dossier
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+PATIENT = {"name": "Ana Rojas", "dni": "11.111.111-1", "age": 40, "issued": "01/03/2026"}
+DOCTOR = {"name": "Dra. Historia", "specialty": "Medicina Interna"}
+
+
+def _visit(**fields):
+    base = {attr: None for attr, _ in dossier.SECTIONS}
+    base.update(peso_kg=None, estatura_cm=None, imc=None, presion_arterial=None,
+                frecuencia_cardiaca=None, temperatura_c=None)
+    base.update(fields)
+    return SimpleNamespace(**base)
+
+
+def test_pages_stream_before_the_history_is_consumed():
+    consumed = []
+
+    def visits():
+        for i in range(3):
+            consumed.append(i)
+            yield _visit(motivo_consulta=f"Motivo {i}", diagnostico=f"Dx {i}")
+
+    stream = dossier.render_dossier(PATIENT, DOCTOR, visits())
+    header = next(stream)
+    first_page = next(stream)
+    assert header.startswith(b"%PDF-1.4")
+    assert b"/Type /Page " in first_page
+    assert consumed == [0]
+
+    pdf = header + first_page + b"".join(stream)
+    reader = PdfReader(io.BytesIO(pdf))
+    assert len(reader.pages) == 3
+    text = reader.pages[1].extract_text()
+    assert "Motivo 1" in text and "Dx 1" in text and "Ana Rojas" in text and "Dra. Historia" in text
+
+
+def test_long_consultation_continues_with_repeated_header():
+    long_plan = "\n".join(f"Indicación número {i}" for i in range(120))
+    visit = _visit(motivo_consulta="Control", diagnostico="Hipertensión", plan_tratamiento=long_plan,
+                   presion_arterial="120/80", peso_kg=70.5)
+    reader = PdfReader(io.BytesIO(b"".join(dossier.render_dossier(PATIENT, DOCTOR, [visit]))))
+
+    assert len(reader.pages) == 3
+    first, last = reader.pages[0].extract_text(), reader.pages[-1].extract_text()
+    assert "Hipertensión" in first and "PA 120/80" in last and "Peso 70.5 kg" in last
+    assert "(continuación)" in last and "DNI / RUT: 11.111.111-1" in last and "Página 3" in last
+
+
+def test_patient_without_visits_gets_one_page():
+    reader = PdfReader(io.BytesIO(b"".join(dossier.render_dossier(PATIENT, DOCTOR, []))))
+    assert len(reader.pages) == 1
+    assert "no tiene consultas" in reader.pages[0].extract_text()
+
+
+def test_text_outside_latin_1_is_embedded_not_replaced(caplog):
+    patient = dict(PATIENT, name="Иван Петров")
+    visit = _visit(diagnostico="HTA ≥ 140/90 → β-bloqueador", plan_tratamiento="Control 漢")
+    pdf = b"".join(dossier.render_dossier(patient, DOCTOR, [visit]))
+    reader = PdfReader(io.BytesIO(pdf), strict=True)
+
+    text = reader.pages[0].extract_text()
+    assert "Иван Петров" in text and "HTA ≥ 140/90 → β-bloqueador" in text
+    assert reader.metadata.title == "Historial clínico - Иван Петров"
+    # No glyph in Arial: printed as "?", but not silently
+    assert "Control ?" in text
+    assert "1 characters without a glyph" in caplog.text
+    # Only the glyphs used are embedded
+    assert len(pdf) < 60_000
+
+
+def test_dossier_endpoint_is_tenant_scoped(db_session, auth_client):
+    user = seed_doctor(db_session, "dossier_doctor@example.com",
+                       professional_name="Dra. Historia", specialty="Medicina Interna")
+    other = seed_doctor(db_session, "dossier_other@example.com")
+    patient = seed_patient(db_session, user, "DOS-1", nombre="Ana", apellido_paterno="Rojas")
+    for day in (1, 2):
+        seed_consultation(db_session, patient, motivo_consulta=f"Visita {day}",
+                          created_at=datetime.datetime(2026, 2, day, 9, 0))
+
+    res = auth_client.login(user).get(f"/api/patients/{patient.id}/dossier")
+    foreign = auth_client.login(other).get(f"/api/patients/{patient.id}/dossier")
+
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/pdf"
+    reader = PdfReader(io.BytesIO(res.content))
+    # Newest first, like the consultation history
+    assert [("Visita 2" in p.extract_text(), "02/02/2026" in p.extract_text()) for p in reader.pages] == [
+        (True, True), (False, False)
+    ]
+    assert "Visita 1" in reader.pages[1].extract_text()
+    assert foreign.status_code == 404
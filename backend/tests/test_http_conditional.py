@@ -0,0 +1,94 @@
+from backend import models
+from backend.tests.factories import seed_doctor, seed_patient
+
+
+def _seed(db_session):
+    user = seed_doctor(db_session, "etag_doctor@example.com")
+    patient = seed_patient(db_session, user, "ETAG-001", nombre="Eva", apellido_paterno="Etag",
+                           fecha_nacimiento="1990-01-01")
+    return user, patient
+
+
+def test_patient_detail_etag_roundtrip(db_session, auth_client):
+    user, patient = _seed(db_session)
+    auth_client.login(user)
+    first = auth_client.get(f"/api/patients/{patient.id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = auth_client.get(f"/api/patients/{patient.id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    res = auth_client.patch(f"/api/patients/{patient.id}", json={"telefono": "555-0000"})
+    assert res.status_code == 200
+
+    stale = auth_client.get(f"/api/patients/{patient.id}", headers={"If-None-Match": etag})
+    assert stale.status_code == 200
+    assert stale.headers["etag"] != etag
+    assert stale.json()["telefono"] == "555-0000"
+
+
+def test_conditional_lookup_keeps_tenant_404(db_session, auth_client):
+    user, patient = _seed(db_session)
+    other = seed_doctor(db_session, "etag_other@example.com")
+
+    auth_client.login(other)
+    res = auth_client.get(f"/api/patients/{patient.id}", headers={"If-None-Match": "*"})
+
+    assert res.status_code == 404
+
+
+def test_medical_background_etag_changes_after_update(db_session, auth_client):
+    user, patient = _seed(db_session)
+    url = f"/api/medical-background/pacientes/{patient.id}/antecedentes"
+    auth_client.login(user)
+    empty = auth_client.get(url)
+    etag = empty.headers["etag"]
+    assert auth_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    auth_client.put(url, json={"alergias": "Penicilina"})
+    updated = auth_client.get(url, headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.json()["alergias"] == "Penicilina"
+
+
+def test_preferences_and_feature_flags_revalidate(db_session, auth_client):
+    user, _ = _seed(db_session)
+    auth_client.login(user)
+    prefs = auth_client.get("/api/doctors/preferences")
+    assert auth_client.get(
+        "/api/doctors/preferences", headers={"If-None-Match": prefs.headers["etag"]}
+    ).status_code == 304
+
+    flags = auth_client.get("/api/doctors/feature-flags")
+    assert flags.headers["cache-control"] == "private, max-age=60"
+    assert auth_client.get(
+        "/api/doctors/feature-flags", headers={"If-None-Match": flags.headers["etag"]}
+    ).status_code == 304
+
+
+def test_current_map_etag(db_session, auth_client):
+    user, _ = _seed(db_session)
+    db_session.add(models.PrescriptionMap(
+        doctor_id=user.email,
+        name="Recetario",
+        fields_config=[{"field_key": "patient_name", "x_mm": 10, "y_mm": 10}],
+        is_active=True,
+    ))
+    db_session.commit()
+
+    auth_client.login(user)
+    first = auth_client.get("/api/maps/current")
+    assert first.status_code == 200
+    assert "last-modified" in first.headers
+    again = auth_client.get("/api/maps/current", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+
+    listing = auth_client.get("/api/maps")
+    assert auth_client.get(
+        "/api/maps", headers={"If-None-Match": listing.headers["etag"]}
+    ).status_code == 304
@@ -0,0 +1,111 @@
+import io
+
+from PIL import Image, PngImagePlugin
+
+from backend.services import asset_cache as asset_cache_module
+from backend.services.asset_cache import AssetCache, LocalBucket
+from backend.services.image_derivatives import (
+    box_pixels, derivative_path, generate_print_derivative, make_print_derivative,
+)
+from backend.services.pdf_service import PDFService
+from backend.tests.factories import seed_doctor
+
+
+def _scanned_signature() -> bytes:
+    image = Image.new("RGBA", (4000, 1200), (0, 0, 0, 0))
+    for x in range(200, 3800):
+        image.putpixel((x, 600 + (x % 40)), (10, 20, 120, 255))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Author", "scanner metadata")
+    out = io.BytesIO()
+    image.save(out, format="PNG", pnginfo=info)
+    return out.getvalue()
+
+
+def _local_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("FIREBASE_STORAGE_BUCKET", "bucket")
+    cache = AssetCache(
+        memory_max_bytes=8 * 1024 * 1024,
+        disk_dir=str(tmp_path / "cache"),
+        revalidate_seconds=600,
+        bucket_factory=lambda name: LocalBucket(str(tmp_path / "storage"), name),
+    )
+    monkeypatch.setattr(asset_cache_module, "asset_cache", cache)
+    return cache
+
+
+def _upload(tmp_path, path, data):
+    target = tmp_path / "storage" / "bucket" / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+
+
+def test_derivative_fits_print_box_without_alpha_or_metadata():
+    original = _scanned_signature()
+    derivative = make_print_derivative(original, "signature")
+
+    with Image.open(io.BytesIO(derivative)) as image:
+        max_w, max_h = box_pixels("signature")
+        assert image.width <= max_w and image.height <= max_h
+        assert image.mode == "P"
+        assert "transparency" not in image.info
+        assert "Author" not in image.info
+        assert round(image.info["dpi"][0]) == 300
+    assert len(derivative) < len(original)
+
+
+def test_derivative_path_sits_next_to_original():
+    assert derivative_path("signatures/doc.png") == "signatures/doc.print.png"
+    assert derivative_path("signatures/doc.print.png") == "signatures/doc.print.png"
+
+
+def test_renders_prefer_uploaded_derivative(tmp_path, monkeypatch):
+    _local_cache(tmp_path, monkeypatch)
+    _upload(tmp_path, "signatures/doc.png", _scanned_signature())
+
+    assert generate_print_derivative("signatures/doc.png", "signature") == "signatures/doc.print.png"
+    assert (tmp_path / "storage" / "bucket" / "signatures" / "doc.print.png").exists()
+
+    asset = PDFService.storage_asset("signatures/doc.png")
+    assert asset.path == "signatures/doc.print.png"
+
+
+def test_preferences_save_builds_logo_derivative(db_session, auth_client, tmp_path, monkeypatch):
+    _local_cache(tmp_path, monkeypatch)
+    logo = io.BytesIO()
+    Image.new("RGB", (2400, 2400), (200, 30, 30)).save(logo, format="JPEG")
+    _upload(tmp_path, "logos/doc.jpg", logo.getvalue())
+
+    user = seed_doctor(db_session, "derivative_doctor@example.com")
+
+    res = auth_client.login(user).put("/api/doctors/preferences", json={"logo_path": "logos/doc.jpg"})
+
+    assert res.status_code == 200, res.text
+    derivative = tmp_path / "storage" / "bucket" / "logos" / "doc.print.png"
+    with Image.open(derivative) as image:
+        assert max(image.size) <= max(box_pixels("logo"))
+
+
+def test_reupload_drops_the_stale_derivative_even_if_rebuild_fails(db_session, auth_client, tmp_path, monkeypatch):
+    _local_cache(tmp_path, monkeypatch)
+    _upload(tmp_path, "logos/doc.png", _scanned_signature())
+    generate_print_derivative("logos/doc.png", "logo")
+    assert PDFService.storage_asset("logos/doc.png").path == "logos/doc.print.png"
+
+    replacement = io.BytesIO()
+    Image.new("RGB", (64, 64), (0, 120, 0)).save(replacement, format="PNG")
+    _upload(tmp_path, "logos/doc.png", replacement.getvalue())
+
+    def broken(data, kind):
+        raise OSError("decoder unavailable")
+
+    monkeypatch.setattr("backend.services.image_derivatives.make_print_derivative", broken)
+    user = seed_doctor(db_session, "reupload_doctor@example.com", print_logo_path="logos/doc.png")
+
+    res = auth_client.login(user).put("/api/doctors/preferences", json={"logo_path": "logos/doc.png"})
+
+    assert res.status_code == 200, res.text
+    assert not (tmp_path / "storage" / "bucket" / "logos" / "doc.print.png").exists()
+    asset = PDFService.storage_asset("logos/doc.png")
+    assert asset.path == "logos/doc.png"
+    assert asset.data == replacement.getvalue()
@@ -0,0 +1,77 @@
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+
+from backend import models
+from backend.services import print_preview
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.tests.factories import seed_doctor
+
+SCAN_COLOR = (250, 240, 200)
+FIELDS = [
+    {"field_key": "patient_name", "x_mm": 20, "y_mm": 40, "max_width_mm": 80},
+    {"field_key": "date", "x_mm": 100, "y_mm": 30, "max_width_mm": None},
+    {"field_key": "qr_code", "x_mm": 15, "y_mm": 200, "max_width_mm": 20},
+]
+
+
+def _setup(db_session, auth_client, monkeypatch):
+    monkeypatch.setattr(print_preview, "preview_cache", PDFCache(8 * 1024 * 1024, None, 0))
+    images = print_preview.ImageCache(64 * 1024 * 1024)
+    monkeypatch.setattr(print_preview, "background_images", images)
+
+    scan = io.BytesIO()
+    Image.new("RGB", (1748, 2480), SCAN_COLOR).save(scan, format="PNG")
+    monkeypatch.setattr(PDFService, "storage_asset", staticmethod(
+        lambda value: SimpleNamespace(data=scan.getvalue(), generation="7", base64="")
+    ))
+
+    user = seed_doctor(db_session, "map_preview@example.com")
+    pmap = models.PrescriptionMap(doctor_id=user.email, name="Talonario", canvas_width_mm=148.0,
+                                  canvas_height_mm=210.0, fields_config=FIELDS, is_active=True,
+                                  background_image_url="scans/talonario.png")
+    db_session.add(pmap)
+    db_session.commit()
+
+    auth_client.login(user)
+    return pmap, images
+
+
+def test_map_preview_draws_fields_over_the_scan(db_session, auth_client, monkeypatch):
+    pmap, images = _setup(db_session, auth_client, monkeypatch)
+    res = auth_client.get(f"/api/maps/{pmap.id}/preview")
+
+    assert res.status_code == 200 and res.headers["content-type"] == "image/png"
+    image = Image.open(io.BytesIO(res.content)).convert("RGB")
+    assert image.size == (420, 595)
+    assert image.getpixel((400, 300)) == SCAN_COLOR
+    # QR placeholder: 20mm square whose top edge sits at y_mm = 200
+    qr_x, qr_y = round(16 * print_preview.MM_TO_PT), round(201 * print_preview.MM_TO_PT)
+    assert image.getpixel((qr_x, qr_y)) == print_preview.PLACEHOLDER_FILL
+    assert images.stats["decodes"] == 1
+
+
+def test_saved_map_refreshes_preview_without_decoding_the_scan_again(db_session, auth_client, monkeypatch):
+    pmap, images = _setup(db_session, auth_client, monkeypatch)
+    first = auth_client.get(f"/api/maps/{pmap.id}/preview")
+    cached = auth_client.get(f"/api/maps/{pmap.id}/preview", headers={"If-None-Match": first.headers["etag"]})
+
+    pmap.fields_config = [dict(FIELDS[0], x_mm=60), *FIELDS[1:]]
+    db_session.commit()
+    moved = auth_client.get(f"/api/maps/{pmap.id}/preview", headers={"If-None-Match": first.headers["etag"]})
+
+    assert cached.status_code == 304
+    assert moved.status_code == 200
+    assert moved.headers["etag"] != first.headers["etag"]
+    assert moved.content != first.content
+    assert images.stats == {"hits": 1, "decodes": 1}
+
+
+def test_map_preview_is_owner_scoped(db_session, auth_client, monkeypatch):
+    pmap, _ = _setup(db_session, auth_client, monkeypatch)
+    other = seed_doctor(db_session, "map_preview_other@example.com")
+    res = auth_client.login(other).get(f"/api/maps/{pmap.id}/preview")
+
+    assert res.status_code == 404
@@ -0,0 +1,156 @@
+import io
+import os
+
+import pytest
+from pypdf import PdfReader
+from reportlab.pdfbase import pdfmetrics
+
+from backend import models
+from backend.services import native_recipe, stationery, weasy_engine
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.services.template_registry import template_registry
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LABELS = ["PACIENTE", "DNI / RUT", "EDAD", "FECHA DE EMISIÓN", "PRESCRIPCIÓN / INDICACIONES",
+          "Firma del Médico", "Dr. Paridad", "Cardiología", "Consulta Central"]
+
+# (text, anchor, bold, size, x, baseline from the page top) in recipe_template.html
+TEMPLATE_POSITIONS = [
+    ("Dr. Paridad", "right", True, 9, 362.835, 65.693),
+    ("Cardiología", "right", False, 9, 362.835, 79.193),
+    ("VITALINUAGE", "left", True, 18, 56.693, 81.443),
+    ("PACIENTE", "left", True, 8, 68.693, 141.193),
+    ("DNI / RUT", "right", True, 8, 350.835, 141.193),
+    ("EDAD", "left", True, 8, 68.693, 171.943),
+    ("FECHA DE EMISIÓN", "right", True, 8, 350.835, 171.943),
+    ("PRESCRIPCIÓN / INDICACIONES", "left", True, 11, 56.693, 232.693),
+    ("Firma del Médico", "center", False, 10, 287.835, 498.693),
+    ("Consulta Central", "center", False, 8, 209.764, 510.583),
+    ("Documento generado electrónicamente por Vitalinuage Platform", "center", False, 8, 209.764, 522.583),
+    ("Verifique autenticidad en vitalinuage.web.app/v/abc", "center", False, 8, 209.764, 534.583),
+]
+
+
+def _context(**overrides):
+    context = {
+        "doctor": {"name": "Dr. Paridad", "specialty": "Cardiología"},
+        "patient": {"name": "Ana Rojas", "dni": "11.111.111-1", "age": 40},
+        "date": "01/02/2026",
+        "treatment": "Paracetamol 500 mg cada 8 horas",
+        "diagnosis": "Cefalea",
+        "primary_color": "#1e3a8a",
+        "secondary_color": "#64748b",
+        "footer_text": "Consulta Central",
+        "verification_url": "https://vitalinuage.web.app/v/abc",
+        "verification_display_url": "vitalinuage.web.app/v/abc",
+    }
+    context.update(overrides)
+    return context
+
+
+def _positions(pdf_bytes, page=0):
+    """Text runs with their (x, y) origin in page space."""
+    found = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        if text.strip():
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            found.append((text.strip(), x, y))
+
+    PdfReader(io.BytesIO(pdf_bytes)).pages[page].extract_text(visitor_text=visitor)
+    return found
+
+
+def _origin(positions, label):
+    """Origin of the run where `label` starts; runs continued on the same baseline are joined."""
+    for index, (_, x, y) in enumerate(positions):
+        joined = ""
+        for text, _, next_y in positions[index:]:
+            if abs(next_y - y) > 0.5:
+                break
+            joined += text
+            if joined.startswith(label):
+                return x, y
+    raise AssertionError(f"{label!r} not found in {[text for text, _, _ in positions]}")
+
+
+def test_native_render_has_every_field():
+    pdf_bytes = native_recipe.render(_context())
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+
+    assert len(reader.pages) == 1
+    text = reader.pages[0].extract_text()
+    for expected in LABELS + ["Ana Rojas", "11.111.111-1", "40 años", "Paracetamol", "DIAGNÓSTICO",
+                              "Cefalea", "vitalinuage.web.app/v/abc"]:
+        assert expected in text
+
+
+def test_long_treatment_continues_on_next_page():
+    treatment = "\n".join(f"Indicacion {i}" for i in range(20))
+    reader = PdfReader(io.BytesIO(native_recipe.render(_context(treatment=treatment))))
+
+    assert len(reader.pages) == 2
+    second = reader.pages[1].extract_text()
+    assert "Ana Rojas" in second and "Indicacion 19" in second and "Cefalea" in second
+    assert "Indicacion 0" not in second
+
+
+def test_layout_matches_recipe_template():
+    # Where templates/recipe_template.html puts each run for this context
+    # (A5, body padding 20mm, line-height 1.5, QR in the fixed footer),
+    # worked out from its CSS box model in points from the top of the page.
+    # Both draw the bundled Arial, so widths match too.
+    body_font, bold_font = stationery.register_fonts()
+    positions = _positions(native_recipe.render(_context()))
+
+    for label, anchor, bold, size, x, top in TEMPLATE_POSITIONS:
+        left, y = _origin(positions, label)
+        width = pdfmetrics.stringWidth(label, bold_font if bold else body_font, size)
+        native_x = left + {"left": 0, "center": width / 2, "right": width}[anchor]
+        assert native_x == pytest.approx(x, abs=3.0), label
+        assert native_recipe.PAGE_HEIGHT - y == pytest.approx(top, abs=3.0), label
+
+
+@pytest.mark.skipif(not weasy_engine.warm_up(), reason="WeasyPrint needs pango/cairo")
+def test_layout_matches_weasyprint_render():
+    html = template_registry.render("pdf/recipe_template.html", **_context())
+    weasy = _positions(weasy_engine.write_pdf(html, base_url=BACKEND_DIR))
+    native = _positions(native_recipe.render(_context()))
+
+    for label, *_ in TEMPLATE_POSITIONS:
+        native_x, native_y = _origin(native, label)
+        weasy_x, weasy_y = _origin(weasy, label)
+        assert native_x == pytest.approx(weasy_x, abs=3.0), label
+        assert native_y == pytest.approx(weasy_y, abs=3.0), label
+
+
+def test_print_template_id_selects_native_engine(db_session, monkeypatch):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, None, 0))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    def html_render(consultation, **kwargs):
+        raise AssertionError("WeasyPrint path must not run for the native template")
+
+    monkeypatch.setattr(PDFService, "generate_from_html_file", staticmethod(html_render))
+
+    user = models.User(email="native_doctor@example.com", hashed_password="pw", is_verified=True,
+                       print_template_id="native", print_header_text="Lunes a viernes")
+    db_session.add(user)
+    db_session.commit()
+    patient = models.Patient(nombre="Marta", apellido_paterno="Paz", dni="NAT-1",
+                             fecha_nacimiento="1990-05-05", owner_id=user.email)
+    db_session.add(patient)
+    db_session.commit()
+    consultation = models.ClinicalConsultation(patient_id=patient.id, owner_id=user.email,
+                                               motivo_consulta="Control", diagnostico="Dx", plan_tratamiento="Reposo")
+    db_session.add(consultation)
+    db_session.commit()
+
+    pdf_bytes = PDFService.generate_prescription_pdf(consultation, user.email, db_session)
+    text = PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text()
+    assert "Marta Paz" in text and "Reposo" in text and "Lunes a viernes" in text
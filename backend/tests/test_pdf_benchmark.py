@@ -0,0 +1,34 @@
+import json
+
+from backend.scripts import benchmark_pdf_render as bench
+from backend.services.pdf_service import PDFService
+
+
+def test_suite_reports_each_scenario_and_restores_storage(tmp_path):
+    storage_asset = PDFService.__dict__["storage_asset"]
+    report = bench.run_suite(engines=("coordinates", "native"), variants=("none", "logo", "full"),
+                             runs=2, cold=False)
+
+    assert PDFService.__dict__["storage_asset"] is storage_asset
+    scenarios = {(entry["engine"], entry["variant"]): entry for entry in report["results"]}
+    # A coordinate map has no logo; "full" is what each engine can draw
+    assert ("coordinates", "logo") not in scenarios
+    assert scenarios[("coordinates", "full")]["features"] == ["signature", "qr"]
+    assert scenarios[("native", "full")]["features"] == ["signature", "logo", "qr"]
+
+    for entry in scenarios.values():
+        assert entry["status"] == "ok"
+        assert entry["warm"]["runs"] == 2
+        assert entry["warm"]["bytes"] > 0 and entry["warm"]["tracemalloc_peak_kb"] > 0
+    assert scenarios[("native", "full")]["warm"]["bytes"] > scenarios[("native", "none")]["warm"]["bytes"]
+
+    # The report is plain JSON and compares against itself without change
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps(report))
+    rows = bench.compare(report, json.loads(path.read_text()))
+    assert rows and all(row["change_pct"] == 0 for row in rows)
+
+
+def test_cold_render_runs_in_a_fresh_process():
+    cold = bench.run_cold("coordinates", "none")
+    assert cold["bytes"] > 0 and cold["wall_ms"] > 0
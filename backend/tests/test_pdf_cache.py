@@ -0,0 +1,118 @@
+import datetime
+import os
+
+from backend import models
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services.pdf_cache import PDFCache, digest_key
+from backend.services.pdf_service import PDFService
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def test_digest_key_is_order_sensitive():
+    assert digest_key("a", 1, None) == digest_key("a", 1, None)
+    assert digest_key("a", 1) != digest_key(1, "a")
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    cache = PDFCache(memory_max_bytes=10, disk_dir=None, disk_max_bytes=0)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "a" is now most recent
+
+    cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_tier_survives_memory_and_is_bounded(tmp_path):
+    cache = PDFCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=20)
+    cache.put("first", b"x" * 8)
+    assert cache.path_for("first") is not None
+
+    # A fresh instance (e.g. another worker) reads the shared disk tier
+    other = PDFCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=20)
+    assert other.get("first") == b"x" * 8
+    assert other.stats["disk_hits"] == 1
+
+    os.utime(cache.path_for("first"), (1, 1))
+    cache.put("second", b"y" * 8)
+    cache.put("third", b"z" * 8)
+
+    assert cache.path_for("first") is None
+    assert cache.path_for("third") is not None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_generate_prescription_pdf_reuses_cached_render(db_session, monkeypatch, tmp_path):
+    cache = PDFCache(memory_max_bytes=1024 * 1024, disk_dir=str(tmp_path), disk_max_bytes=1024 * 1024)
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", cache)
+
+    renders = []
+
+    def fake_render(consultation, **kwargs):
+        renders.append(consultation.id)
+        return b"%PDF-" + str(len(renders)).encode()
+
+    monkeypatch.setattr(PDFService, "generate_from_html_file", staticmethod(fake_render))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    user = models.User(email="cache_doctor@example.com", hashed_password="pw", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    patient = models.Patient(nombre="Cache", apellido_paterno="Test", dni="CACHE-1",
+                             fecha_nacimiento="1980-01-01", owner_id=user.email)
+    db_session.add(patient)
+    db_session.commit()
+    consultation = models.ClinicalConsultation(
+        patient_id=patient.id, owner_id=user.email,
+        motivo_consulta="Control", diagnostico="Dx", plan_tratamiento="Tx",
+    )
+    db_session.add(consultation)
+    db_session.commit()
+
+    first = PDFService.generate_prescription_pdf(consultation, user.email, db_session)
+    second = PDFService.generate_prescription_pdf(consultation, user.email, db_session)
+    assert first == second == b"%PDF-1"
+    assert len(renders) == 1
+
+    # Any render input change yields a new address
+    user.print_primary_color = "#112233"
+    db_session.commit()
+    third = PDFService.generate_prescription_pdf(consultation, user.email, db_session)
+    assert third == b"%PDF-2"
+    assert len(renders) == 2
+
+
+def test_public_verification_link_serves_the_cached_pdf(db_session, auth_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, str(tmp_path), 1024 * 1024))
+    renders = []
+
+    def fake_render(consultation, **kwargs):
+        renders.append(consultation.id)
+        return b"%PDF-" + str(len(renders)).encode()
+
+    monkeypatch.setattr(PDFService, "generate_from_html_file", staticmethod(fake_render))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    user = seed_doctor(db_session, "public_link@example.com")
+    consultation = seed_consultation(db_session, seed_patient(db_session, user, "CACHE-2"))
+    verification = models.PrescriptionVerification(
+        uuid="public-link-1", consultation_id=consultation.id, doctor_email=user.email,
+        doctor_name="Dr. Entrega", issue_date=datetime.datetime.utcnow(),
+    )
+    db_session.add(verification)
+    db_session.commit()
+
+    private = PDFService.generate_prescription_pdf(consultation, user.email, db_session)
+    public = auth_client.get("/v/public-link-1/pdf")
+    info = auth_client.get("/v/public-link-1")
+
+    assert public.status_code == 200 and public.content == private
+    assert info.status_code == 200 and info.json()["doctor_name"] == "Dr. Entrega"
+    assert auth_client.get("/v/no-such-uuid/pdf").status_code == 404
+    assert len(renders) == 1
@@ -0,0 +1,97 @@
+from backend import repository
+from backend.api import consultations as consultations_api
+from backend.services import native_recipe
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.services.render_pool import RenderPool
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _setup(db_session, auth_client, monkeypatch, disk_dir):
+    cache = PDFCache(1024 * 1024, str(disk_dir) if disk_dir else None, 1024 * 1024 if disk_dir else 0)
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", cache)
+    monkeypatch.setattr(consultations_api, "render_pool", RenderPool(mode="thread", max_workers=1, timeout=10))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    renders = []
+    original = native_recipe.render
+
+    def counting_render(context):
+        renders.append(context["verification_uuid"])
+        return original(context)
+
+    monkeypatch.setattr(native_recipe, "render", counting_render)
+
+    user = seed_doctor(db_session, "delivery_doctor@example.com", print_template_id="native")
+    patient = seed_patient(db_session, user, "RNG-1", nombre="Rango", apellido_paterno="Parcial",
+                           fecha_nacimiento="1975-03-03")
+    consultation = seed_consultation(db_session, patient, diagnostico="Rinitis",
+                                     plan_tratamiento="Loratadina 10 mg al día")
+    auth_client.login(user)
+    return consultation, renders
+
+
+def test_pdf_is_revalidated_and_resumed_without_rendering_again(db_session, auth_client, monkeypatch, tmp_path):
+    consultation, renders = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    url = f"/api/consultas/{consultation.id}/pdf"
+    full = auth_client.get(url)
+    etag = full.headers["etag"]
+    cached = auth_client.get(url, headers={"If-None-Match": etag})
+    head = auth_client.get(url, headers={"Range": "bytes=0-99"})
+    tail = auth_client.get(url, headers={"Range": "bytes=100-", "If-Range": etag})
+
+    assert full.status_code == 200 and full.content.startswith(b"%PDF")
+    assert not etag.startswith("W/")
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["cache-control"] == "private, no-cache"
+
+    assert cached.status_code == 304 and cached.content == b""
+    assert head.status_code == 206
+    assert head.headers["content-range"] == f"bytes 0-99/{len(full.content)}"
+    assert tail.status_code == 206
+    assert head.content + tail.content == full.content
+    assert len(renders) == 1
+
+
+def test_changed_consultation_gets_a_new_etag(db_session, auth_client, monkeypatch, tmp_path):
+    consultation, renders = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    url = f"/api/consultas/{consultation.id}/pdf"
+    first = auth_client.get(url)
+    consultation.plan_tratamiento = "Cetirizina 10 mg al día"
+    db_session.commit()
+    stale = auth_client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    # A resume against the old version gets the whole new file
+    resumed = auth_client.get(url, headers={"Range": "bytes=100-", "If-Range": first.headers["etag"]})
+
+    assert stale.status_code == 200
+    assert stale.headers["etag"] != first.headers["etag"]
+    assert resumed.status_code == 200 and resumed.content == stale.content
+    assert len(renders) == 2
+
+
+def test_ranges_are_served_from_memory_when_the_disk_tier_is_off(db_session, auth_client, monkeypatch):
+    consultation, renders = _setup(db_session, auth_client, monkeypatch, None)
+    url = f"/api/consultas/{consultation.id}/pdf"
+    full = auth_client.get(url)
+    suffix = auth_client.get(url, headers={"Range": "bytes=-50"})
+    beyond = auth_client.get(url, headers={"Range": f"bytes={len(full.content) + 10}-"})
+
+    assert suffix.status_code == 206 and suffix.content == full.content[-50:]
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == f"bytes */{len(full.content)}"
+    assert len(renders) == 1
+
+
+def test_public_verification_link_shares_the_private_etag(db_session, auth_client, monkeypatch, tmp_path):
+    consultation, renders = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    verification = repository.get_or_create_verification(db_session, consultation.id, consultation.owner_id,
+                                                         doctor_name="Dr. Entrega")
+    private = auth_client.get(f"/api/consultas/{consultation.id}/pdf")
+    auth_client.logout()
+    public = auth_client.get(f"/v/{verification.uuid}/pdf")
+
+    assert public.status_code == 200 and public.content == private.content
+    assert public.headers["etag"] == private.headers["etag"]
+    assert len(renders) == 1
@@ -0,0 +1,108 @@
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+from reportlab import rl_config
+
+from backend import models
+from backend.services import native_recipe, pdf_profile, print_preview
+from backend.services.image_derivatives import box_pixels, make_print_derivative
+from backend.services.pdf_service import PDFService
+
+
+def _signature():
+    scan = Image.effect_noise((1800, 600), 40).convert("RGB")
+    buffer = io.BytesIO()
+    scan.save(buffer, format="PNG")
+    return make_print_derivative(buffer.getvalue(), "signature")
+
+
+def _render(profile, signature=None):
+    with pdf_profile.using(profile):
+        signature = pdf_profile.optimize_image(signature, "signature")
+        context = PDFService.prescription_context(
+            print_preview.sample_consultation(),
+            signature_base64=base64.b64encode(signature).decode("ascii") if signature else None,
+        )
+        return native_recipe.render(context)
+
+
+def _text(pdf_bytes):
+    return PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text()
+
+
+def test_standard_profile_is_deterministic_and_smaller_than_legacy():
+    first, again = _render("standard"), _render("standard")
+    legacy = _render("legacy")
+
+    assert first == again
+    # Unhinted fonts and binary streams: same text, a third of the size
+    assert _text(first) == _text(legacy)
+    assert len(first) * 2 < len(legacy)
+
+
+def test_concurrent_renders_keep_their_own_stream_encoding():
+    standard = _render("standard")
+    before = rl_config.useA85
+    names = ["standard", "legacy"] * 4
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(_render, names))
+
+    for name, pdf_bytes in zip(names, results):
+        if name == "standard":
+            assert pdf_bytes == standard
+        else:
+            assert b"/ASCII85Decode" in pdf_bytes
+    assert rl_config.useA85 == before
+
+
+def test_mobile_profile_downsamples_images():
+    signature = _signature()
+    optimized = pdf_profile.optimize_image(signature, "signature", pdf_profile.PROFILES["mobile"])
+
+    image = Image.open(io.BytesIO(optimized))
+    width, height = box_pixels("signature", 150)
+    assert image.format == "JPEG"
+    assert image.width <= width and image.height <= height
+    assert pdf_profile.optimize_image(signature, "signature", pdf_profile.PROFILES["standard"]) is signature
+
+    assert len(_render("mobile", signature)) < len(_render("standard", signature)) / 2
+
+
+def test_unknown_profile_is_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        with pdf_profile.using("tiny"):
+            pass
+    monkeypatch.setenv("PDF_OUTPUT_PROFILE", "tiny")
+    assert pdf_profile.active().name == pdf_profile.DEFAULT_PROFILE
+
+
+def test_profile_is_part_of_the_cache_key_and_renders_are_recorded(db_session, monkeypatch):
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+    user = models.User(email="profile_doctor@example.com", hashed_password="pw", is_verified=True,
+                       print_template_id="native")
+    patient = models.Patient(nombre="Ana", apellido_paterno="Rojas", dni="1-9", fecha_nacimiento="1980-05-05",
+                             owner_id=user.email)
+    db_session.add_all([user, patient])
+    db_session.commit()
+    consultation = models.ClinicalConsultation(patient_id=patient.id, owner_id=user.email,
+                                               motivo_consulta="Control", diagnostico="Sano",
+                                               plan_tratamiento="Reposo")
+    db_session.add(consultation)
+    db_session.commit()
+
+    keys = {}
+    for name in ("standard", "mobile"):
+        with pdf_profile.using(name):
+            keys[name] = PDFService.render_cache_key(consultation, user, None)
+            before = pdf_profile.render_stats.get(f"native/{name}", {}).get("renders", 0)
+            pdf_bytes = PDFService._render_prescription_pdf(consultation, user.email, user, None, db_session)
+            stats = pdf_profile.render_stats[f"native/{name}"]
+            assert stats["renders"] == before + 1
+            assert stats["last_bytes"] == len(pdf_bytes)
+
+    assert keys["standard"] != keys["mobile"]
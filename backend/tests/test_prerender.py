@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from backend import models
+from backend.api import consultations as consultations_api
+from backend.api import patients as patients_api
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services import native_recipe
+from backend.services import render_pool as render_pool_module
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.services.render_pool import RenderPool
+from backend.tests.factories import seed_doctor, seed_patient
+
+
+def _setup(db_session, auth_client, monkeypatch, tmp_path, prerender):
+    if prerender:
+        monkeypatch.setenv("PDF_PRERENDER_ON_SAVE", "1")
+    else:
+        monkeypatch.delenv("PDF_PRERENDER_ON_SAVE", raising=False)
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, str(tmp_path), 1024 * 1024))
+    pool = RenderPool(mode="thread", max_workers=1, timeout=10)
+    monkeypatch.setattr(consultations_api, "render_pool", pool)
+    monkeypatch.setattr(patients_api, "render_pool", pool)
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    renders = []
+    original = native_recipe.render
+
+    def counting_render(context):
+        renders.append(context["verification_uuid"])
+        return original(context)
+
+    monkeypatch.setattr(native_recipe, "render", counting_render)
+
+    user = seed_doctor(db_session, "prerender_doctor@example.com", print_template_id="native")
+    patient = seed_patient(db_session, user, "PRE-1", nombre="Eager", apellido_paterno="Render")
+
+    auth_client.login(user)
+    return pool, patient, renders
+
+
+def test_saved_consultation_is_prerendered(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient, renders = _setup(db_session, auth_client, monkeypatch, tmp_path, prerender=True)
+    try:
+        res = auth_client.post(f"/api/patients/{patient.id}/consultations", json={
+            "reason": "Control", "diagnosis": "Dx", "treatment": "Reposo",
+        })
+        assert res.status_code == 201, res.text
+        consultation_id = res.json()["id"]
+
+        # The background task already rendered and recorded the verification
+        assert pool.stats["prerenders"] == 1
+        verification = db_session.query(models.PrescriptionVerification).filter_by(
+            consultation_id=consultation_id
+        ).one()
+        assert renders == [verification.uuid]
+
+        pdf = auth_client.get(f"/api/consultas/{consultation_id}/pdf")
+    finally:
+        pool.shutdown()
+
+    assert pdf.status_code == 200
+    assert pdf.content.startswith(b"%PDF")
+    assert len(renders) == 1
+
+
+def test_prerender_is_opt_in(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient, renders = _setup(db_session, auth_client, monkeypatch, tmp_path, prerender=False)
+    try:
+        res = auth_client.post(f"/api/patients/{patient.id}/consultations", json={
+            "reason": "Control", "diagnosis": "Dx", "treatment": "Reposo",
+        })
+    finally:
+        pool.shutdown()
+
+    assert res.status_code == 201, res.text
+    assert pool.stats["prerenders"] == 0
+    assert renders == []
+
+
+def test_prerender_lookups_run_off_the_event_loop(monkeypatch):
+    def slow_load(db, consultation_id):
+        time.sleep(0.2)
+        return None
+
+    monkeypatch.setattr(render_pool_module, "_load_consultation", slow_load)
+    pool = RenderPool(mode="thread", max_workers=1, timeout=10)
+
+    async def scenario():
+        ticks = []
+
+        async def heartbeat():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        beat = asyncio.ensure_future(heartbeat())
+        rendered = await pool.prerender(123, "nobody@example.com")
+        return rendered, ticks, beat.done()
+
+    try:
+        rendered, ticks, beat_done = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert rendered is False
+    assert len(ticks) == 5 and beat_done
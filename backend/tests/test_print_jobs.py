@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+import io
+import zipfile
+
+from pypdf import PdfReader
+
+from backend.services import asset_cache as asset_cache_module
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services import print_jobs as print_jobs_module
+from backend.services.asset_cache import AssetCache, LocalBucket
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.services.print_jobs import PrintJobStore
+from backend.services.render_pool import RenderPool, RenderTimeout
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _doctor(db_session, email):
+    user = seed_doctor(db_session, email, print_template_id="native")
+    return user, seed_patient(db_session, user, email, nombre="Lote", apellido_paterno="Diario")
+
+
+def _consultation(db_session, patient, treatment, created_at=None):
+    return seed_consultation(db_session, patient, plan_tratamiento=treatment,
+                             created_at=created_at or datetime.datetime(2026, 3, 2, 10, 0))
+
+
+def _setup(db_session, auth_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, None, 0))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+    pool = RenderPool(mode="thread", max_workers=1, timeout=10)
+    monkeypatch.setattr(print_jobs_module, "render_pool", pool)
+    store = PrintJobStore(str(tmp_path / "jobs"))
+    monkeypatch.setattr(print_jobs_module, "print_jobs", store)
+    from backend.api import print_jobs as print_jobs_api
+    monkeypatch.setattr(print_jobs_api, "print_jobs", store)
+
+    user, patient = _doctor(db_session, "batch_doctor@example.com")
+    auth_client.login(user)
+    return pool, patient
+
+
+def test_merged_pdf_has_one_page_per_prescription(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    consultations = [_consultation(db_session, patient, f"Tratamiento {i}") for i in range(3)]
+    try:
+        res = auth_client.post("/api/consultas/print-jobs", json={"ids": [c.id for c in reversed(consultations)]})
+        assert res.status_code == 202, res.text
+        job_id = res.json()["id"]
+
+        # The background task ran to completion before the response returned
+        job = auth_client.get(f"/api/consultas/print-jobs/{job_id}").json()
+        download = auth_client.get(f"/api/consultas/print-jobs/{job_id}/download")
+    finally:
+        pool.shutdown()
+
+    assert job["status"] == "done"
+    assert (job["total"], job["done"], job["failed_ids"]) == (3, 3, [])
+    assert job["download_url"] == f"/api/consultas/print-jobs/{job_id}/download"
+    assert download.status_code == 200
+    assert download.headers["content-type"] == "application/pdf"
+    reader = PdfReader(io.BytesIO(download.content))
+    assert [page.extract_text().count("Tratamiento 2") for page in reader.pages] == [1, 0, 0]
+    assert "Tratamiento 0" in reader.pages[2].extract_text()
+
+
+def test_zip_by_date_range_skips_other_days_and_doctors(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    same_day = [_consultation(db_session, patient, f"Dia {i}", datetime.datetime(2026, 3, 2, 9 + i)) for i in range(2)]
+    _consultation(db_session, patient, "Otro dia", datetime.datetime(2026, 3, 3, 9))
+    _, foreign_patient = _doctor(db_session, "batch_other@example.com")
+    _consultation(db_session, foreign_patient, "Ajena", datetime.datetime(2026, 3, 2, 9))
+    try:
+        res = auth_client.post("/api/consultas/print-jobs", json={"date_from": "2026-03-02", "format": "zip"})
+        assert res.status_code == 202, res.text
+        download = auth_client.get(f"/api/consultas/print-jobs/{res.json()['id']}/download")
+    finally:
+        pool.shutdown()
+
+    assert res.json()["total"] == 2
+    assert download.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(download.content))
+    assert archive.namelist() == [f"receta_{c.id}.pdf" for c in same_day]
+    assert archive.read(archive.namelist()[0]).startswith(b"%PDF")
+
+
+def test_jobs_are_private_and_selection_is_validated(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    consultation = _consultation(db_session, patient, "Privada")
+    try:
+        job = print_jobs_module.print_jobs.create("batch_other@example.com", [consultation.id], "pdf")
+        assert auth_client.get(f"/api/consultas/print-jobs/{job.id}").status_code == 404
+        assert auth_client.get(f"/api/consultas/print-jobs/{job.id}/download").status_code == 404
+
+        mine = print_jobs_module.print_jobs.create(patient.owner_id, [consultation.id], "pdf")
+        assert auth_client.get(f"/api/consultas/print-jobs/{mine.id}/download").status_code == 409
+
+        assert auth_client.post("/api/consultas/print-jobs", json={}).status_code == 422
+        assert auth_client.post("/api/consultas/print-jobs", json={"date_from": "2026-01-01"}).status_code == 422
+        assert auth_client.post("/api/consultas/print-jobs", json={
+            "ids": [1], "date_from": "2026-01-01"
+        }).status_code == 422
+    finally:
+        pool.shutdown()
+
+
+def test_merged_pdf_jobs_are_capped_zip_is_not(db_session, auth_client, monkeypatch, tmp_path):
+    from backend.api import print_jobs as print_jobs_api
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    monkeypatch.setattr(print_jobs_api, "PRINT_JOB_MAX_MERGED_ITEMS", 1)
+    ids = [_consultation(db_session, patient, f"Tratamiento {n}").id for n in range(2)]
+    try:
+        merged = auth_client.post("/api/consultas/print-jobs", json={"ids": ids, "format": "pdf"})
+        assert merged.status_code == 422
+        assert "zip" in merged.json()["detail"]
+
+        zipped = auth_client.post("/api/consultas/print-jobs", json={"ids": ids, "format": "zip"})
+        assert zipped.status_code == 202
+        assert auth_client.get(f"/api/consultas/print-jobs/{zipped.json()['id']}").json()["status"] == "done"
+    finally:
+        pool.shutdown()
+
+
+def test_each_prescription_is_its_own_render(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    consultations = [_consultation(db_session, patient, f"Receta {i}") for i in range(3)]
+    original = pool.render_prescription
+    calls = []
+
+    async def render_prescription(consultation, doctor_email, db):
+        calls.append(consultation.id)
+        if consultation.id == consultations[1].id:
+            raise RenderTimeout("Render exceeded 60s")
+        return await original(consultation, doctor_email, db)
+
+    monkeypatch.setattr(pool, "render_prescription", render_prescription)
+    try:
+        res = auth_client.post("/api/consultas/print-jobs", json={"ids": [c.id for c in consultations]})
+        job = auth_client.get(f"/api/consultas/print-jobs/{res.json()['id']}").json()
+    finally:
+        pool.shutdown()
+
+    # The single-render timeout applies per prescription and fails only that one
+    assert calls == [c.id for c in consultations]
+    assert job["status"] == "done"
+    assert job["failed_ids"] == [consultations[1].id]
+
+
+def test_job_state_and_output_are_shared_between_instances(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    monkeypatch.setattr(asset_cache_module, "asset_cache", AssetCache(
+        1024 * 1024, None, 600, bucket_factory=lambda name: LocalBucket(str(tmp_path / "storage"), name)
+    ))
+    consultation = _consultation(db_session, patient, "Compartida")
+    renderer = PrintJobStore(str(tmp_path / "instance_a"), bucket="bucket")
+    other = PrintJobStore(str(tmp_path / "instance_b"), bucket="bucket")
+    try:
+        job = renderer.create(patient.owner_id, [consultation.id], "pdf")
+        asyncio.run(renderer.run(job.id))
+    finally:
+        pool.shutdown()
+
+    # Another instance sees the finished job and serves the file from Storage
+    seen = other.get(job.id, patient.owner_id)
+    assert (seen.status, seen.done, seen.output_path) == ("done", 1, f"print-jobs/{job.id}.pdf")
+    assert "Compartida" in PdfReader(io.BytesIO(other.output(seen))).pages[0].extract_text()
+    assert list((tmp_path / "instance_a").iterdir()) == []
+
+    # Expiry is checked on status requests too, and removes the stored file
+    expiring = PrintJobStore(str(tmp_path / "instance_b"), ttl_seconds=0, bucket="bucket")
+    assert expiring.get(job.id, patient.owner_id) is None
+    assert not (tmp_path / "storage" / "bucket" / "print-jobs" / f"{job.id}.pdf").exists()
+
+
+def test_job_lost_with_its_instance_reads_as_failed(db_session, auth_client, monkeypatch, tmp_path):
+    pool, patient = _setup(db_session, auth_client, monkeypatch, tmp_path)
+    pool.shutdown()
+    store = PrintJobStore(str(tmp_path / "jobs"), stall_seconds=300)
+    job = store.create(patient.owner_id, [1], "pdf")
+    store._save(job, status="running")
+    assert store.get(job.id, patient.owner_id).status == "running"
+
+    monkeypatch.setattr(store, "stall_seconds", -1)
+    stalled = store.get(job.id, patient.owner_id)
+    assert (stalled.status, stalled.error) == ("failed", "Trabajo interrumpido")
+    assert auth_client.get(f"/api/consultas/print-jobs/{job.id}").json()["status"] == "failed"
+    assert auth_client.get(f"/api/consultas/print-jobs/{job.id}/download").status_code == 409
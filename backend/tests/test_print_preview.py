@@ -0,0 +1,128 @@
+import base64
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+
+from backend import models
+from backend.services import print_preview
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.tests.factories import seed_doctor
+
+
+def _fresh_cache(monkeypatch):
+    cache = PDFCache(8 * 1024 * 1024, None, 0)
+    monkeypatch.setattr(print_preview, "preview_cache", cache)
+    return cache
+
+
+def _png(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_preview_is_a_low_resolution_page(monkeypatch):
+    _fresh_cache(monkeypatch)
+    image = _png(print_preview.render_preview({"primary_color": "#ff0000", "header_text": "Lunes a viernes"}))
+
+    # A5 at 72 DPI
+    assert image.size == (420, 595)
+    # The primary color reaches the header rule
+    colors = {color for _, color in image.convert("RGB").getcolors(420 * 595)}
+    assert (255, 0, 0) in colors
+
+
+def test_preview_is_cached_per_preference_set(monkeypatch):
+    cache = _fresh_cache(monkeypatch)
+    first = print_preview.render_preview({"header_text": "A"})
+    again = print_preview.render_preview({"header_text": "A"})
+    other = print_preview.render_preview({"header_text": "B"})
+
+    assert first is again
+    assert other != first
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_large_logo_is_downscaled_once(monkeypatch):
+    _fresh_cache(monkeypatch)
+    scan = io.BytesIO()
+    Image.new("RGB", (3000, 800), (0, 128, 0)).save(scan, format="PNG")
+    fetches = []
+
+    def storage_asset(storage_value):
+        fetches.append(storage_value)
+        return SimpleNamespace(data=scan.getvalue(), generation="1", base64="")
+
+    decoded = []
+    original = print_preview.thumbnail_base64
+
+    def counting_thumbnail(data, box, dpi=print_preview.PREVIEW_DPI):
+        decoded.append(box)
+        return original(data, box, dpi)
+
+    monkeypatch.setattr(PDFService, "storage_asset", staticmethod(storage_asset))
+    monkeypatch.setattr(print_preview, "thumbnail_base64", counting_thumbnail)
+
+    print_preview.render_preview({"logo_path": "logos/clinic.png", "header_text": "A"})
+    print_preview.render_preview({"logo_path": "logos/clinic.png", "header_text": "B"})
+
+    assert decoded == ["logo"]
+    thumbnail = _png(base64.b64decode(counting_thumbnail(scan.getvalue(), "logo")))
+    assert thumbnail.width <= 160
+
+
+def test_preview_endpoint_applies_unsaved_edits_and_revalidates(db_session, auth_client, monkeypatch):
+    _fresh_cache(monkeypatch)
+    user = seed_doctor(db_session, "preview_doctor@example.com", print_primary_color="#1e3a8a")
+
+    auth_client.login(user)
+    saved = auth_client.get("/api/doctors/preferences/preview")
+    edited = auth_client.get("/api/doctors/preferences/preview", params={"primary_color": "#ff0000", "dpi": 36})
+    revalidated = auth_client.get("/api/doctors/preferences/preview", params={"primary_color": "#ff0000", "dpi": 36},
+                                  headers={"If-None-Match": edited.headers["etag"]})
+
+    assert saved.status_code == 200 and saved.headers["content-type"] == "image/png"
+    assert edited.headers["etag"] != saved.headers["etag"]
+    assert _png(edited.content).size == (210, 298)
+    assert revalidated.status_code == 304
+    # Preview only: the saved preference is untouched
+    assert user.print_primary_color == "#1e3a8a"
+
+
+def test_preview_never_reads_a_logo_path_from_the_query(db_session, auth_client, monkeypatch):
+    _fresh_cache(monkeypatch)
+    fetched = []
+    monkeypatch.setattr(PDFService, "storage_asset", staticmethod(lambda value: fetched.append(value)))
+    user = seed_doctor(db_session, "preview_owner@example.com", print_logo_path="print-logos/owner/logo")
+
+    res = auth_client.login(user).get("/api/doctors/preferences/preview",
+                                      params={"logo_path": "gs://other-bucket/print-logos/victim/logo"})
+
+    assert res.status_code == 200
+    assert "gs://other-bucket/print-logos/victim/logo" not in fetched
+    assert "print-logos/owner/logo" in fetched
+
+
+def test_preview_follows_the_active_prescription_map(db_session, auth_client, monkeypatch):
+    _fresh_cache(monkeypatch)
+    scan_color = (250, 240, 200)
+    scan = io.BytesIO()
+    Image.new("RGB", (420, 595), scan_color).save(scan, format="PNG")
+    monkeypatch.setattr(PDFService, "storage_asset", staticmethod(
+        lambda value: SimpleNamespace(data=scan.getvalue(), generation="1", base64="")
+    ))
+    user = seed_doctor(db_session, "preview_map@example.com")
+    auth_client.login(user)
+    recipe = auth_client.get("/api/doctors/preferences/preview")
+
+    pmap = models.PrescriptionMap(doctor_id=user.email, name="Talonario", canvas_width_mm=148.0,
+                                  canvas_height_mm=210.0, is_active=True, background_image_url="scans/talonario.png",
+                                  fields_config=[{"field_key": "patient_name", "x_mm": 20, "y_mm": 40}])
+    db_session.add(pmap)
+    db_session.commit()
+    mapped = auth_client.get("/api/doctors/preferences/preview")
+
+    # Prints would use the map's coordinates over the scanned stationery
+    assert _png(recipe.content).convert("RGB").getpixel((400, 300)) == (255, 255, 255)
+    assert _png(mapped.content).convert("RGB").getpixel((400, 300)) == scan_color
+    assert mapped.headers["etag"] != recipe.headers["etag"]
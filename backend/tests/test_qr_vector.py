@@ -0,0 +1,53 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+
+from reportlab.graphics import renderPDF
+from reportlab.pdfgen import canvas
+
+from backend.services import qr_service
+
+URL = "https://vitalinuage.web.app/v/0f9a6c1e-qr-vector-test"
+
+
+def _dark_modules(url):
+    return sum(sum(row) for row in qr_service._qr_matrix(url))
+
+
+def test_svg_covers_every_dark_module():
+    svg = qr_service.get_qr_svg(URL)
+    root = ET.fromstring(svg)
+    size = len(qr_service._qr_matrix(URL))
+
+    assert root.attrib["viewBox"] == f"0 0 {size} {size}"
+    path = root.find("{http://www.w3.org/2000/svg}path").attrib["d"]
+    assert sum(int(n) for n in re.findall(r"h(\d+)", path)) == _dark_modules(URL)
+
+
+def test_qr_outputs_are_cached_per_url():
+    qr_service._qr_matrix.cache_clear()
+    qr_service.get_qr_svg.cache_clear()
+
+    first = qr_service.get_qr_svg(URL)
+    assert qr_service.get_qr_svg(URL) is first
+    qr_service.get_qr_drawing(URL, 70.0)
+    assert qr_service._qr_matrix.cache_info().misses == 1
+
+    # PNG callers still get their own buffer
+    one, two = qr_service.generate_qr_image(URL), qr_service.generate_qr_image(URL)
+    one.read()
+    assert two.read(8) == b"\x89PNG\r\n\x1a\n"
+
+
+def test_reportlab_drawing_is_vector():
+    drawing = qr_service.get_qr_drawing(URL, 70.0)
+    assert (drawing.width, drawing.height) == (70.0, 70.0)
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(200, 200))
+    renderPDF.draw(drawing, c, 10, 10)
+    c.save()
+
+    pdf = buffer.getvalue()
+    assert pdf.startswith(b"%PDF")
+    assert b"/Subtype /Image" not in pdf
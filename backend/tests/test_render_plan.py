@@ -0,0 +1,80 @@
+import datetime
+
+from backend import models
+from backend.services import render_plan
+from backend.services.pdf_service import PDFService
+
+
+def _map(db_session, owner):
+    prescription_map = models.PrescriptionMap(
+        doctor_id=owner,
+        name="Talonario",
+        canvas_width_mm=148.0,
+        canvas_height_mm=210.0,
+        fields_config=[
+            {"field_key": "patient_name", "x_mm": 20, "y_mm": 30, "font_size_pt": 12},
+            {"field_key": "diagnosis", "x_mm": 20, "y_mm": 60},
+            {"field_key": "doctor_signature", "x_mm": 90, "y_mm": 180, "max_width_mm": 40, "max_height_mm": 15},
+        ],
+        is_active=True,
+    )
+    db_session.add(prescription_map)
+    db_session.commit()
+    return prescription_map
+
+
+def _consultation(db_session):
+    user = models.User(email="plan_doctor@example.com", hashed_password="pw", is_verified=True)
+    db_session.add(user)
+    db_session.commit()
+    patient = models.Patient(nombre="Plan", apellido_paterno="Compilado", dni="PLAN-1",
+                             fecha_nacimiento="1980-01-01", owner_id=user.email)
+    db_session.add(patient)
+    db_session.commit()
+    consultation = models.ClinicalConsultation(
+        patient_id=patient.id, owner_id=user.email,
+        motivo_consulta="Control", diagnostico="Rinitis", plan_tratamiento="Tx",
+    )
+    db_session.add(consultation)
+    db_session.commit()
+    return consultation
+
+
+def test_plan_precomputes_points_and_is_cached_by_version(db_session):
+    render_plan.clear_plans()
+    prescription_map = _map(db_session, "plan_doctor@example.com")
+
+    plan = render_plan.get_map_plan(prescription_map)
+    name, diagnosis, signature = plan.fields
+    assert name.x_pt == PDFService.mm_to_points(20)
+    assert name.y_pt == plan.height_pt - PDFService.mm_to_points(30)
+    assert (name.font_name, name.font_size) == ("Helvetica", 12)
+    assert diagnosis.font_size == 10
+    assert signature.kind == "signature"
+    assert signature.height_pt == PDFService.mm_to_points(15)
+
+    assert render_plan.get_map_plan(prescription_map) is plan
+
+    prescription_map.updated_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=5)
+    assert render_plan.get_map_plan(prescription_map) is not plan
+
+
+def test_coordinates_render_in_memory(db_session, tmp_path, monkeypatch):
+    consultation = _consultation(db_session)
+    prescription_map = _map(db_session, consultation.owner_id)
+
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("coordinate renders must not touch temp files")
+
+    monkeypatch.setattr("tempfile.NamedTemporaryFile", no_temp_files)
+    monkeypatch.setattr("reportlab.rl_config.pageCompression", 0)  # readable content streams
+
+    pdf_bytes = PDFService.generate_with_coordinates(consultation, prescription_map)
+    assert pdf_bytes.startswith(b"%PDF")
+    assert b"Plan Compilado" in pdf_bytes
+    assert b"Rinitis" in pdf_bytes
+
+    # output_path is still honoured for callers that want a file
+    target = tmp_path / "receta.pdf"
+    PDFService.generate_with_coordinates(consultation, prescription_map, str(target))
+    assert target.read_bytes().startswith(b"%PDF")
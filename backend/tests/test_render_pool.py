@@ -0,0 +1,209 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from backend.api import consultations as consultations_api
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services import render_pool as render_pool_module
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+from backend.services.render_pool import RenderPool, RenderTimeout
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_thread_pool_times_out_without_blocking_loop():
+    pool = RenderPool(mode="thread", max_workers=1, timeout=0.05)
+
+    async def scenario():
+        ticks = []
+
+        async def heartbeat():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        beat = asyncio.ensure_future(heartbeat())
+        with pytest.raises(RenderTimeout):
+            await pool.run(_slow, 0.3)
+        await beat
+        return ticks
+
+    ticks = asyncio.run(scenario())
+    assert len(ticks) == 5  # the loop kept serving while the render ran
+    assert pool.stats["timeouts"] == 1
+    pool.shutdown()
+
+
+def test_process_workers_are_recycled_after_max_tasks():
+    pool = RenderPool(mode="process", max_workers=1, timeout=60, max_tasks=1)
+
+    async def scenario():
+        return [await pool.run(os.getpid), await pool.run(os.getpid)]
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert first != os.getpid()
+    assert first != second
+    assert pool.stats["recycles"] == 2
+
+
+def test_timed_out_process_workers_are_terminated():
+    import multiprocessing
+
+    pool = RenderPool(mode="process", max_workers=1, timeout=10)
+
+    async def scenario():
+        await pool.run(os.getpid)
+        pool.timeout = 0.5
+        for _ in range(3):
+            with pytest.raises(RenderTimeout):
+                await pool.run(_slow, 30)
+        pool.timeout = 10  # leaves room for the replacement worker to spawn
+        return await pool.run(os.getpid)
+
+    try:
+        pid = asyncio.run(scenario())
+        deadline = time.monotonic() + 5
+        while len(multiprocessing.active_children()) > 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Only the replacement worker is alive: hung renders do not accumulate
+        assert [child.pid for child in multiprocessing.active_children()] == [pid]
+    finally:
+        pool.shutdown()
+    assert pool.stats["timeouts"] == 3
+
+
+def _consultation(db_session, email):
+    user = seed_doctor(db_session, email)
+    return user, seed_consultation(db_session, seed_patient(db_session, user, email))
+
+
+def test_pdf_endpoint_renders_through_pool(db_session, auth_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, str(tmp_path), 1024 * 1024))
+    monkeypatch.setattr(consultations_api, "render_pool", RenderPool(mode="thread", max_workers=1, timeout=10))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+    monkeypatch.setattr(
+        PDFService, "generate_from_html_file",
+        staticmethod(lambda consultation, **kwargs: b"%PDF-pool")
+    )
+
+    user, consultation = _consultation(db_session, "pool_doctor@example.com")
+
+    try:
+        res = auth_client.login(user).get(f"/api/consultas/{consultation.id}/pdf")
+    finally:
+        consultations_api.render_pool.shutdown()
+
+    assert res.status_code == 200, res.text
+    assert res.content == b"%PDF-pool"
+    assert res.headers["content-type"] == "application/pdf"
+
+
+def test_concurrent_renders_of_same_prescription_are_coalesced(db_session, auth_client, monkeypatch):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, None, 0))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+    renders = []
+
+    def slow_render(consultation, **kwargs):
+        renders.append(consultation.id)
+        time.sleep(0.2)
+        return b"%PDF-" + str(len(renders)).encode()
+
+    monkeypatch.setattr(PDFService, "generate_from_html_file", staticmethod(slow_render))
+    user, consultation = _consultation(db_session, "flight_doctor@example.com")
+    pool = RenderPool(mode="thread", max_workers=4, timeout=10)
+
+    async def scenario():
+        return await asyncio.gather(*[
+            pool.render_prescription(consultation, user.email, db_session) for _ in range(3)
+        ])
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert results == [b"%PDF-1"] * 3
+    assert renders == [consultation.id]
+    assert pool.stats["coalesced"] == 2
+    assert pool.stats["renders"] == 1
+
+    # Exposed for monitoring next to the other pool counters
+    monkeypatch.setattr(render_pool_module, "render_pool", pool)
+    metrics = auth_client.get("/api/health/render").json()["render_pool"]
+    assert (metrics["coalesced"], metrics["renders"], metrics["timeouts"], metrics["inflight"]) == (2, 1, 0, 0)
+
+
+def test_coalesced_callers_share_the_render_error(db_session, monkeypatch):
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", PDFCache(1024 * 1024, None, 0))
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    def broken_render(consultation, **kwargs):
+        time.sleep(0.1)
+        raise RuntimeError("template error")
+
+    monkeypatch.setattr(PDFService, "generate_from_html_file", staticmethod(broken_render))
+    user, consultation = _consultation(db_session, "flight_error@example.com")
+    pool = RenderPool(mode="thread", max_workers=2, timeout=10)
+
+    async def scenario():
+        return await asyncio.gather(*[
+            pool.render_prescription(consultation, user.email, db_session) for _ in range(2)
+        ], return_exceptions=True)
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert [str(result) for result in results] == ["template error", "template error"]
+    assert pool.stats["coalesced"] == 1
+    assert not pool._inflight
+
+
+def test_cache_key_lookups_run_off_the_event_loop(db_session, monkeypatch):
+    cache = PDFCache(1024 * 1024, None, 0)
+    cache.put("slow-key", b"%PDF-cached")
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", cache)
+
+    def slow_inputs(consultation, doctor_email, db):
+        time.sleep(0.2)  # DB queries and Storage metadata round trips
+        return None, None, "slow-key"
+
+    monkeypatch.setattr(PDFService, "prescription_render_inputs", staticmethod(slow_inputs))
+    user, consultation = _consultation(db_session, "offloop_doctor@example.com")
+    pool = RenderPool(mode="thread", max_workers=1, timeout=10)
+
+    async def scenario():
+        ticks = []
+
+        async def heartbeat():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        beat = asyncio.ensure_future(heartbeat())
+        result = await pool.render_prescription(consultation, user.email, db_session)
+        return result, ticks, beat.done()
+
+    try:
+        result, ticks, beat_done = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert result == b"%PDF-cached"
+    assert len(ticks) == 5 and beat_done
+    assert pool.stats["renders"] == 0
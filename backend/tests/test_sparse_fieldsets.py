@@ -0,0 +1,72 @@
+from sqlalchemy import event
+
+from backend.db_core import engine
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _seed(db_session):
+    user = seed_doctor(db_session, "fields_doctor@example.com")
+    patient = seed_patient(db_session, user, "FIELDS-001", nombre="Sara", apellido_paterno="Sparse",
+                           apellido_materno="Campos",
+                           observaciones="Texto largo que la tarjeta de busqueda no necesita")
+    seed_consultation(db_session, patient, diagnostico="Sano", plan_tratamiento="Nada",
+                      examen_fisico="Exploracion extensa")
+    return user, patient
+
+
+def test_patient_detail_projects_columns(db_session, auth_client):
+    user, patient = _seed(db_session)
+    patient_id = patient.id
+    db_session.refresh(user)  # keep loaded state once detached
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM patients" in statement:
+            statements.append(statement)
+
+    auth_client.login(user)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        # Force a fresh SELECT instead of the identity map
+        db_session.expunge_all()
+        res = auth_client.get(f"/api/patients/{patient_id}?fields=nombre,dni")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert res.status_code == 200
+    assert res.json() == {"id": patient_id, "nombre": "Sara", "dni": "FIELDS-001"}
+    assert "etag" in res.headers
+    assert statements and "observaciones" not in statements[-1]
+
+
+def test_unknown_field_is_rejected(db_session, auth_client):
+    user, patient = _seed(db_session)
+    auth_client.login(user)
+    res = auth_client.get(f"/api/patients/{patient.id}?fields=nombre,owner_password")
+
+    assert res.status_code == 400
+    assert "owner_password" in res.json()["detail"]
+
+
+def test_patient_list_sparse_items(db_session, auth_client):
+    user, _ = _seed(db_session)
+    auth_client.login(user)
+    res = auth_client.get("/api/patients?fields=full_name,id_number")
+
+    assert res.status_code == 200
+    body = res.json()
+    assert body["total"] == 1
+    assert body["data"] == [{"id": body["data"][0]["id"], "full_name": "Sara Sparse Campos", "id_number": "FIELDS-001"}]
+
+
+def test_consultations_sparse_and_full(db_session, auth_client):
+    user, patient = _seed(db_session)
+    auth_client.login(user)
+    sparse = auth_client.get(f"/api/patients/{patient.id}/consultations?fields=diagnostico,email_sent_at")
+    full = auth_client.get(f"/api/patients/{patient.id}/consultations")
+
+    assert sparse.status_code == 200
+    assert set(sparse.json()[0]) == {"id", "diagnostico", "email_sent_at"}
+    assert sparse.json()[0]["email_sent_at"] is None
+    assert full.status_code == 200
+    assert full.json()[0]["examen_fisico"] == "Exploracion extensa"
@@ -0,0 +1,127 @@
+import io
+
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+from backend import models
+from backend.services import pdf_cache as pdf_cache_module
+from backend.services import stationery
+from backend.services.pdf_cache import PDFCache
+from backend.services.pdf_service import PDFService
+
+
+builds = []
+
+
+def _letterhead(context):
+    # Stand-in for the WeasyPrint letterhead: one page with the doctor's name
+    builds.append(context["doctor"]["name"])
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(148 * stationery.MM_TO_PT, 210 * stationery.MM_TO_PT))
+    pdf.drawString(60, 560, f"MEMBRETE {context['doctor']['name']} {context.get('footer_text') or ''}")
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _text(pdf_bytes):
+    return PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text()
+
+
+def _context(**overrides):
+    context = {
+        "doctor": {"name": "Dr. Membrete", "specialty": "Medicina General"},
+        "patient": {"name": "Ana Rojas", "dni": "11.111.111-1", "age": 40},
+        "date": "01/02/2026",
+        "treatment": "Paracetamol 500 mg cada 8 horas",
+        "diagnosis": "Cefalea",
+        "primary_color": "#1e3a8a",
+        "secondary_color": "#64748b",
+        "footer_text": "Consulta Central",
+        "verification_url": "https://vitalinuage.web.app/v/abc",
+        "verification_display_url": "vitalinuage.web.app/v/abc",
+    }
+    context.update(overrides)
+    return context
+
+
+def _fresh_cache(monkeypatch):
+    builds.clear()
+    cache = PDFCache(memory_max_bytes=1024 * 1024, disk_dir=None, disk_max_bytes=0)
+    monkeypatch.setattr(pdf_cache_module, "pdf_cache", cache)
+    return cache
+
+
+def test_letterhead_is_built_once_and_overlaid(monkeypatch):
+    _fresh_cache(monkeypatch)
+
+    first = stationery.render_prescription(_context(), builder=_letterhead)
+    second = stationery.render_prescription(
+        _context(patient={"name": "Luis Soto", "dni": "22", "age": 7}), builder=_letterhead
+    )
+
+    assert builds == ["Dr. Membrete"]
+    text = _text(second)
+    assert "MEMBRETE Dr. Membrete" in text
+    assert "Luis Soto" in text and "Ana Rojas" not in text
+    assert "Cefalea" in _text(first)
+    assert len(PdfReader(io.BytesIO(first)).pages) == 1
+
+
+def test_preference_change_rebuilds_letterhead(monkeypatch):
+    _fresh_cache(monkeypatch)
+
+    stationery.render_prescription(_context(), builder=_letterhead)
+    stationery.render_prescription(_context(footer_text="Nueva sede"), builder=_letterhead)
+    stationery.render_prescription(_context(logo_base64="bG9nbw=="), builder=_letterhead)
+
+    assert len(builds) == 3
+
+
+def test_overflowing_treatment_falls_back(monkeypatch):
+    _fresh_cache(monkeypatch)
+    long_treatment = "\n".join(f"Indicacion {i}" for i in range(40))
+
+    assert stationery.render_prescription(_context(treatment=long_treatment), builder=_letterhead) is None
+    assert builds == []
+
+
+def test_prescription_render_uses_stationery_when_enabled(db_session, monkeypatch):
+    _fresh_cache(monkeypatch)
+    monkeypatch.setenv("PDF_STATIONERY_ENABLED", "1")
+    monkeypatch.setattr(stationery, "build_stationery", _letterhead)
+    monkeypatch.setattr(PDFService, "_fetch_signature_assets", staticmethod(lambda email, db, doctor=None: (None, None)))
+    monkeypatch.setattr(PDFService, "_fetch_logo_base64", staticmethod(lambda email, db, doctor=None: None))
+
+    html_renders = []
+    monkeypatch.setattr(
+        PDFService, "generate_from_html_file",
+        staticmethod(lambda consultation, **kwargs: html_renders.append(consultation.id) or b"%PDF-html")
+    )
+
+    user = models.User(email="stationery_doctor@example.com", hashed_password="pw", is_verified=True,
+                       print_footer_text="Av. Siempre Viva 742")
+    db_session.add(user)
+    db_session.commit()
+    patient = models.Patient(nombre="Marta", apellido_paterno="Paz", dni="ST-1",
+                             fecha_nacimiento="1990-05-05", owner_id=user.email)
+    db_session.add(patient)
+    db_session.commit()
+    short = models.ClinicalConsultation(patient_id=patient.id, owner_id=user.email,
+                                        motivo_consulta="Control", diagnostico="Dx", plan_tratamiento="Reposo")
+    long = models.ClinicalConsultation(patient_id=patient.id, owner_id=user.email,
+                                       motivo_consulta="Control", diagnostico="Dx",
+                                       plan_tratamiento="\n".join("Indicacion" for _ in range(60)))
+    db_session.add_all([short, long])
+    db_session.commit()
+
+    pdf_bytes = PDFService._render_prescription_pdf(short, user.email, user, None, db_session)
+    text = _text(pdf_bytes)
+    assert "Marta Paz" in text and "Reposo" in text
+    assert "Av. Siempre Viva 742" in text
+    verification = db_session.query(models.PrescriptionVerification).filter_by(consultation_id=short.id).one()
+    assert verification.uuid in text
+
+    assert PDFService._render_prescription_pdf(long, user.email, user, None, db_session) == b"%PDF-html"
+    assert html_renders == [long.id]
+    assert len(builds) == 1
@@ -0,0 +1,43 @@
+import os
+
+import jinja2
+import pytest
+
+from backend.services.template_registry import TemplateRegistry, template_registry
+
+
+def test_warm_compiles_pdf_email_and_builtin_templates():
+    registry = TemplateRegistry()
+    names = registry.names()
+
+    assert "pdf/recipe_template.html" in names
+    assert "email/prescription_email.html" in names
+    assert "builtin/modern.html" in names
+    assert registry.warm() == len(names)
+
+
+def test_templates_are_compiled_once():
+    first = template_registry.get("email/prescription_email.html")
+    second = template_registry.get("email/prescription_email.html")
+    assert first is second
+
+    html = first.render(patient_name="Ana", doctor_name="Dr. House", pdf_url="https://x/y.pdf", issue_date="01/01/2026")
+    assert "Ana" in html and "https://x/y.pdf" in html
+
+
+def test_auto_reload_picks_up_edits(tmp_path, monkeypatch):
+    (tmp_path / "note.html").write_text("v1 {{ value }}", encoding="utf-8")
+    monkeypatch.setattr("backend.services.template_registry.PDF_TEMPLATE_DIR", str(tmp_path))
+
+    registry = TemplateRegistry(auto_reload=True, bytecode_cache_dir=str(tmp_path / "bytecode"))
+    assert registry.render("pdf/note.html", value=1) == "v1 1"
+
+    (tmp_path / "note.html").write_text("v2 {{ value }}", encoding="utf-8")
+    os.utime(tmp_path / "note.html", (2_000_000_000, 2_000_000_000))
+    assert registry.render("pdf/note.html", value=1) == "v2 1"
+    assert list((tmp_path / "bytecode").iterdir())
+
+
+def test_missing_template_raises_not_found():
+    with pytest.raises(jinja2.TemplateNotFound):
+        template_registry.get("email/does_not_exist.html")
@@ -0,0 +1,64 @@
+import pytest
+
+from backend import repository
+from backend.tests.factories import seed_consultation, seed_doctor, seed_patient
+
+
+def _seed(db_session):
+    owner = seed_doctor(db_session, "repo_owner@example.com")
+    other = seed_doctor(db_session, "repo_other@example.com")
+    patient = seed_patient(db_session, owner, "REPO-001", nombre="Rita", apellido_paterno="Repo",
+                           fecha_nacimiento="1985-05-05")
+    return owner, other, patient
+
+
+def test_get_patient_enforces_owner(db_session):
+    owner, other, patient = _seed(db_session)
+
+    assert repository.get_patient(db_session, owner.email, patient.id).id == patient.id
+    with pytest.raises(repository.PatientNotFound) as exc:
+        repository.get_patient(db_session, other.email, patient.id)
+    assert exc.value.status_code == 404
+    assert exc.value.detail == "Patient not found"
+
+
+def test_list_patient_consultations_distinguishes_empty_from_foreign(db_session):
+    owner, other, patient = _seed(db_session)
+
+    assert repository.list_patient_consultations(db_session, owner.email, patient.id) == []
+    with pytest.raises(repository.PatientNotFound):
+        repository.list_patient_consultations(db_session, other.email, patient.id)
+
+    for reason in ("Primera", "Segunda"):
+        seed_consultation(db_session, patient, motivo_consulta=reason)
+
+    consultations = repository.list_patient_consultations(db_session, owner.email, patient.id)
+    assert len(consultations) == 2
+
+
+def test_patient_with_background_returns_none_when_missing(db_session):
+    owner, _, patient = _seed(db_session)
+
+    found, background = repository.get_patient_with_background(db_session, owner.email, patient.id)
+    assert found.id == patient.id
+    assert background is None
+
+
+def test_get_consultation_custom_detail(db_session):
+    owner, other, patient = _seed(db_session)
+    consultation = seed_consultation(db_session, patient)
+
+    found = repository.get_consultation(db_session, owner.email, consultation.id, with_patient=True)
+    assert found.patient.dni == "REPO-001"
+    with pytest.raises(repository.ConsultationNotFound) as exc:
+        repository.get_consultation(db_session, other.email, consultation.id, detail="Consulta no encontrada")
+    assert exc.value.detail == "Consulta no encontrada"
+
+
+def test_endpoint_returns_404_for_foreign_patient(db_session, auth_client):
+    _, other, patient = _seed(db_session)
+
+    res = auth_client.login(other).get(f"/api/patients/{patient.id}/consultations")
+
+    assert res.status_code == 404
+    assert res.json()["detail"] == "Patient not found"
@@ -0,0 +1,107 @@
+import datetime
+
+import pytest
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.exc import IntegrityError
+
+from backend import models, repository
+from backend.api.public import verify_prescription_publicly
+from backend.services import verification_compaction
+from backend.services.pdf_service import PDFService
+
+
+def _consultation(db_session, email="compaction_doctor@example.com"):
+    user = models.User(email=email, hashed_password="pw", is_verified=True, professional_name="Dr. Unico")
+    db_session.add(user)
+    db_session.commit()
+    patient = models.Patient(nombre="Ana", apellido_paterno="Rojas", dni=email,
+                             fecha_nacimiento="1980-01-01", owner_id=user.email)
+    db_session.add(patient)
+    db_session.commit()
+    consultation = models.ClinicalConsultation(
+        patient_id=patient.id, owner_id=user.email,
+        motivo_consulta="Control", diagnostico="Dx", plan_tratamiento="Tx",
+    )
+    db_session.add(consultation)
+    db_session.commit()
+    return consultation
+
+
+def _legacy_table_without_constraint(db_session):
+    # Databases created before the constraint: same columns, no unique consultation_id
+    table = models.PrescriptionVerification.__table__
+    legacy = Table(table.name, MetaData(), *[
+        Column(column.name, column.type, primary_key=column.primary_key) for column in table.columns
+    ])
+    bind = db_session.get_bind()
+    table.drop(bind)
+    legacy.create(bind)
+
+
+def _verification(db_session, consultation, uuid, scans, issued_day, email_sent=None):
+    verification = models.PrescriptionVerification(
+        uuid=uuid, consultation_id=consultation.id, doctor_email=consultation.owner_id,
+        doctor_name="Dr. Unico", issue_date=datetime.datetime(2026, 1, issued_day),
+        scanned_count=scans, email_sent_at=email_sent,
+    )
+    db_session.add(verification)
+    db_session.commit()
+    return verification
+
+
+def test_coordinate_renders_reuse_the_verification(db_session):
+    consultation = _consultation(db_session)
+    prescription_map = models.PrescriptionMap(
+        doctor_id=consultation.owner_id, name="Talonario",
+        canvas_width_mm=148.0, canvas_height_mm=210.0,
+        fields_config=[{"field_key": "qr_code", "x_mm": 10, "y_mm": 190, "max_width_mm": 20}],
+        is_active=True,
+    )
+    db_session.add(prescription_map)
+    db_session.commit()
+
+    for _ in range(3):
+        assert PDFService.generate_with_coordinates(consultation, prescription_map, db=db_session).startswith(b"%PDF")
+
+    assert db_session.query(models.PrescriptionVerification).count() == 1
+
+
+def test_unique_constraint_rejects_second_row(db_session):
+    consultation = _consultation(db_session)
+    _verification(db_session, consultation, "uuid-a", 0, 1)
+
+    with pytest.raises(IntegrityError):
+        _verification(db_session, consultation, "uuid-b", 0, 2)
+    db_session.rollback()
+
+    assert repository.get_or_create_verification(db_session, consultation.id, consultation.owner_id).uuid == "uuid-a"
+
+
+def test_compaction_merges_duplicates_and_keeps_scans(db_session):
+    _legacy_table_without_constraint(db_session)
+    consultation = _consultation(db_session)
+    other = _consultation(db_session, "compaction_other@example.com")
+    sent = datetime.datetime(2026, 1, 5, 10, 0)
+    _verification(db_session, consultation, "uuid-old", 2, 1)
+    _verification(db_session, consultation, "uuid-mid", 3, 2, email_sent=sent)
+    _verification(db_session, consultation, "uuid-new", 1, 3)
+    _verification(db_session, other, "uuid-single", 4, 1)
+
+    stats = verification_compaction.ensure_unique_constraint(db_session, batch_size=1)
+
+    assert stats == {"consultations": 1, "removed": 2}
+    kept = db_session.query(models.PrescriptionVerification).filter_by(consultation_id=consultation.id).one()
+    assert kept.uuid == "uuid-old"
+    assert kept.scanned_count == 6
+    assert kept.email_sent_at == sent
+    assert kept.issue_date == datetime.datetime(2026, 1, 1)
+
+    # Printed QR codes with a merged uuid still resolve, and count on the survivor
+    assert repository.find_verification(db_session, "uuid-new") is kept
+    assert verify_prescription_publicly("uuid-new", db_session).status == "valid"
+    assert kept.scanned_count == 7
+
+    with pytest.raises(IntegrityError):
+        _verification(db_session, consultation, "uuid-later", 0, 4)
+    db_session.rollback()
+    assert verification_compaction.compact_verifications(db_session) == {"consultations": 0, "removed": 0}
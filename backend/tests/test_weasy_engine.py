@@ -0,0 +1,57 @@
+import types
+
+from backend.services import weasy_engine
+
+
+def _fake_weasyprint(calls):
+    class FakeCSS:
+        def __init__(self, filename, font_config):
+            calls["css"].append((filename, font_config))
+
+    class FakeHTML:
+        def __init__(self, string, base_url=None):
+            self.string = string
+
+        def write_pdf(self, stylesheets, font_config):
+            calls["renders"].append((stylesheets, font_config))
+            return b"%PDF-fake"
+
+    class FakeFontConfiguration:
+        pass
+
+    module = types.SimpleNamespace(HTML=FakeHTML, CSS=FakeCSS)
+    return lambda: (module, FakeFontConfiguration)
+
+
+def test_configure_fontconfig_keeps_operator_overrides(monkeypatch):
+    monkeypatch.delenv("FONTCONFIG_FILE", raising=False)
+    monkeypatch.setenv("FONTCONFIG_PATH", "/etc/fonts")
+
+    weasy_engine.configure_fontconfig()
+
+    assert weasy_engine.os.environ["FONTCONFIG_FILE"] == weasy_engine.FONTS_CONF
+    assert weasy_engine.os.environ["FONTCONFIG_PATH"] == "/etc/fonts"
+
+
+def test_renders_share_one_font_configuration(monkeypatch):
+    calls = {"css": [], "renders": []}
+    monkeypatch.setattr(weasy_engine, "_load_weasyprint", _fake_weasyprint(calls))
+    monkeypatch.setattr(weasy_engine, "_font_config", None)
+    monkeypatch.setattr(weasy_engine, "_stylesheets", None)
+
+    assert weasy_engine.warm_up() is True
+    weasy_engine.write_pdf("<p>uno</p>")
+    weasy_engine.write_pdf("<p>dos</p>")
+
+    assert len(calls["css"]) == 1
+    assert calls["css"][0][0] == weasy_engine.FONTS_CSS
+    font_configs = {id(font_config) for _, font_config in calls["renders"]}
+    assert len(calls["renders"]) == 3 and len(font_configs) == 1
+
+
+def test_warm_up_is_skipped_without_weasyprint(monkeypatch):
+    def missing():
+        raise Exception("WeasyPrint module not found")
+
+    monkeypatch.setattr(weasy_engine, "_load_weasyprint", missing)
+    assert weasy_engine.warm_up() is False